@@ -0,0 +1,58 @@
+"""Times fit_custom_bc_baseline_block on a synthetic block of samples with
+1, 2, 4 and 8 worker processes.
+
+Run with: python benchmarks/bench_baseline_workers.py
+"""
+
+import os
+import time
+
+import numpy as np
+
+from chromatography_processing.custom_bc_baseline import (
+    fit_custom_bc_baseline_block,
+)
+
+N_SAMPLES = 400
+N_POINTS = 2000
+PARAMS = {
+    "crossover_index_number": 3,
+    "lam": 1e8,
+    "lam_flexible": 1e6,
+    "sampling": 15,
+}
+
+
+def make_block(n_samples: int = N_SAMPLES, n_points: int = N_POINTS):
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 16, n_points)
+    block = 1 + 0.05 * x + rng.normal(0, 1e-3, (n_samples, n_points))
+    for centre in np.linspace(2, 14, 6):
+        block += np.exp(-0.5 * ((x - centre) / 0.05) ** 2)
+    return x, block
+
+
+def main(worker_counts=(1, 2, 4, 8)):
+    x, block = make_block()
+    print("{} CPUs available".format(os.cpu_count()))
+    reference = serial_seconds = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        background = fit_custom_bc_baseline_block(
+            x, block, workers=workers, **PARAMS
+        )
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference, serial_seconds = background, seconds
+        # results must not depend on the number of workers
+        assert np.array_equal(background, reference)
+        print(
+            "{} worker(s): {:7.2f} s, speed-up {:4.1f}x".format(
+                workers, seconds, serial_seconds / seconds
+            )
+        )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Times fit_chromatograms_for_ion_type with the hplc-py and the native
+engine on synthetic anion runs with four skewed peaks and noise, and
+checks that both find the same peaks.
+
+Run with: python benchmarks/bench_fit_engines.py
+"""
+
+import contextlib
+import io
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from chromatography_processing.fit_chromatogram import skewnorm
+from chromatography_processing.fit_dataset import (
+    fit_chromatograms_for_ion_type,
+)
+
+N_SAMPLES = 20
+# fluoride, chloride, nitrate and sulfate like peaks
+PEAKS = [(1.0, 3.3, 0.06, 2.0), (3.0, 5.1, 0.08, 2.5)]
+PEAKS += [(2.0, 8.9, 0.12, 3.0), (4.0, 11.8, 0.15, 3.0)]
+WINDOWS = [(2.8, 4.2), (4.6, 6.4), (8.2, 10.2), (11.0, 13.5)]
+
+
+def make_dataset(n_samples: int = N_SAMPLES) -> xr.Dataset:
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 16, 2000)
+    signal = rng.normal(0, 1e-3, (1, n_samples, t.size))
+    for amplitude, loc, scale, alpha in PEAKS:
+        amplitudes = amplitude * rng.uniform(0.8, 1.2, n_samples)
+        locs = loc + rng.normal(0, 0.02, n_samples)
+        for i in range(n_samples):
+            signal[0, i] += skewnorm(t, amplitudes[i], locs[i], scale, alpha)
+    return xr.Dataset(
+        {"reduced_signal": (("ion_type", "measurement_time", "time"), signal)},
+        coords={
+            "ion_type": ["anion"],
+            "measurement_time": pd.date_range(
+                "2025-08-21", periods=n_samples, freq="20min"
+            ),
+            "time": t,
+            "ident": (
+                "measurement_time",
+                ["ian_pos{}".format(i) for i in range(n_samples)],
+            ),
+        },
+    )
+
+
+def time_engine(data: xr.Dataset, **kwargs) -> tuple:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fitted = fit_chromatograms_for_ion_type(data, "anion", **kwargs)
+    return time.perf_counter() - start, fitted
+
+
+def main():
+    data = make_dataset()
+    hplc_seconds, hplc = time_engine(
+        data, fit_kwargs={"verbose": False, "approx_peak_width": 0.5}
+    )
+    native_seconds, native = time_engine(
+        data, engine="native", windows=WINDOWS
+    )
+    for name, seconds, fitted in [
+        ("hplc", hplc_seconds, hplc),
+        ("native", native_seconds, native),
+    ]:
+        print(
+            "{:>6}: {:7.3f} s for {} samples, {} peaks".format(
+                name,
+                seconds,
+                data.sizes["measurement_time"],
+                fitted.sizes["peak"],
+            )
+        )
+    print("speed-up {:.0f}x".format(hplc_seconds / native_seconds))
+    if hplc.sizes["peak"] == native.sizes["peak"]:
+        for name in ["retention_time", "area"]:
+            difference = np.abs(native[name] - hplc[name]) / hplc[name]
+            print(
+                "largest relative {} difference: {:.1e}".format(
+                    name, float(difference.max())
+                )
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
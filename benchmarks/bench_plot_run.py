@@ -0,0 +1,80 @@
+"""Times plot_all_from_run for a synthetic run, drawing each trace as its
+own marker series (the default) and as one LineCollection per ion type
+(fast=True): at full resolution, decimated to the output width, with the
+two panels in separate processes, and as thumbnails.
+
+Run with: python benchmarks/bench_plot_run.py [output folder]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import xarray as xr  # noqa: E402
+
+from chromatography_processing.chromatogram_plotting import (  # noqa: E402
+    plot_all_from_run,
+)
+
+N_SAMPLES = 300
+N_POINTS = 9600
+
+
+def make_run(n_samples: int = N_SAMPLES, n_points: int = N_POINTS):
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 16, n_points)
+    signal = 1 + 0.02 * t + rng.normal(0, 1e-3, (2, n_samples, n_points))
+    for centre in np.linspace(2, 14, 6):
+        heights = rng.uniform(0.5, 1.5, (2, n_samples, 1))
+        signal += heights * np.exp(-0.5 * ((t - centre) / 0.05) ** 2)
+    return xr.Dataset(
+        {"signal": (("ion_type", "measurement_time", "time"), signal)},
+        coords={
+            "ion_type": ["anion", "cation"],
+            "measurement_time": pd.date_range(
+                "2025-08-21", periods=n_samples, freq="20min"
+            ),
+            "time": t,
+            "ident": (
+                "measurement_time",
+                ["ian_pos{}".format(i) for i in range(n_samples)],
+            ),
+        },
+    )
+
+
+def main(folder: Path):
+    data = make_run()
+    print("{} samples of {} points".format(N_SAMPLES, N_POINTS))
+    for name, kwargs in [
+        ("markers", {}),
+        ("fast, full", {"fast": True, "decimate": False}),
+        ("fast", {"fast": True}),
+        ("fast, 2 workers", {"fast": True, "workers": 2}),
+        ("thumbnail", {"thumbnail": True}),
+    ]:
+        start = time.perf_counter()
+        plot_all_from_run(
+            data, folder / name.replace(", ", "_").replace(" ", ""), **kwargs
+        )
+        print(
+            "{:>16}: {:6.2f} s per run".format(
+                name, time.perf_counter() - start
+            )
+        )
+    return
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(Path(sys.argv[1]))
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            main(Path(folder))
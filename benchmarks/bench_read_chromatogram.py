@@ -0,0 +1,58 @@
+"""Compares the single-pass Metrohm .txt parser in read_chromatogram with the
+previous pandas-based implementation.
+
+Run with: python benchmarks/bench_read_chromatogram.py
+"""
+
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from chromatography_processing.read_chromatogram import (
+    get_chromatogram_indices,
+    process_chromatogram_from_list_to_dataframe,
+    read_chromatogram,
+)
+from synthetic_metrohm import write_metrohm_txt
+
+
+def read_chromatogram_pandas(path_to_data: Path):
+    """The pandas-based reader that read_chromatogram replaced."""
+    data = pd.read_csv(path_to_data, encoding="unicode-escape")
+    data = data.iloc[:, 0]
+    ident = data.iloc[0]
+    meas_time = data.name.split(" UTC")[0]
+    meas_time = datetime.strptime(meas_time, "%Y-%m-%d %H:%M:%S")
+    pressure_indices = data[data.str.contains("Pressure")].index.tolist()
+    data = data[: pressure_indices[0]]
+    indices = get_chromatogram_indices(data, "Anion")
+    an = process_chromatogram_from_list_to_dataframe(
+        data.iloc[indices[0] : indices[1]]
+    )
+    indices = get_chromatogram_indices(data, "Cation")
+    cat = process_chromatogram_from_list_to_dataframe(
+        data.iloc[indices[0] : indices[1]]
+    )
+    return (an, cat), ident, meas_time, (True, True)
+
+
+def main(repeat: int = 20):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sample.txt"
+        write_metrohm_txt(path)
+        for name, func in (
+            ("pandas (previous)", read_chromatogram_pandas),
+            ("single pass", read_chromatogram),
+        ):
+            seconds = min(
+                timeit.repeat(lambda: func(path), number=1, repeat=repeat)
+            )
+            print("{:<20} {:8.2f} ms/file".format(name, 1e3 * seconds))
+    return
+
+
+if __name__ == "__main__":
+    main()
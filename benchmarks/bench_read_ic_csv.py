@@ -0,0 +1,51 @@
+"""Times reading a folder of synthetic IC result exports file by file with
+open_ic_file, as open_list_of_ic_files used to, against the bulk
+read_ic_csv_files.
+
+Run with: python benchmarks/bench_read_ic_csv.py
+"""
+
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from chromatography_processing.read_ic_csv_export_files import (
+    open_ic_file,
+    read_ic_csv_files,
+)
+from synthetic_metrohm import write_ic_csv_folder
+
+N_FILES = 2000
+
+
+def read_file_by_file(paths: list) -> pd.DataFrame:
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = [open_ic_file(path) for path in paths]
+    return pd.concat(data, axis="rows").sort_index()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_ic_csv_folder(Path(folder), N_FILES)
+        for name, read in [
+            ("file by file", read_file_by_file),
+            ("bulk, c", lambda p: read_ic_csv_files(p, engine="c")),
+            ("bulk", read_ic_csv_files),
+        ]:
+            start = time.perf_counter()
+            data = read(paths)
+            seconds = time.perf_counter() - start
+            print(
+                "{:>12}: {:6.3f} s for {} files ({} rows)".format(
+                    name, seconds, len(paths), len(data)
+                )
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compares the batched resampler with the previous xarray path, which
+outer-joined every sample with combine_by_coords, filled the gaps with
+interpolate_na and then called Dataset.interp onto the 2000-point grid.
+
+Run with: python benchmarks/bench_resample.py
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from chromatography_processing.resample import make_time_grid, resample_traces
+
+N_POINTS = 9595
+# instrument clocks give near-identical but not equal timestamps
+N_CLOCK_VARIANTS = 4
+# skip the previous path when its outer-joined array would exceed this
+LEGACY_MAX_BYTES = 2e9
+
+
+def make_traces(n_samples: int, n_points: int = N_POINTS) -> list:
+    rng = np.random.default_rng(0)
+    base = np.arange(n_points) / 600.0
+    traces = []
+    for i in range(n_samples):
+        t = base * (1 + 1e-13 * (i % N_CLOCK_VARIANTS))
+        y = 1.0 + 0.01 * t + rng.normal(0, 1e-3, n_points)
+        traces.append(np.column_stack([t, y]))
+    return traces
+
+
+def resample_previous(traces: list, n_grid: int = 2000) -> xr.Dataset:
+    """The combine_by_coords + interpolate_na + interp path."""
+    times = pd.date_range("2025-01-01", periods=len(traces), freq="20min")
+    data = []
+    for trace, mt in zip(traces, times):
+        d = pd.DataFrame(trace, columns=["time", "signal"])
+        d["measurement_time"] = mt
+        d = d.set_index(["measurement_time", "time"])
+        data.append(d.to_xarray())
+    data = xr.combine_by_coords(data, join="outer")
+    data["signal"] = data["signal"].interpolate_na("time", method="linear")
+    time_grid = np.linspace(
+        data.time.values.min(), data.time.values.max(), n_grid
+    )
+    return data.interp(time=time_grid)
+
+
+def resample_batched(traces: list, n_grid: int = 2000) -> np.ndarray:
+    time_grid = make_time_grid(
+        min(t[0, 0] for t in traces), max(t[-1, 0] for t in traces), n_grid
+    )
+    return resample_traces(traces, time_grid)
+
+
+def main(sizes=(100, 1000, 10000)):
+    for n_samples in sizes:
+        traces = make_traces(n_samples)
+        start = time.perf_counter()
+        resample_batched(traces)
+        batched = time.perf_counter() - start
+
+        union = N_POINTS * min(n_samples, N_CLOCK_VARIANTS)
+        if 8 * union * n_samples > LEGACY_MAX_BYTES:
+            previous = "skipped (outer join too large)"
+        else:
+            start = time.perf_counter()
+            resample_previous(traces)
+            previous = "{:8.2f} s".format(time.perf_counter() - start)
+        print(
+            "{:>6} samples: batched {:8.3f} s, previous {}".format(
+                n_samples, batched, previous
+            )
+        )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Fixtures for the pipeline benchmarks in this folder.
+
+The run sizes (number of samples) are read from the BENCHMARK_SIZES
+environment variable, e.g. BENCHMARK_SIZES=10,100,1000,10000. The default
+only covers the small sizes, as writing and processing the large synthetic
+runs takes several minutes.
+"""
+
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic_metrohm import write_metrohm_folder  # noqa: E402
+
+DEFAULT_SIZES = "10,100"
+ALL_SIZES = "10,100,1000,10000"
+
+
+def benchmark_sizes() -> list:
+    sizes = os.environ.get("BENCHMARK_SIZES", DEFAULT_SIZES)
+    if sizes == "all":
+        sizes = ALL_SIZES
+    return [int(size) for size in sizes.split(",")]
+
+
+def pytest_generate_tests(metafunc):
+    if "n_samples" in metafunc.fixturenames:
+        metafunc.parametrize("n_samples", benchmark_sizes())
+
+
+@pytest.fixture(scope="session")
+def run_folders(tmp_path_factory):
+    """Returns a function giving the folder of a synthetic run of
+    n_samples Metrohm exports, written the first time it is asked for."""
+    folders = {}
+
+    def run_folder(n_samples: int) -> Path:
+        if n_samples not in folders:
+            folder = tmp_path_factory.mktemp("run_{}".format(n_samples))
+            write_metrohm_folder(folder, n_samples)
+            folders[n_samples] = folder
+        return folders[n_samples]
+
+    return run_folder
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Returns a function that benchmarks func(*args, **kwargs) and records
+    its peak traced memory in MB in the benchmark's extra_info.
+
+    The memory is measured in a separate call under tracemalloc, so that
+    tracing does not slow down the timed rounds. Memory used by worker
+    processes is not included. Large runs are timed once, small ones a few
+    times.
+    """
+
+    def run(func, *args, rounds: int = 3, **kwargs):
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_mb"] = round(peak / 2**20, 1)
+        return benchmark.pedantic(
+            func, args=args, kwargs=kwargs, rounds=rounds, iterations=1
+        )
+
+    return run
@@ -0,0 +1,141 @@
+"""Writes synthetic Metrohm ion chromatography .txt exports for
+benchmarking."""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from scipy.special import erf
+
+
+def _section(title: str, units: str, time, values) -> list:
+    lines = [title, str(len(time)), units]
+    lines += ["{};{}".format(t, v) for t, v in zip(time, values)]
+    return lines + ["", ""]
+
+
+def peak_centres(t_max: float, n_peaks: int = 4) -> np.ndarray:
+    """Retention times of the synthetic peaks of an ion type."""
+    return np.linspace(0.2, 0.8, n_peaks) * t_max
+
+
+def peak_windows(
+    t_max: float = 16.0, n_peaks: int = 4, half_width: float = 0.4
+) -> list:
+    """Retention windows around the synthetic peaks, e.g. for the native
+    fitter."""
+    return [
+        (c - half_width, c + half_width) for c in peak_centres(t_max, n_peaks)
+    ]
+
+
+def _signal(rng, time, t_max, offset, n_peaks, drift, noise):
+    """A drifting, noisy baseline with skewed peaks of random height and
+    slightly jittered retention times."""
+    wander = np.sin(2 * np.pi * time / t_max + rng.uniform(0, 2 * np.pi))
+    signal = offset + drift * time + 0.05 * drift * t_max * wander
+    signal += rng.normal(0, noise, time.size)
+    for centre in peak_centres(t_max, n_peaks):
+        centre += rng.normal(0, 0.01)
+        z = (time - centre) / 0.05
+        height = rng.uniform(0.5, 2.0)
+        signal += height * np.exp(-0.5 * z**2) * (1 + erf(2 * z / np.sqrt(2)))
+    return signal
+
+
+def write_metrohm_txt(
+    path: Path,
+    ident: str = "ian_pos1",
+    measurement_time: datetime = datetime(2025, 8, 21, 17, 43, 14),
+    n_anion: int = 9595,
+    n_cation: int = 4798,
+    seed: int = 0,
+    n_peaks: int = 4,
+    drift: float = 0.01,
+    noise: float = 1e-4,
+):
+    """Writes one synthetic Metrohm .txt export with Anions, Cations and
+    pressure blocks. Set n_anion or n_cation to 0 to leave that ion out.
+
+    Each chromatogram has n_peaks skewed peaks (see peak_centres) on a
+    baseline drifting by drift per minute, with Gaussian noise."""
+    rng = np.random.default_rng(seed)
+    lines = [
+        measurement_time.strftime("%Y-%m-%d %H:%M:%S") + " UTC-4",
+        ident,
+        "6ab5c87f:198958cf6dc:-78e6",
+        "",
+    ]
+    for title, n, t_max, offset in (
+        ("Anions", n_anion, 16.0, 1.0),
+        ("Cations", n_cation, 8.0, -1416.9),
+    ):
+        if n == 0:
+            continue
+        time = np.linspace(0, t_max, n, endpoint=False)
+        signal = _signal(rng, time, t_max, offset, n_peaks, drift, noise)
+        lines += _section(title, "min;µS/cm", time, signal)
+    for title, n, t_max in (
+        ("Anions Pressure", n_anion // 5, 16.0),
+        ("Cations Pressure", n_cation // 5, 8.0),
+    ):
+        if n == 0:
+            continue
+        time = np.linspace(0, t_max, n)
+        lines += _section(title, "min;MPa", time, 8.0 + 0 * time)
+    Path(path).write_text("\r\n".join(lines), encoding="latin-1")
+    return
+
+
+def write_metrohm_folder(
+    folder: Path,
+    n_files: int,
+    start: datetime = datetime(2025, 8, 21),
+    **kwargs,
+) -> list:
+    """Writes n_files synthetic exports to folder, one every 20 minutes,
+    with idents ian_pos1, ian_pos2, ... kwargs are passed on to
+    write_metrohm_txt, e.g. n_anion and n_cation to set their size.
+    Returns the list of paths written."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        path = folder / "sample_{:05d}.txt".format(i)
+        write_metrohm_txt(
+            path,
+            ident="ian_pos{}".format(i + 1),
+            measurement_time=start + timedelta(minutes=20 * i),
+            seed=i,
+            **kwargs,
+        )
+        paths.append(path)
+    return paths
+
+
+IC_CSV_COLUMNS = [
+    "Ident",
+    "Sample type",
+    "Determination start",
+    "Fluoride",
+    "Chloride",
+    "Nitrate",
+    "Sulfate",
+]
+
+
+def write_ic_csv_folder(folder: Path, n_files: int) -> list:
+    """Writes n_files synthetic ;-delimited IC result exports to folder, one
+    determination per file. Returns the list of paths written."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n_files):
+        start = datetime(2025, 8, 21) + timedelta(minutes=20 * i)
+        values = ["{:.4f}".format(v) for v in rng.uniform(0, 50, 4)]
+        row = ["ian_pos{}".format(i % 60 + 1), "Sample", str(start)] + values
+        path = folder / "result_{:05d}.csv".format(i)
+        path.write_text(";".join(IC_CSV_COLUMNS) + "\n" + ";".join(row) + "\n")
+        paths.append(path)
+    return paths
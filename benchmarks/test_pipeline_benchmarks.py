@@ -0,0 +1,113 @@
+"""Times each stage of the processing pipeline on synthetic runs of
+increasing size, and records its peak memory.
+
+Run with: pytest benchmarks --benchmark-only
+and for all sizes: BENCHMARK_SIZES=all pytest benchmarks --benchmark-only
+
+Results can be saved with --benchmark-autosave and compared between
+commits with pytest-benchmark compare. See conftest.py for the sizes.
+"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import pytest  # noqa: E402
+
+from chromatography_processing.chromatogram_plotting import (  # noqa: E402
+    plot_all_from_run,
+)
+from chromatography_processing.custom_bc_baseline import (  # noqa: E402
+    fit_dataset_with_custom_bc_baseline,
+)
+from chromatography_processing.fit_dataset import (  # noqa: E402
+    fit_chromatograms_for_dataset,
+)
+from chromatography_processing.read_chromatogram import (  # noqa: E402
+    read_chromatogram,
+    read_chromatograms_in_folder_to_xarray,
+)
+from synthetic_metrohm import peak_windows  # noqa: E402
+
+TIME_RANGES = {"anion_time_range": (0.5, 15), "cation_time_range": (0.5, 7.5)}
+BASELINE_KWARGS = {"lam": 1e5, "lam_flexible": 1e4}
+WINDOWS = {"anion": peak_windows(16.0), "cation": peak_windows(8.0)}
+# hplc-py takes seconds per sample, so it is only timed on small runs
+MAX_HPLC_SAMPLES = 10
+
+
+def rounds(n_samples: int) -> int:
+    return 3 if n_samples <= 100 else 1
+
+
+@pytest.fixture(scope="session")
+def stages(run_folders):
+    """Returns a function giving the dataset of a run after a stage
+    ('read' or 'baseline'), computed once per run size."""
+    results = {}
+
+    def stage(n_samples: int, name: str):
+        if (n_samples, name) not in results:
+            if name == "read":
+                data = read_chromatograms_in_folder_to_xarray(
+                    run_folders(n_samples)
+                )
+            else:
+                data = fit_dataset_with_custom_bc_baseline(
+                    stage(n_samples, "read").copy(),
+                    **TIME_RANGES,
+                    **BASELINE_KWARGS,
+                )
+            results[n_samples, name] = data
+        return results[n_samples, name]
+
+    return stage
+
+
+def test_read_chromatogram(measure, run_folders):
+    path = sorted(run_folders(10).iterdir())[0]
+    measure(read_chromatogram, path, rounds=10)
+
+
+def test_read_folder(measure, run_folders, n_samples):
+    folder = run_folders(n_samples)
+    measure(
+        read_chromatograms_in_folder_to_xarray,
+        folder,
+        rounds=rounds(n_samples),
+    )
+
+
+def test_baseline(measure, stages, n_samples):
+    data = stages(n_samples, "read")
+    measure(
+        lambda: fit_dataset_with_custom_bc_baseline(
+            data.copy(), **TIME_RANGES, **BASELINE_KWARGS
+        ),
+        rounds=rounds(n_samples),
+    )
+
+
+@pytest.mark.parametrize("engine", ["native", "hplc"])
+def test_fit(measure, stages, n_samples, engine):
+    if engine == "hplc" and n_samples > MAX_HPLC_SAMPLES:
+        pytest.skip("hplc-py is too slow for this many samples")
+    data = stages(n_samples, "baseline")
+    measure(
+        fit_chromatograms_for_dataset,
+        data,
+        engine=engine,
+        windows=WINDOWS if engine == "native" else None,
+        rounds=rounds(n_samples) if engine == "native" else 1,
+    )
+
+
+def test_plot(measure, stages, n_samples, tmp_path):
+    data = stages(n_samples, "read")
+    measure(
+        plot_all_from_run,
+        data,
+        tmp_path / "run",
+        fast=True,
+        rounds=rounds(n_samples),
+    )
@@ -0,0 +1,72 @@
+"""Reading, baseline fitting, peak fitting and plotting ion chromatography
+data.
+
+The main functions are available from the package itself, e.g.
+chromatography_processing.read_chromatograms_in_folder_to_xarray (but
+read_chromatogram is the submodule of that name). They, and the
+submodules, are imported on first use, so that
+import chromatography_processing stays fast and only loads xarray,
+pybaselines, hplc-py or matplotlib once a feature needing them is used.
+"""
+
+import importlib
+
+# public name: submodule defining it
+_API = {
+    "read_chromatograms_in_folder_to_xarray": "read_chromatogram",
+    "append_new_chromatograms_to_xarray": "read_chromatogram",
+    "read_metrohm_ic_files_to_xarray": "read_metrohm_ic_txt_files",
+    "open_list_of_ic_files": "read_ic_csv_export_files",
+    "read_ic_csv_files": "read_ic_csv_export_files",
+    "ParsedFileCache": "cache",
+    "make_time_grid": "resample",
+    "fit_dataset_with_custom_bc_baseline": "custom_bc_baseline",
+    "sweep_custom_bc_baseline": "custom_bc_baseline",
+    "fit_chromatograms_for_dataset": "fit_dataset",
+    "fit_chromatograms_for_ion_type": "fit_dataset",
+    "make_chromatogram": "fit_dataset",
+    "peak_table_to_dataframe": "fit_dataset",
+    "fit_skewnorm_peaks": "fit_chromatogram",
+    "plot_all_from_run": "chromatogram_plotting",
+    "save_dataset": "storage",
+    "open_dataset": "storage",
+    "stage_files": "staging",
+    "run_pipeline": "pipeline",
+    "watch_folder": "pipeline",
+    "instrument": "instrumentation",
+}
+_SUBMODULES = {
+    "cache",
+    "chromatogram_plotting",
+    "cli",
+    "custom_bc_baseline",
+    "fit_chromatogram",
+    "fit_dataset",
+    "functions",
+    "instrumentation",
+    "parallel",
+    "pipeline",
+    "read_chromatogram",
+    "read_ic_csv_export_files",
+    "read_metrohm_ic_txt_files",
+    "resample",
+    "staging",
+    "storage",
+}
+
+__all__ = sorted(_API)
+
+
+def __getattr__(name: str):
+    if name in _API:
+        module = importlib.import_module("." + _API[name], __name__)
+        return getattr(module, name)
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_API) | _SUBMODULES)
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from chromatography_processing.parallel import map_over_files
+
+# bump when the layout of cached entries changes, to invalidate old entries
+CACHE_FORMAT_VERSION = 1
+
+
+class ParsedFileCache:
+    """An on-disk cache of parsed instrument files.
+
+    Each parsed file is stored as a compressed .npz in cache_dir, under a key
+    made from the file's resolved path, size and modification time (and
+    optionally a hash of its contents), so a file that changes is parsed
+    again. Entries are evicted least recently used first once the cache
+    grows past max_bytes; the modification time of an entry records when it
+    was last used.
+
+    Counters of hits, misses, evictions and time spent parsing misses are
+    kept in self.stats.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: float = 2e9,
+        hash_contents: bool = False,
+    ):
+        """
+        :param cache_dir: pathlib.Path.
+        Folder for the cache entries. Created if it does not exist.
+
+        :param max_bytes: float, default 2e9.
+        Size cap for all entries together.
+
+        :param hash_contents: bool, default False.
+        If True, also key entries on a hash of the file contents. Slower, but
+        catches files rewritten with the same size and modification time.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self._total_bytes = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "parse_seconds": 0.0,
+        }
+
+    def _entry_path(self, path: Path, kind: str) -> Path:
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = [
+            str(CACHE_FORMAT_VERSION),
+            kind,
+            str(path),
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+        ]
+        if self.hash_contents:
+            key.append(hashlib.sha1(path.read_bytes()).hexdigest())
+        name = hashlib.sha1("\n".join(key).encode()).hexdigest()
+        return self.cache_dir / (name + ".npz")
+
+    def get(self, path: Path, kind: str) -> dict:
+        """Returns the cached arrays for path, or None if there are none."""
+        try:
+            entry = self._entry_path(path, kind)
+            with np.load(entry) as npz:
+                arrays = dict(npz)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        os.utime(entry)  # mark as recently used
+        self.stats["hits"] += 1
+        return arrays
+
+    def put(self, path: Path, kind: str, arrays: dict):
+        """Stores a dict of arrays for path, evicting old entries if the
+        cache is full."""
+        entry = self._entry_path(path, kind)
+        partial = entry.with_suffix(".partial")
+        with open(partial, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(partial, entry)
+        if self._total_bytes is None:
+            self._total_bytes = self.size()
+        else:
+            self._total_bytes += entry.stat().st_size
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+        return
+
+    def size(self) -> int:
+        """Total size of the cache entries in bytes."""
+        return sum(e.stat().st_size for e in self.cache_dir.glob("*.npz"))
+
+    def evict(self):
+        """Removes least recently used entries until under max_bytes."""
+        entries = [(e, e.stat()) for e in self.cache_dir.glob("*.npz")]
+        total = sum(stat.st_size for _, stat in entries)
+        for entry, stat in sorted(entries, key=lambda e: e[1].st_mtime_ns):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+            self.stats["evictions"] += 1
+        self._total_bytes = total
+        return
+
+    def clear(self):
+        """Removes every entry."""
+        for entry in self.cache_dir.glob("*.npz"):
+            entry.unlink(missing_ok=True)
+        self._total_bytes = 0
+        return
+
+
+def read_files_with_cache(
+    read,
+    paths: list,
+    cache: ParsedFileCache,
+    kind: str,
+    encode,
+    decode,
+    workers: int = None,
+    stage: str = None,
+) -> (list, dict):
+    """Like parallel.map_over_files, but takes parsed files from cache where
+    possible and only calls read on new or changed files.
+
+    :param read: callable. Parses one file.
+    :param kind: str. Names the parser, so different parsers of the same
+    file do not share entries.
+    :param encode: callable. Turns the output of read into a dict of arrays.
+    :param decode: callable. Inverse of encode.
+    :param cache: ParsedFileCache, or None to parse every file.
+    :param stage: str. Passed on to map_over_files, to record each parsed
+    file if instrumentation is on.
+    """
+    if cache is None:
+        return map_over_files(read, paths, workers=workers, stage=stage)
+
+    paths = list(paths)
+    cached = {}
+    for path in paths:
+        arrays = cache.get(path, kind)
+        if arrays is not None:
+            cached[path] = decode(arrays)
+
+    start = time.perf_counter()
+    parsed, errors = map_over_files(
+        read,
+        [p for p in paths if p not in cached],
+        workers=workers,
+        stage=stage,
+    )
+    cache.stats["parse_seconds"] += time.perf_counter() - start
+    for path, result in parsed:
+        cache.put(path, kind, encode(result))
+        cached[path] = result
+
+    results = [(path, cached[path]) for path in paths if path in cached]
+    return results, errors
@@ -1,12 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
 import xarray as xr
-import matplotlib.pyplot as plt
+import numpy as np
 from pathlib import Path
 from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import LineCollection
 from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+
+from chromatography_processing import instrumentation
+
+THUMBNAIL_SIZE = (3, 2)
+THUMBNAIL_DPI = 50
 
 
 def plot_all_from_run(
-    data: xr.Dataset, save_plots_to: Path, show_flag: bool = False
+    data: xr.Dataset,
+    save_plots_to: Path,
+    show_flag: bool = False,
+    fast: bool = False,
+    verbose: bool = False,
+    dpi: int = 300,
+    workers: int = None,
+    decimate: bool = True,
+    thumbnail: bool = False,
 ):
     """
     data: xr.Dataset
@@ -18,42 +36,214 @@ def plot_all_from_run(
 
     show_flag: bool, default False.
     If True, show the plot in addition to saving it.
-    """
 
-    cmap = colormaps["viridis"]
-    # norm = Normalize(vmin=data.ident.shape)
-    norm = Normalize(vmin=0, vmax=data.measurement_time.shape[0])
+    fast: bool, default False.
+    If True, all traces of an ion type are drawn at once as one
+    LineCollection, coloured by sample number with a colorbar instead of a
+    legend, on a figure that does not go through pyplot (unless show_flag).
+    This is much faster for runs with many samples.
 
-    anion = data.sel(ion_type="anion")
-    cation = data.sel(ion_type="cation")
+    verbose: bool, default False.
+    If True, print each sample as it is plotted.
+
+    dpi: int, default 300.
+    Resolution of the saved images.
+
+    workers: int, default None.
+    With fast and more than 1, the anion and cation panels are rendered in
+    separate processes.
 
+    decimate: bool, default True.
+    Traces with more points than can be seen at the output width are
+    reduced with decimate_min_max to about 2 points per pixel before
+    drawing, keeping the peak extremes. Applies to every path, fast or not.
+
+    thumbnail: bool, default False.
+    If True, implies fast and saves small (THUMBNAIL_SIZE inches at
+    THUMBNAIL_DPI) decimated images without axes or colorbar, cheap enough
+    to re-render for every batch.
+    """
+    fast = fast or thumbnail
     parent_dir = save_plots_to.parent
     parent_dir.mkdir(parents=True, exist_ok=True)
     filename = save_plots_to.stem
-    anion_filename = filename + "_anion.png"
-    cation_filename = filename + "_cation.png"
+    anion_save_to = parent_dir / (filename + "_anion.png")
+    cation_save_to = parent_dir / (filename + "_cation.png")
+
+    anion = data.sel(ion_type="anion")
+    cation = data.sel(ion_type="cation")
+
+    if fast:
+        panels = [
+            (
+                ds.time.values,
+                ds.signal.transpose("measurement_time", "time").values,
+                save_to,
+                dpi,
+                show_flag,
+                decimate,
+                thumbnail,
+            )
+            for ds, save_to in [
+                (anion, anion_save_to),
+                (cation, cation_save_to),
+            ]
+        ]
+        n_samples = data.sizes["measurement_time"]
+        if workers is not None and workers > 1 and not show_flag:
+            with instrumentation.stage("plot", count=2 * n_samples):
+                with ProcessPoolExecutor(max_workers=min(workers, 2)) as pool:
+                    list(pool.map(_render_panel, *zip(*panels)))
+        else:
+            for panel in panels:
+                with instrumentation.stage(
+                    "plot", sample=panel[2].name, count=n_samples
+                ):
+                    _render_panel(*panel)
+        return
+
+    # pyplot picks a backend and is slow to import, so the fast path, which
+    # draws on bare Agg figures, does without it
+    import matplotlib.pyplot as plt
+
+    cmap = colormaps["viridis"]
+    # norm = Normalize(vmin=data.ident.shape)
+    norm = Normalize(vmin=0, vmax=data.measurement_time.shape[0])
 
-    def plot_anion_or_cation(ds, parent_dir, filename, show_flag):
+    def plot_anion_or_cation(ds, save_to, show_flag):
         fig, ax = plt.subplots()
+        # one bin per pixel of the axes, as in _render_panel
+        n_bins = int(ax.get_position().width * fig.get_figwidth() * dpi)
         for i in range(ds.ident.shape[0]):
-            print("i is {}".format(i))
             to_plot = ds.isel(measurement_time=i).dropna(dim="time", how="all")
-            print(to_plot)
-            ax.plot(
-                to_plot.time,
-                to_plot.signal,
-                ".",
-                label=str(i),
-                color=cmap(norm(i)),
-            )
-        plt.legend(ncol=3)
-        save_to = parent_dir / filename
-        plt.savefig(save_to, bbox_inches="tight", dpi=300)
+            if verbose:
+                print("i is {}".format(i))
+                print(to_plot)
+            with instrumentation.stage(
+                "plot_sample", sample=to_plot.ident.item()
+            ):
+                time, signal = to_plot.time.values, to_plot.signal.values
+                if decimate:
+                    time, signal = decimate_min_max(time, signal, n_bins)
+                    time, signal = time[0], signal[0]
+                ax.plot(
+                    time,
+                    signal,
+                    ".",
+                    label=str(i),
+                    color=cmap(norm(i)),
+                )
+        with instrumentation.stage("save_plot", sample=save_to.name):
+            ax.legend(ncol=3)
+            fig.savefig(save_to, bbox_inches="tight", dpi=dpi)
         if show_flag:
             plt.show()
+        plt.close(fig)
         return
 
-    plot_anion_or_cation(anion, parent_dir, anion_filename, show_flag)
-    plot_anion_or_cation(cation, parent_dir, cation_filename, show_flag)
+    plot_anion_or_cation(anion, anion_save_to, show_flag)
+    plot_anion_or_cation(cation, cation_save_to, show_flag)
+
+    return
+
+
+def _render_panel(
+    time: np.ndarray,
+    signal: np.ndarray,
+    save_to: Path,
+    dpi: int = 300,
+    show_flag: bool = False,
+    decimate: bool = True,
+    thumbnail: bool = False,
+):
+    """Draws every row of signal (n_samples, n_times) against time as one
+    LineCollection and saves it to save_to. NaN points are left as gaps."""
+    figsize = THUMBNAIL_SIZE if thumbnail else None
+    dpi = THUMBNAIL_DPI if thumbnail else dpi
+    if show_flag:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=figsize)
+    else:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
 
+    n_samples = signal.shape[0]
+    if decimate:
+        # one bin per pixel of the axes, which hold most of the width
+        n_bins = int(ax.get_position().width * fig.get_figwidth() * dpi)
+        segments = np.stack(decimate_min_max(time, signal, n_bins), axis=-1)
+    else:
+        segments = np.empty(signal.shape + (2,))
+        segments[..., 0] = time
+        segments[..., 1] = signal
+    norm = Normalize(vmin=0, vmax=n_samples)
+    lines = LineCollection(
+        segments, cmap=colormaps["viridis"], norm=norm, linewidths=0.5
+    )
+    lines.set_array(np.arange(n_samples))
+    ax.add_collection(lines, autolim=False)
+
+    finite = np.isfinite(signal)
+    if finite.any():
+        ax.set_xlim(time[finite.any(axis=0)][[0, -1]])
+        low, high = signal[finite].min(), signal[finite].max()
+        margin = 0.05 * (high - low) if high > low else 1
+        ax.set_ylim(low - margin, high + margin)
+    if thumbnail:
+        ax.set_axis_off()
+        fig.subplots_adjust(0, 0, 1, 1)
+        fig.savefig(save_to, dpi=dpi)
+    else:
+        fig.colorbar(ScalarMappable(norm, lines.cmap), ax=ax, label="sample")
+        fig.savefig(save_to, bbox_inches="tight", dpi=dpi)
+    if show_flag:
+        plt.show()
+        plt.close(fig)
     return
+
+
+def decimate_min_max(
+    time: np.ndarray, signal: np.ndarray, n_bins: int
+) -> (np.ndarray, np.ndarray):
+    """Reduces traces sharing a time axis to their lowest and highest point
+    in each of n_bins bins of consecutive points, in the order they occur,
+    so that a line through them reaches the same extremes as the full trace.
+
+    time: np.ndarray, shape (T,)
+
+    signal: np.ndarray, shape (n_samples, T)
+    NaN points are ignored; a bin with only NaN points gives NaN.
+
+    n_bins: int
+    Number of bins, e.g. the width of the plot in pixels.
+
+    Returns: (time, signal), both of shape (n_samples, 2 * n) where n is at
+    most n_bins, or of shape (n_samples, T) if T is not larger than
+    2 * n_bins.
+    """
+    signal = np.atleast_2d(signal)
+    n_samples, n_times = signal.shape
+    if n_times <= 2 * n_bins:
+        return np.broadcast_to(time, signal.shape), signal
+
+    # pad to whole bins, with NaN that is never picked over a number
+    per_bin = -(-n_times // n_bins)
+    n_bins = -(-n_times // per_bin)
+    padded = np.full((n_samples, n_bins * per_bin), np.nan)
+    padded[:, :n_times] = signal
+    padded_time = np.full(n_bins * per_bin, time[-1])
+    padded_time[:n_times] = time
+    bins = padded.reshape(n_samples, n_bins, per_bin)
+    missing = np.isnan(bins)
+    lowest = np.where(missing, np.inf, bins).argmin(axis=-1)
+    highest = np.where(missing, -np.inf, bins).argmax(axis=-1)
+
+    first = np.minimum(lowest, highest)
+    second = np.maximum(lowest, highest)
+    starts = np.arange(n_bins) * per_bin
+    index = np.stack([first + starts, second + starts], axis=-1)
+    index = index.reshape(n_samples, 2 * n_bins)
+    rows = np.arange(n_samples)[:, None]
+    return padded_time[index], padded[rows, index]
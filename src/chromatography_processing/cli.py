@@ -0,0 +1,146 @@
+"""Command line entry point for processing a folder of Metrohm .txt
+exports, once or continuously as new files land. See pipeline.run_pipeline.
+
+Example:
+
+    chromatography-processing data/ results/ --anion-range 0.5 15 \\
+        --cation-range 0.5 7.5 --engine native --windows windows.json \\
+        --workers 4 --watch
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+
+from chromatography_processing import instrumentation
+from chromatography_processing.pipeline import (
+    BATCH_FORMATS,
+    run_pipeline,
+    watch_folder,
+)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="chromatography-processing",
+        description="Read, baseline fit and peak fit Metrohm .txt exports, "
+        "appending the peak table and fit status to an output folder.",
+    )
+    parser.add_argument("folder", type=Path, help="folder of .txt exports")
+    parser.add_argument("output", type=Path, help="folder for the results")
+    parser.add_argument(
+        "--anion-range", type=float, nargs=2, required=True, metavar="MIN"
+    )
+    parser.add_argument(
+        "--cation-range", type=float, nargs=2, required=True, metavar="MIN"
+    )
+    parser.add_argument("--pattern", default="*.txt")
+    parser.add_argument("--n-time-points", type=int, default=2000)
+    parser.add_argument(
+        "--dtype", choices=["float32", "float64"], default="float32"
+    )
+    parser.add_argument("--lam", type=float, default=1e8)
+    parser.add_argument("--lam-flexible", type=float, default=1e8)
+    parser.add_argument("--crossover-index-number", type=int, default=160)
+    parser.add_argument("--sampling", type=int, default=15)
+    parser.add_argument("--engine", choices=["hplc", "native"], default="hplc")
+    parser.add_argument(
+        "--windows",
+        type=Path,
+        help="JSON file of retention windows by ion type, e.g. "
+        '{"anion": [[3.1, 3.6]], "cation": [[2.0, 2.4]]}; needed with '
+        "--engine native",
+    )
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--plot", action="store_true", help="save thumbnails of each batch"
+    )
+    parser.add_argument("--batch-format", choices=BATCH_FORMATS)
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep processing new files as they land",
+    )
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--settle-time", type=float, default=2.0)
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="with --watch, stop after this many seconds without new files",
+    )
+    parser.add_argument(
+        "--timings",
+        type=Path,
+        help="record the time and memory of every stage to this JSON file",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = _parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(name)s: %(message)s",
+    )
+    windows = None
+    if args.windows is not None:
+        windows = json.loads(args.windows.read_text())
+    if args.watch:
+        paths = watch_folder(
+            args.folder,
+            args.pattern,
+            poll_interval=args.poll_interval,
+            settle_time=args.settle_time,
+            idle_timeout=args.idle_timeout,
+        )
+    else:
+        paths = sorted(args.folder.glob(args.pattern))
+
+    if args.timings is not None:
+        recorder = instrumentation.enable()
+    try:
+        done, errors = run_pipeline(
+            paths,
+            args.output,
+            tuple(args.anion_range),
+            tuple(args.cation_range),
+            n_time_points=args.n_time_points,
+            dtype=args.dtype,
+            baseline_kwargs={
+                "lam": args.lam,
+                "lam_flexible": args.lam_flexible,
+                "crossover_index_number": args.crossover_index_number,
+                "sampling": args.sampling,
+            },
+            engine=args.engine,
+            windows=windows,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+            workers=args.workers,
+            plot=args.plot,
+            batch_format=args.batch_format,
+            return_errors=True,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if args.timings is not None:
+            instrumentation.disable()
+            recorder.to_json(args.timings)
+            logging.getLogger(__name__).info("\n%s", recorder.summary())
+    print(
+        "processed {} file(s), {} could not be processed".format(
+            len(done), len(errors)
+        )
+    )
+    return 1 if errors and not done else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
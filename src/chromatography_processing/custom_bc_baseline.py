@@ -1,8 +1,27 @@
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+import hashlib
+import inspect
+import itertools
+import os
+import warnings
+
 import pandas as pd
-from pybaselines import Baseline
 import numpy as np
 import xarray as xr
 
+from chromatography_processing import instrumentation
+from chromatography_processing.parallel import submit_surviving_crashes
+
+# maximum number of fitters and plans kept by _cached
+SOLVER_CACHE_SIZE = 64
+_solver_cache = OrderedDict()
+_solver_cache_stats = {"hits": 0, "misses": 0}
+# pybaselines versions (major.minor) whose Baseline.custom_bc the block
+# fitter was checked against; with other versions, blocks are fitted with
+# custom_bc itself
+CUSTOM_BC_VERSIONS = ("1.2",)
+
 
 def fit_dataset_with_custom_bc_baseline(
     data,
@@ -15,50 +34,632 @@ def fit_dataset_with_custom_bc_baseline(
     lam_flexible: float = 1e8,
     method: str = "arpls",
     sampling: int = 15,
+    workers: int = None,
+    executor: Executor = None,
 ):
+    """Fits a custom_bc baseline to every sample in data, and adds the
+    background and reduced_signal (signal minus background) variables.
 
-    results = []
-    for ion_type in data.ion_type.values:
-        # trim by time before fitting
-        if ion_type == "anion":
-            time_range = anion_time_range
-        elif ion_type == "cation":
-            time_range = cation_time_range
-        d = data.sel(ion_type=ion_type)
-        d = d.where(d.time >= time_range[0], drop=True)
-        d = d.where(d.time <= time_range[1], drop=True)
-
-        for i in range(d.ident.shape[0]):  # for sample in samples
-            # select this sample and drop nans
-            to_fit = d.isel(measurement_time=i).dropna(dim="time", how="all")
-
-            bck, params = find_custom_bc_baseline(
-                to_fit.to_dataframe(),
+    Every sample of an ion type shares the same time grid, so the baseline
+    setup is done once per ion type and the whole (measurement_time, time)
+    block is fitted with fit_custom_bc_baseline_block. Outside the time
+    range of an ion type, background is NaN.
+
+    data: xr.Dataset
+    As returned by read_chromatograms_in_folder_to_xarray.
+
+    anion_time_range, cation_time_range: tuple of float
+    (start, end) times to fit the baseline over, for each ion type.
+
+    workers: int, default None
+    Number of processes to spread the samples over. With executor, the
+    number of processes in it, which sets how many chunks the samples are
+    split into.
+
+    executor: concurrent.futures.Executor, default None
+    An existing process pool to use instead of starting one.
+
+    The remaining parameters are as for find_custom_bc_baseline.
+
+    If data[y] is a dask array, background is computed lazily, chunk by
+    chunk along measurement_time, with xr.apply_ufunc. The chunks are then
+    spread over dask's scheduler, and workers and executor are not used.
+    """
+    params = {
+        "crossover_index_number": crossover_index_number,
+        "lam": lam,
+        "lam_flexible": lam_flexible,
+        "method": method,
+        "sampling": sampling,
+    }
+    if data[y].chunks is not None:
+        return _fit_dataset_lazily(
+            data, anion_time_range, cation_time_range, x, y, params
+        )
+
+    if executor is None and workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return fit_dataset_with_custom_bc_baseline(
+                data,
+                anion_time_range,
+                cation_time_range,
                 x=x,
                 y=y,
+                workers=workers,
+                executor=executor,
+                **params,
+            )
+
+    signal = data[y].transpose("ion_type", "measurement_time", x)
+    # computed in float64 by fit_custom_bc_baseline_block, but stored with
+    # the dtype of the signal
+    background = np.full(signal.shape, np.nan, dtype=signal.dtype)
+    x_values = data[x].values
+
+    for i, ion_type in enumerate(signal.ion_type.values):
+        # trim by time before fitting
+        in_range = _in_time_range(
+            x_values, ion_type, anion_time_range, cation_time_range
+        )
+        with instrumentation.stage(
+            "baseline", count=signal.shape[1], ion_type=ion_type
+        ):
+            background[i][:, in_range] = fit_custom_bc_baseline_block(
+                x_values[in_range],
+                signal.values[i][:, in_range],
+                workers=workers,
+                executor=executor,
+                **params,
+            )
+
+    data["background"] = (signal.dims, background)
+    data["reduced_signal"] = data["signal"] - data["background"]
+
+    return data
+
+
+def _fit_dataset_lazily(
+    data: xr.Dataset,
+    anion_time_range,
+    cation_time_range,
+    x: str,
+    y: str,
+    params: dict,
+) -> xr.Dataset:
+    """fit_dataset_with_custom_bc_baseline for a dask backed signal."""
+    x_values = data[x].values
+    in_range = xr.DataArray(
+        [
+            _in_time_range(
+                x_values, ion_type, anion_time_range, cation_time_range
+            )
+            for ion_type in data.ion_type.values
+        ],
+        dims=("ion_type", x),
+    )
+    signal = data[y].transpose("ion_type", "measurement_time", x)
+    # every chunk needs whole samples
+    signal = signal.chunk({x: -1})
+    background = xr.apply_ufunc(
+        _fit_chunk_in_time_range,
+        signal,
+        in_range,
+        input_core_dims=[[x], [x]],
+        output_core_dims=[[x]],
+        kwargs={"x": x_values, "params": params},
+        dask="parallelized",
+        output_dtypes=[signal.dtype],
+    )
+    data["background"] = background.transpose(*signal.dims)
+    data["reduced_signal"] = data["signal"] - data["background"]
+    return data
+
+
+def _fit_chunk_in_time_range(
+    chunk: np.ndarray, in_range: np.ndarray, x: np.ndarray, params: dict
+) -> np.ndarray:
+    """Fits the samples (last axis) of one chunk, each over the points where
+    in_range (broadcast against chunk) is True. NaN elsewhere."""
+    rows = chunk.reshape(-1, chunk.shape[-1])
+    masks = np.broadcast_to(in_range, chunk.shape).reshape(rows.shape)
+    background = np.full(rows.shape, np.nan, dtype=chunk.dtype)
+    groups = {}
+    for row, mask in enumerate(masks):
+        groups.setdefault(mask.tobytes(), []).append(row)
+    for group in groups.values():
+        mask = masks[group[0]]
+        if mask.any():
+            background[np.ix_(group, mask)] = fit_custom_bc_baseline_block(
+                x[mask], rows[np.ix_(group, mask)], **params
+            )
+    return background.reshape(chunk.shape)
+
+
+def _in_time_range(
+    x_values: np.ndarray, ion_type: str, anion_time_range, cation_time_range
+) -> np.ndarray:
+    """Boolean mask of the x values inside the time range of ion_type."""
+    if ion_type == "anion":
+        time_range = anion_time_range
+    elif ion_type == "cation":
+        time_range = cation_time_range
+    else:
+        raise ValueError("Unknown ion_type {}".format(ion_type))
+    return (x_values >= time_range[0]) & (x_values <= time_range[1])
+
+
+def sweep_custom_bc_baseline(
+    data: xr.Dataset,
+    anion_time_range,
+    cation_time_range,
+    crossover_index_number=(160,),
+    lam=(1e8,),
+    lam_flexible=(1e8,),
+    sampling=(15,),
+    method: str = "arpls",
+    x: str = "time",
+    y: str = "signal",
+    keep_background: bool = True,
+    workers: int = None,
+    executor: Executor = None,
+) -> xr.Dataset:
+    """Fits custom_bc baselines for every combination of the given
+    parameter values, to help choose them.
+
+    The data are trimmed to each ion type's time range once, and the same
+    blocks are fitted for every combination. With workers or executor, the
+    (combination, ion type) fits run in a process pool.
+
+    data: xr.Dataset
+    As returned by read_chromatograms_in_folder_to_xarray.
+
+    anion_time_range, cation_time_range: tuple of float
+    (start, end) times to fit the baseline over, for each ion type.
+
+    crossover_index_number, lam, lam_flexible, sampling: sequence
+    Values to try for each parameter of find_custom_bc_baseline. A scalar
+    tries just that value.
+
+    keep_background: bool, default True
+    If False, only the scores are returned. The backgrounds of a large
+    sweep can take a lot of memory.
+
+    workers: int, default None
+    Number of processes to spread the fits over.
+
+    executor: concurrent.futures.Executor, default None
+    An existing process pool to use instead of starting one.
+
+    Returns:
+    sweep: xr.Dataset with one dimension per swept parameter, and
+    variables:
+
+    residual (parameters, ion_type, measurement_time): root mean square of
+    signal minus background over the fitted range. Small values mean the
+    baseline follows the signal closely; too small means it cuts into
+    peaks.
+
+    roughness (parameters, ion_type, measurement_time): root mean square of
+    the second difference of the background. Small values mean a stiffer
+    baseline.
+
+    background (parameters, ion_type, measurement_time, time): if
+    keep_background is True.
+    """
+    if executor is None and workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return sweep_custom_bc_baseline(
+                data,
+                anion_time_range,
+                cation_time_range,
                 crossover_index_number=crossover_index_number,
                 lam=lam,
                 lam_flexible=lam_flexible,
-                method=method,
                 sampling=sampling,
+                method=method,
+                x=x,
+                y=y,
+                keep_background=keep_background,
+                executor=executor,
             )
 
-            bck = pd.DataFrame(bck, columns=["bck"])
-            bck["ion_type"] = ion_type
-            bck["time"] = to_fit.time.values
-            bck["measurement_time"] = to_fit.measurement_time.values
-            bck["ident"] = to_fit.ident.values
-            # with pd.option_context('display.max_columns', None,):
-            #     print(bck)
-            bck = bck.set_index(["ion_type", "time", "measurement_time"])
-            bck = bck.to_xarray()
-            results.append(bck)
-
-    background = xr.combine_by_coords(results, join="outer")
-    data["background"] = background["bck"]
-    data["reduced_signal"] = data["signal"] - data["background"]
+    swept = {
+        "crossover_index_number": np.atleast_1d(crossover_index_number),
+        "lam": np.atleast_1d(lam),
+        "lam_flexible": np.atleast_1d(lam_flexible),
+        "sampling": np.atleast_1d(sampling),
+    }
+    combinations = list(itertools.product(*swept.values()))
 
-    return data
+    # prepare the trimmed blocks once
+    signal = data[y].transpose("ion_type", "measurement_time", x)
+    x_values = data[x].values
+    blocks = []
+    for ion_type in signal.ion_type.values:
+        in_range = _in_time_range(
+            x_values, ion_type, anion_time_range, cation_time_range
+        )
+        block = signal.sel(ion_type=ion_type).values[:, in_range]
+        blocks.append((in_range, block))
+
+    def fit(params, in_range, block):
+        args = (x_values[in_range], block, params)
+        if executor is None:
+            return _fit_custom_bc_rows(*args)
+        return executor.submit(_fit_custom_bc_rows, *args)
+
+    fits = [
+        [
+            fit(dict(zip(swept, values), method=method), *ion_block)
+            for ion_block in blocks
+        ]
+        for values in combinations
+    ]
+
+    scores_shape = (len(combinations),) + signal.shape[:2]
+    residual = np.empty(scores_shape)
+    roughness = np.empty(scores_shape)
+    background = None
+    if keep_background:
+        background = np.full(
+            (len(combinations),) + signal.shape, np.nan, dtype=signal.dtype
+        )
+    for c, ion_fits in enumerate(fits):
+        for i, ((in_range, block), bck) in enumerate(zip(blocks, ion_fits)):
+            if executor is not None:
+                bck = bck.result()
+            reduced = block - bck
+            residual[c, i] = np.sqrt(np.nanmean(reduced**2, axis=1))
+            curvature = np.diff(bck, n=2, axis=1)
+            roughness[c, i] = np.sqrt(np.nanmean(curvature**2, axis=1))
+            if keep_background:
+                background[c, i][:, in_range] = bck
+
+    swept_shape = tuple(len(v) for v in swept.values())
+    score_dims = tuple(swept) + signal.dims[:2]
+    variables = {
+        "residual": (
+            score_dims,
+            residual.reshape(swept_shape + scores_shape[1:]),
+        ),
+        "roughness": (
+            score_dims,
+            roughness.reshape(swept_shape + scores_shape[1:]),
+        ),
+    }
+    if keep_background:
+        variables["background"] = (
+            tuple(swept) + signal.dims,
+            background.reshape(swept_shape + signal.shape),
+        )
+    coords = dict(swept)
+    coords.update(
+        {
+            name: coord
+            for name, coord in signal.coords.items()
+            if keep_background or x not in coord.dims
+        }
+    )
+    return xr.Dataset(variables, coords=coords, attrs={"method": method})
+
+
+def _grid_key(x: np.ndarray) -> tuple:
+    x = np.ascontiguousarray(x, dtype=float)
+    return x.shape, hashlib.sha1(x.tobytes()).hexdigest()
+
+
+def _cached(key: tuple, make):
+    """Returns the cached value for key, calling make() on a miss. Least
+    recently used values are dropped beyond SOLVER_CACHE_SIZE."""
+    if key in _solver_cache:
+        _solver_cache.move_to_end(key)
+        _solver_cache_stats["hits"] += 1
+        return _solver_cache[key]
+    _solver_cache_stats["misses"] += 1
+    value = make()
+    _solver_cache[key] = value
+    while len(_solver_cache) > SOLVER_CACHE_SIZE:
+        _solver_cache.popitem(last=False)
+    return value
+
+
+def solver_cache_info() -> dict:
+    """Hits, misses and current size of the cache of baseline fitters and
+    plans shared by find_custom_bc_baseline and the block fitter."""
+    return {
+        "hits": _solver_cache_stats["hits"],
+        "misses": _solver_cache_stats["misses"],
+        "size": len(_solver_cache),
+        "max_size": SOLVER_CACHE_SIZE,
+    }
+
+
+def clear_solver_cache():
+    """Empties the solver cache and resets its counters."""
+    _solver_cache.clear()
+    _solver_cache_stats.update(hits=0, misses=0)
+    return
+
+
+def get_custom_bc_plan(x: np.ndarray, **params) -> dict:
+    """Returns prepare_custom_bc_baseline(x, **params), reusing the plan of
+    an earlier call on the same grid with the same parameters."""
+    key = ("custom_bc_plan",) + _grid_key(x) + tuple(sorted(params.items()))
+    return _cached(key, lambda: prepare_custom_bc_baseline(x, **params))
+
+
+def prepare_custom_bc_baseline(
+    x: np.ndarray,
+    crossover_index_number: int = 160,
+    lam: float = 1e8,
+    lam_flexible: float = 1e6,
+    method: str = "arpls",
+    sampling: int = 15,
+    diff_order: int = 2,
+) -> dict:
+    """Does the part of find_custom_bc_baseline that depends only on x and
+    the parameters, so that it can be shared by every sample on that grid.
+
+    Reproduces the steps of pybaselines' Baseline.custom_bc: the points
+    after the crossover index are averaged in bins of sampling points, the
+    baseline is fitted to the reduced points with method, interpolated back
+    onto x and smoothed with a Whittaker smoother of strength lam. This
+    follows custom_bc's internals, so it is only used with the pybaselines
+    versions in CUSTOM_BC_VERSIONS.
+
+    Returns: dict, the plan used by fit_custom_bc_baseline_block.
+    """
+    # pybaselines and scipy.linalg are slow to import, so only load them
+    # once a baseline is fitted
+    from pybaselines import Baseline
+
+    x = np.asarray(x, dtype=float)
+    size = x.size
+    crossover_index = int(np.argmin(abs(x - crossover_index_number)))
+
+    # bins, as in Baseline.custom_bc with regions=([crossover_index, None],)
+    start, stop = crossover_index, size
+    sections = max((stop - start) // sampling, 1)
+    edges = np.linspace(start, stop, sections + 1, dtype=np.intp)
+    lefts, rights = edges[:-1], edges[1:]
+    x_mask = np.ones(size, dtype=bool)
+    x_mask[start:stop] = False
+    # ensure first and last points are included to avoid edge effects
+    if not (lefts[0] == 0 and rights[0] == 1):
+        x_mask[0] = True
+    if not (rights[-1] == size and lefts[-1] == size - 1):
+        x_mask[-1] = True
+
+    widths = rights - lefts
+    x_bins = np.add.reduceat(x[:stop], lefts) / widths
+    x_fit = np.concatenate([x_bins, x[x_mask]])
+    sort_order = np.argsort(x_fit, kind="mergesort")
+
+    return {
+        "params": {
+            "crossover_index_number": crossover_index_number,
+            "lam": lam,
+            "lam_flexible": lam_flexible,
+            "method": method,
+            "sampling": sampling,
+            "diff_order": diff_order,
+        },
+        "x": x,
+        "x_fit": x_fit[sort_order],
+        "sort_order": sort_order,
+        "bin_lefts": lefts,
+        "bin_widths": widths,
+        "bin_stop": stop,
+        "x_mask": x_mask,
+        "method": method.lower(),
+        "method_kwargs": {"lam": lam_flexible},
+        "fitter": Baseline(x_data=x_fit[sort_order], assume_sorted=True),
+        "smoother": _whittaker_factor(size, lam, diff_order),
+    }
+
+
+def _whittaker_factor(size: int, lam: float, diff_order: int) -> np.ndarray:
+    """Banded Cholesky factor of I + lam * D.T @ D, in lower form for
+    cho_solve_banded. None if lam is None or 0, meaning no smoothing."""
+    if lam is None or lam == 0 or size <= diff_order:
+        return None
+    from pybaselines.utils import difference_matrix
+    from scipy.linalg import cholesky_banded
+
+    penalty = difference_matrix(size, diff_order)
+    lhs = (lam * (penalty.T @ penalty)).todia()
+    bands = np.zeros((diff_order + 1, size))
+    for k in range(diff_order + 1):
+        bands[k, : size - k] = lhs.diagonal(-k)
+    bands[0] += 1.0
+    return cholesky_banded(bands, lower=True)
+
+
+def fit_custom_bc_baseline_block(
+    x: np.ndarray,
+    block: np.ndarray,
+    plan: dict = None,
+    workers: int = None,
+    executor: Executor = None,
+    **kwargs,
+) -> np.ndarray:
+    """Fits a custom_bc baseline to every row of block.
+
+    x: np.ndarray, shape (N,)
+    The shared x values of the rows.
+
+    block: np.ndarray, shape (M, N)
+    One sample per row. Rows containing NaN are fitted on their finite
+    points only, with rows sharing the same missing points fitted together.
+
+    plan: dict, default None
+    From prepare_custom_bc_baseline(x, ...). If None, it is made from kwargs,
+    or taken from the solver cache.
+
+    workers: int, default None
+    If more than 1, the rows are split into chunks which are fitted in a
+    pool of this many processes. Only x, the rows and the parameters are
+    sent to the processes. The result is the same as fitting serially.
+
+    executor: concurrent.futures.Executor, default None
+    An existing pool to fit the chunks in, instead of starting one. Pass
+    its number of processes as workers; if None, os.cpu_count() is assumed.
+
+    kwargs:
+    Parameters of prepare_custom_bc_baseline, if plan is None.
+
+    With a pybaselines version not in CUSTOM_BC_VERSIONS, the rows are
+    fitted one by one with Baseline.custom_bc instead, with a warning.
+
+    Returns:
+    background: np.ndarray, shape (M, N), NaN where block is NaN.
+    """
+    block = np.atleast_2d(np.asarray(block, dtype=float))
+    params = kwargs if plan is None else plan["params"]
+    if executor is not None or (workers is not None and workers > 1):
+        return _fit_block_in_pool(x, block, params, workers, executor)
+    if not _block_fitter_supported():
+        return _fit_block_with_custom_bc(x, block, params)
+    if plan is None:
+        plan = get_custom_bc_plan(x, **kwargs)
+    finite = np.isfinite(block)
+    if finite.all():
+        return _fit_prepared_block(plan, block)
+
+    # group the rows with missing points by which points are missing
+    groups = {}
+    for row, mask in enumerate(finite):
+        if mask.any():
+            groups.setdefault(mask.tobytes(), []).append(row)
+    background = np.full(block.shape, np.nan)
+    for rows in groups.values():
+        mask = finite[rows[0]]
+        if mask.all():
+            group_plan = plan
+        else:
+            group_plan = get_custom_bc_plan(x[mask], **plan["params"])
+        background[np.ix_(rows, mask)] = _fit_prepared_block(
+            group_plan, block[np.ix_(rows, mask)]
+        )
+    return background
+
+
+def _block_fitter_supported() -> bool:
+    """Whether the installed pybaselines is one the block fitter reproduces
+    Baseline.custom_bc for. Warns if not."""
+    import pybaselines
+
+    version = ".".join(pybaselines.__version__.split(".")[:2])
+    if version in CUSTOM_BC_VERSIONS:
+        return True
+    warnings.warn(
+        "fitting baselines with Baseline.custom_bc one sample at a time, as "
+        "the block fitter has not been checked against pybaselines "
+        "{}".format(pybaselines.__version__)
+    )
+    return False
+
+
+def _fit_block_with_custom_bc(
+    x: np.ndarray, block: np.ndarray, params: dict
+) -> np.ndarray:
+    """fit_custom_bc_baseline_block with pybaselines' own custom_bc, one
+    row at a time."""
+    from pybaselines import Baseline
+
+    defaults = {
+        name: parameter.default
+        for name, parameter in inspect.signature(
+            prepare_custom_bc_baseline
+        ).parameters.items()
+        if parameter.default is not parameter.empty
+    }
+    params = dict(defaults, **params)
+    x = np.asarray(x, dtype=float)
+    background = np.full(block.shape, np.nan)
+    for row, y in enumerate(block):
+        mask = np.isfinite(y)
+        if not mask.any():
+            continue
+        x_row = x[mask]
+        fitter = _cached(
+            ("Baseline",) + _grid_key(x_row),
+            lambda: Baseline(x_data=x_row),
+        )
+        crossover_index = np.argmin(
+            abs(x_row - params["crossover_index_number"])
+        )
+        background[row, mask], _ = fitter.custom_bc(
+            y[mask],
+            params["method"],
+            regions=([crossover_index, None],),
+            sampling=params["sampling"],
+            method_kwargs={"lam": params["lam_flexible"]},
+            lam=params["lam"],
+            diff_order=params["diff_order"],
+        )
+    return background
+
+
+def _fit_custom_bc_rows(
+    x: np.ndarray, block: np.ndarray, params: dict
+) -> np.ndarray:
+    """Worker process entry point for _fit_block_in_pool."""
+    return fit_custom_bc_baseline_block(x, block, **params)
+
+
+def _fit_block_in_pool(
+    x: np.ndarray,
+    block: np.ndarray,
+    params: dict,
+    workers: int = None,
+    executor: Executor = None,
+) -> np.ndarray:
+    """Fits chunks of rows of block in a process pool, about four chunks per
+    worker, and puts the results back together in row order."""
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return _fit_block_in_pool(x, block, params, workers, executor)
+
+    n_workers = workers or os.cpu_count() or 1
+    n_chunks = min(block.shape[0], 4 * n_workers)
+    chunks = np.array_split(np.arange(block.shape[0]), max(n_chunks, 1))
+    # chunks lost when a pool shared with the peak fits breaks are fitted
+    # again in a restarted pool
+    results = submit_surviving_crashes(
+        _fit_custom_bc_rows,
+        [(x, block[rows], params) for rows in chunks],
+        executor,
+        workers,
+    )
+    background = np.empty(block.shape)
+    for rows, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            raise result
+        background[rows] = result
+    return background
+
+
+def _fit_prepared_block(plan: dict, block: np.ndarray) -> np.ndarray:
+    stop = plan["bin_stop"]
+    y_bins = np.add.reduceat(block[:, :stop], plan["bin_lefts"], axis=1)
+    y_bins /= plan["bin_widths"]
+    y_fit = np.concatenate([y_bins, block[:, plan["x_mask"]]], axis=1)
+    y_fit = y_fit[:, plan["sort_order"]]
+
+    fit = getattr(plan["fitter"], plan["method"])
+    background = np.empty(block.shape)
+    for row, y_row in enumerate(y_fit):
+        baseline_fit, _ = fit(y_row, **plan["method_kwargs"])
+        background[row] = np.interp(plan["x"], plan["x_fit"], baseline_fit)
+
+    if plan["smoother"] is not None:
+        from scipy.linalg import cho_solve_banded
+
+        background = cho_solve_banded(
+            (plan["smoother"], True), background.T, overwrite_b=True
+        ).T
+    return background
 
 
 def find_custom_bc_baseline(
@@ -102,11 +703,15 @@ def find_custom_bc_baseline(
     params: dict
     The params of the baseline
     """
+    from pybaselines import Baseline
+
     data = data.reset_index()
     x = data[x]
     y = data[y]
     crossover_index = np.argmin(abs(x - crossover_index_number))
-    baseline_fitter = Baseline(x_data=x)
+    baseline_fitter = _cached(
+        ("Baseline",) + _grid_key(x), lambda: Baseline(x_data=x)
+    )
 
     bck, params = baseline_fitter.custom_bc(
         y,
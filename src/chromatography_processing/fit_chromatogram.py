@@ -0,0 +1,152 @@
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.special import erf
+
+SQRT_2 = np.sqrt(2)
+SQRT_2PI = np.sqrt(2 * np.pi)
+MAX_SKEW = 20.0
+
+
+def skewnorm(t: np.ndarray, amplitude, loc, scale, alpha) -> np.ndarray:
+    """Skew-normal peak, with the same parametrisation as hplc-py: amplitude
+    is the area under the continuous peak, loc the retention time, scale its
+    width and alpha its skew."""
+    z = (t - loc) / scale
+    pdf = np.exp(-0.5 * z**2) / (SQRT_2PI * scale)
+    return amplitude * pdf * (1 + erf(alpha * z / SQRT_2))
+
+
+def _skewnorms_and_jacobian(t: np.ndarray, params: np.ndarray) -> tuple:
+    """Returns the sum of the skew-normal peaks in params (n_peaks, 4) at t,
+    and its jacobian with respect to the flattened params."""
+    amplitude, loc, scale, alpha = (p[:, None] for p in params.T)
+    z = (t - loc) / scale
+    phi = np.exp(-0.5 * z**2) / SQRT_2PI
+    phi_skew = np.exp(-0.5 * (alpha * z) ** 2) / SQRT_2PI
+    cdf_skew = 0.5 * (1 + erf(alpha * z / SQRT_2))
+
+    shape = 2 * phi * cdf_skew / scale
+    peaks = amplitude * shape
+    # derivative of the shape with respect to z
+    d_shape = 2 * phi * (alpha * phi_skew - z * cdf_skew) / scale
+
+    jac = np.empty((t.size, params.size))
+    jac[:, 0::4] = shape.T
+    jac[:, 1::4] = (-amplitude * d_shape / scale).T
+    jac[:, 2::4] = (-(peaks + amplitude * d_shape * z) / scale).T
+    jac[:, 3::4] = (amplitude * 2 * phi * phi_skew * z / scale).T
+    return peaks.sum(axis=0), jac
+
+
+def initial_guess(
+    time: np.ndarray, signal: np.ndarray, windows: list
+) -> np.ndarray:
+    """Guesses one symmetric peak per retention window, at the highest point
+    of the signal in the window."""
+    dt = np.median(np.diff(time))
+    params = []
+    for start, stop in windows:
+        in_window = (time >= start) & (time <= stop)
+        t, y = time[in_window], signal[in_window]
+        if t.size < 4:
+            raise ValueError(
+                "retention window ({}, {}) holds fewer than 4 points".format(
+                    start, stop
+                )
+            )
+        top = np.argmax(y)
+        height = max(y[top], 0)
+        half_width = max(np.count_nonzero(y > height / 2), 1) * dt / 2
+        scale = np.clip(half_width / 1.1774, dt, stop - start)
+        params.append([height * scale * SQRT_2PI, t[top], scale, 0.0])
+    return np.array(params)
+
+
+def _bounds(time: np.ndarray, windows: list) -> tuple:
+    dt = np.median(np.diff(time))
+    lower = [[0, start, dt / 2, -MAX_SKEW] for start, stop in windows]
+    upper = [[np.inf, stop, stop - start, MAX_SKEW] for start, stop in windows]
+    return np.array(lower), np.array(upper)
+
+
+def fit_skewnorm_peaks(
+    time: np.ndarray,
+    signal: np.ndarray,
+    windows: list,
+    initial_params: np.ndarray = None,
+    max_nfev: int = 200,
+    **least_squares_kwargs,
+) -> tuple:
+    """Fits one skew-normal peak per retention window, by least squares with
+    an analytic jacobian. All peaks are fitted together, on the points that
+    lie in any of the windows, so overlapping tails are accounted for.
+
+    :param time: np.ndarray, the time of each point.
+    :param signal: np.ndarray, the (baseline corrected) signal.
+    :param windows: list of (start, stop) retention time ranges, one per
+        peak.
+    :param initial_params: np.ndarray, default None. Starting parameters
+        (n_windows, 4) of [amplitude, loc, scale, alpha], e.g. the result for
+        the previous sample. Parameters outside the bounds of their window
+        are clipped. If None, they are guessed from the signal.
+    :param max_nfev: int, default 200. Maximum number of function
+        evaluations.
+    :param least_squares_kwargs: passed on to scipy.optimize.least_squares.
+    :return: (peaks, params). peaks is a dict of arrays like the peak table
+        in fit_dataset (retention_time, area, amplitude, scale, skew,
+        signal_maximum and peak_id), sorted by retention time. params is the
+        fitted (n_windows, 4) array, in the order of windows.
+    """
+    time = np.asarray(time, dtype=float)
+    signal = np.asarray(signal, dtype=float)
+    windows = [(float(start), float(stop)) for start, stop in windows]
+    if len(windows) == 0:
+        raise ValueError("at least one retention window is needed")
+    lower, upper = _bounds(time, windows)
+    if initial_params is None:
+        initial_params = initial_guess(time, signal, windows)
+    # keep the start strictly inside the bounds
+    margin = 1e-9 * (upper - lower).clip(max=1)
+    x0 = np.clip(initial_params, lower + margin, upper - margin)
+
+    in_windows = np.zeros(time.size, dtype=bool)
+    for start, stop in windows:
+        in_windows |= (time >= start) & (time <= stop)
+    t, y = time[in_windows], signal[in_windows]
+
+    def residuals(p):
+        return _skewnorms_and_jacobian(t, p.reshape(-1, 4))[0] - y
+
+    def jacobian(p):
+        return _skewnorms_and_jacobian(t, p.reshape(-1, 4))[1]
+
+    result = least_squares(
+        residuals,
+        x0.ravel(),
+        jac=jacobian,
+        bounds=(lower.ravel(), upper.ravel()),
+        max_nfev=max_nfev,
+        **least_squares_kwargs,
+    )
+    if result.status <= 0:
+        raise RuntimeError(result.message)
+    params = result.x.reshape(-1, 4)
+    return _peak_table(time, params), params
+
+
+def _peak_table(time: np.ndarray, params: np.ndarray) -> dict:
+    """Describes fitted peaks the way hplc-py does: the area is the sum of
+    the reconstructed peak over all points and signal_maximum its highest
+    point."""
+    order = np.argsort(params[:, 1], kind="stable")
+    params = params[order]
+    peaks = np.stack([skewnorm(time, *p) for p in params])
+    return {
+        "retention_time": params[:, 1],
+        "area": peaks.sum(axis=1),
+        "amplitude": params[:, 0],
+        "scale": params[:, 2],
+        "skew": params[:, 3],
+        "signal_maximum": peaks.max(axis=1),
+        "peak_id": np.arange(1, len(params) + 1),
+    }
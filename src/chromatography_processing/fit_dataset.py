@@ -1,5 +1,63 @@
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
 import xarray as xr
-from hplc.quant import Chromatogram
+
+from chromatography_processing import instrumentation
+from chromatography_processing.parallel import (
+    RestartableProcessPool,
+    call_with_timeout,
+    submit_surviving_crashes,
+)
+
+if TYPE_CHECKING:
+    from hplc.quant import Chromatogram
+
+ENGINES = ("hplc", "native")
+# samples fitted one after the other by the native engine, each fit
+# starting from the parameters of the previous sample
+NATIVE_CHAIN_LENGTH = 50
+
+logger = logging.getLogger(__name__)
+
+PEAK_VARIABLES = [
+    "retention_time",
+    "area",
+    "amplitude",
+    "scale",
+    "skew",
+    "signal_maximum",
+]
+
+
+def make_chromatogram(
+    data: xr.Dataset,
+    ion_type: str,
+    measurement_time,
+    y_variable: str = "reduced_signal",
+    x_variable: str = "time",
+) -> "Chromatogram":
+    """Builds the Chromatogram of a single sample on demand, rather than
+    storing one per sample in the dataset."""
+    sample = data.sel(ion_type=ion_type, measurement_time=measurement_time)
+    return _chromatogram_from_sample(sample, y_variable, x_variable)
+
+
+def _chromatogram_from_sample(
+    sample: xr.Dataset, y_variable: str, x_variable: str
+) -> "Chromatogram":
+    # hplc-py takes seconds to import, so it is only loaded when needed
+    from hplc.quant import Chromatogram
+
+    sample = sample[y_variable].dropna(dim="time", how="all")
+    df = pd.DataFrame(
+        {x_variable: sample[x_variable].values, y_variable: sample.values}
+    )
+    return Chromatogram(df, cols={"time": x_variable, "signal": y_variable})
 
 
 def make_chromatograms_for_ion_type(
@@ -8,6 +66,11 @@ def make_chromatograms_for_ion_type(
     y_variable="reduced_signal",
     x_variable="time",
 ) -> xr.Dataset:
+    """Stores a Chromatogram per sample in an object variable. Such a
+    variable cannot be saved to netCDF/Zarr and holds a copy of every
+    signal, so prefer make_chromatogram for samples you need."""
+    from hplc.quant import Chromatogram
+
     data = data.sel(ion_type=ion_type)
     chromatogram_list = []
 
@@ -37,47 +100,400 @@ def make_chromatograms_for_ion_type(
 def fit_chromatograms_for_ion_type(
     data: xr.Dataset,
     ion_type: str,
+    y_variable: str = "reduced_signal",
+    x_variable: str = "time",
+    fit_kwargs: dict = None,
+    retry_kwargs: dict = None,
+    timeout: float = None,
+    workers: int = None,
+    executor: Executor = None,
+    engine: str = "hplc",
+    windows: list = None,
 ) -> xr.Dataset:
     """Fit whole dataset worth of chromatograms.
 
-    NOTE: This is very likely to crash unless your data is sparkly clean. It is
-    recommended to get rid of any samples that have odd features before passing
-    your dataset to this function.
+    Each sample is fitted on its own, so a sample that fails does not stop
+    the others. Its fit_status is set to 'error' (or 'timeout'), with the
+    exception message in fit_error, and it has no rows in the peak table.
+    Samples whose fit raised can be fitted again with relaxed settings by
+    passing retry_kwargs.
+
+    With engine='hplc', every sample goes through hplc-py's
+    Chromatogram.fit_peaks. With engine='native', one skew-normal peak is
+    fitted in each of the given retention windows (see
+    fit_chromatogram.fit_skewnorm_peaks), starting from the parameters of
+    the previous sample. That is much faster for routine runs where the
+    peaks are known.
+
+    If y_variable is a dask array, the samples are fitted one
+    measurement_time chunk at a time, so only one chunk is computed and
+    held in memory at once.
+
+    NOTE: hplc-py struggles with samples that have odd features. It is still
+    recommended to get rid of such samples before passing your dataset to
+    this function.
+
+    :param data: xr.Dataset, with a y_variable to fit.
+    :param ion_type: str, 'anion' or 'cation'.
+    :param fit_kwargs: dict, default None. Keyword arguments for
+        Chromatogram.fit_peaks, or for fit_skewnorm_peaks with
+        engine='native'.
+    :param retry_kwargs: dict, default None. If given, failed samples are
+        fitted once more, with fit_kwargs updated with these.
+    :param timeout: float, default None. Seconds allowed per sample fit.
+        Only enforced on Unix, for fits in worker processes or in the main
+        thread.
+    :param workers: int, default None. Number of processes to fit samples
+        in. None fits them serially.
+    :param executor: concurrent.futures.Executor, default None. An existing
+        process pool to use instead of starting one. If a worker process
+        dies, only the sample that killed it is marked as an error; the
+        others are fitted in a restarted pool (see
+        parallel.submit_surviving_crashes).
+    :param engine: str, default 'hplc'. 'hplc' or 'native'.
+    :param windows: list of (start, stop) retention time ranges, one per
+        peak. Required with engine='native'.
+    :return: data for ion_type, with fit_status and fit_error variables
+        along measurement_time, and a peak table along a peak dimension:
+        retention_time, area, amplitude, scale, skew and signal_maximum,
+        with coordinates peak_ion_type, peak_measurement_time, peak_ident
+        and peak_id. Use make_chromatogram to get the Chromatogram of a
+        sample and peak_table_to_dataframe to get the table as a DataFrame.
     """
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}".format(ENGINES))
+    if engine == "native" and not windows:
+        raise ValueError("engine='native' needs retention windows")
+    if executor is None and workers is not None and workers > 1:
+        # one pool for all chunks of samples
+        with RestartableProcessPool(workers) as executor:
+            return fit_chromatograms_for_ion_type(
+                data,
+                ion_type,
+                y_variable,
+                x_variable,
+                fit_kwargs,
+                retry_kwargs,
+                timeout,
+                workers=workers,
+                executor=executor,
+                engine=engine,
+                windows=windows,
+            )
     data = data.sel(ion_type=ion_type)
-    fitting_results_list = []
+    fit_kwargs = {} if fit_kwargs is None else fit_kwargs
+    if engine == "native":
+        fit_kwargs = dict(fit_kwargs, windows=windows)
 
-    for mt in data.coords["measurement_time"]:
-        sample = data.sel(measurement_time=mt)
-        print(sample.ident)
-        chrom = unpack_chromatogram_of_single_sample(sample)
-        fitting_results = chrom.fit_peaks()
-        fitting_results_list.append(fitting_results)
-    print(fitting_results_list)
-    fitting_results_DataArray = xr.DataArray(
-        fitting_results_list,
-        coords={
-            "measurement_time": data.measurement_time.values,
-            "ion_type": ion_type,
-        },
-        dims=["measurement_time"],
+    # a dask backed signal is fitted one chunk of samples at a time, so only
+    # that chunk is in memory
+    signal = data[y_variable].transpose("measurement_time", x_variable)
+    x_values = data[x_variable].values
+    outcomes = []
+    with instrumentation.stage(
+        "fit", count=signal.shape[0], ion_type=ion_type, engine=engine
+    ):
+        for start, stop in _sample_blocks(signal):
+            samples = []
+            for row in signal[start:stop].values:
+                finite = np.isfinite(row)
+                # signals may be stored as float32; fit in float64
+                samples.append(
+                    (x_values[finite], row[finite].astype(np.float64))
+                )
+            outcomes.extend(
+                _fit_and_retry(
+                    samples,
+                    fit_kwargs,
+                    retry_kwargs,
+                    timeout,
+                    workers,
+                    executor,
+                    engine,
+                )
+            )
+
+    for ident, (status, _, _, measurement) in zip(data.ident.values, outcomes):
+        logger.info("%s: %s", ident, status)
+        if measurement is not None:
+            instrumentation.record(
+                "fit_sample",
+                ident,
+                measurement,
+                ion_type=ion_type,
+                status=status,
+            )
+
+    dims = ["measurement_time"]
+    coords = {
+        "measurement_time": data.measurement_time.values,
+        "ion_type": ion_type,
+    }
+    data = data.drop_dims("peak", errors="ignore")
+    data["fit_status"] = xr.DataArray(
+        [o[0] for o in outcomes], coords=coords, dims=dims
     )
+    data["fit_error"] = xr.DataArray(
+        [o[2] for o in outcomes], coords=coords, dims=dims
+    )
+    return data.merge(_make_peak_table(data, [o[1] for o in outcomes]))
+
+
+def _sample_blocks(signal: xr.DataArray) -> list:
+    """(start, stop) ranges of the samples in each measurement_time chunk
+    of signal, or of all samples if it is not chunked."""
+    if signal.chunks is None:
+        return [(0, signal.sizes["measurement_time"])]
+    stops = np.cumsum(signal.chunksizes["measurement_time"])
+    return list(zip(np.r_[0, stops[:-1]], stops))
 
-    data["fitting_results"] = fitting_results_DataArray
-    return data
 
+def _fit_and_retry(
+    samples: list,
+    fit_kwargs: dict,
+    retry_kwargs: dict,
+    timeout: float,
+    workers: int,
+    executor: Executor,
+    engine: str,
+) -> list:
+    outcomes = _fit_samples(
+        samples, fit_kwargs, timeout, workers, executor, engine
+    )
+    if retry_kwargs is not None:
+        failed = [i for i, o in enumerate(outcomes) if o[0] != "ok"]
+        retried = _fit_samples(
+            [samples[i] for i in failed],
+            dict(fit_kwargs, **retry_kwargs),
+            timeout,
+            workers,
+            executor,
+            engine,
+        )
+        for i, (status, peaks, error, measurement) in zip(failed, retried):
+            if status == "ok":
+                status = "ok_after_retry"
+            first = outcomes[i][3]
+            if first is not None and measurement is not None:
+                measurement = first + measurement
+            outcomes[i] = (status, peaks, error, measurement)
+    return outcomes
+
+
+def _make_peak_table(data: xr.Dataset, peaks: list) -> xr.Dataset:
+    """Flattens the per sample fitted peaks of one ion type into variables
+    along a peak dimension. Samples without peaks (e.g. failed fits) simply
+    have no rows."""
+    fitted = [(i, p) for i, p in enumerate(peaks) if p is not None]
+    sample = np.concatenate(
+        [np.full(len(p["peak_id"]), i) for i, p in fitted] + [[]]
+    ).astype(int)
+
+    def column(name, dtype):
+        return np.concatenate([p[name] for _, p in fitted] + [[]]).astype(
+            dtype
+        )
+
+    coords = {
+        "peak_ion_type": (
+            "peak",
+            np.full(sample.size, data.ion_type.item()),
+        ),
+        "peak_measurement_time": (
+            "peak",
+            data.measurement_time.values[sample],
+        ),
+        "peak_ident": ("peak", data.ident.values[sample]),
+        "peak_id": ("peak", column("peak_id", int)),
+    }
+    variables = {
+        name: ("peak", column(name, float)) for name in PEAK_VARIABLES
+    }
+    return xr.Dataset(variables, coords=coords)
+
+
+def _split_peak_table(data: xr.Dataset) -> tuple:
+    """Returns (data without the peak table, the peak table), or (data,
+    None) if data has no peak table."""
+    if "peak" not in data.dims:
+        return data, None
+    others = [dim for dim in data.dims if dim != "peak"]
+    peaks = data.drop_dims(others)
+    scalars = [c for c in peaks.coords if "peak" not in peaks[c].dims]
+    return data.drop_dims("peak"), peaks.drop_vars(scalars)
+
+
+def peak_table_to_dataframe(data: xr.Dataset) -> pd.DataFrame:
+    """Returns the peak table of a fitted dataset as a DataFrame, one row per
+    peak, e.g. to write it to Parquet."""
+    columns = {
+        "ion_type": data.peak_ion_type.values,
+        "measurement_time": data.peak_measurement_time.values,
+        "ident": data.peak_ident.values,
+        "peak_id": data.peak_id.values,
+    }
+    columns.update({name: data[name].values for name in PEAK_VARIABLES})
+    return pd.DataFrame(columns)
+
+
+def _fit_peaks(time, signal, fit_kwargs: dict) -> dict:
+    from hplc.quant import Chromatogram
+
+    chrom = Chromatogram(pd.DataFrame({"time": time, "signal": signal}))
+    peaks = chrom.fit_peaks(**fit_kwargs)
+    return {c: peaks[c].to_numpy() for c in PEAK_VARIABLES + ["peak_id"]}
+
+
+def _fit_sample(time, signal, fit_kwargs: dict, timeout: float) -> tuple:
+    """Fits one sample, returning (status, peaks, error message,
+    measurement) rather than raising. Runs in worker processes."""
+    with instrumentation.Measurement() as measurement:
+        try:
+            peaks = call_with_timeout(
+                timeout, _fit_peaks, time, signal, fit_kwargs
+            )
+            outcome = "ok", peaks, ""
+        except TimeoutError as e:
+            outcome = "timeout", None, str(e)
+        except Exception as e:
+            outcome = "error", None, "{}: {}".format(type(e).__name__, e)
+    return outcome + (measurement,)
 
-def fit_chromatograms_for_dataset(ds: xr.Dataset) -> xr.Dataset:
+
+def _fit_samples(
+    samples: list,
+    fit_kwargs: dict,
+    timeout: float = None,
+    workers: int = None,
+    executor: Executor = None,
+    engine: str = "hplc",
+) -> list:
+    """Fits (time, signal) samples, in a process pool if workers or executor
+    is given. Returns a (status, peaks, error message, measurement) tuple
+    per sample, in order; measurement is an instrumentation.Measurement of
+    the fit, or None if it was lost with its worker."""
+    if len(samples) == 0:
+        return []
+    if engine == "native":
+        fit_chain = _fit_native_chain
+        chain_length = NATIVE_CHAIN_LENGTH
+    else:
+        fit_chain = _fit_hplc_chain
+        chain_length = 1
+    if executor is None:
+        if workers is None or workers <= 1:
+            return fit_chain(samples, fit_kwargs, timeout)
+        with RestartableProcessPool(workers) as executor:
+            return _fit_samples(
+                samples, fit_kwargs, timeout, workers, executor, engine
+            )
+
+    chains = [
+        samples[i : i + chain_length]
+        for i in range(0, len(samples), chain_length)
+    ]
+    results = submit_surviving_crashes(
+        fit_chain,
+        [(chain, fit_kwargs, timeout) for chain in chains],
+        executor,
+        workers,
+    )
+    outcomes = []
+    for chain, result in zip(chains, results):
+        if isinstance(result, BrokenProcessPool):  # killed its worker
+            error = "BrokenProcessPool: {}".format(result)
+            outcomes.extend([("error", None, error, None)] * len(chain))
+        else:
+            outcomes.extend(result)
+    return outcomes
+
+
+def _fit_hplc_chain(samples: list, fit_kwargs: dict, timeout: float) -> list:
+    return [_fit_sample(t, y, fit_kwargs, timeout) for t, y in samples]
+
+
+def _fit_native_chain(samples: list, fit_kwargs: dict, timeout: float) -> list:
+    """Fits samples one after the other with the native engine, starting
+    each fit from the last successful one. Runs in worker processes."""
+    from chromatography_processing.fit_chromatogram import (
+        fit_skewnorm_peaks,
+    )
+
+    outcomes = []
+    params = None
+    for time, signal in samples:
+        with instrumentation.Measurement() as measurement:
+            try:
+                peaks, fitted = call_with_timeout(
+                    timeout,
+                    fit_skewnorm_peaks,
+                    time,
+                    signal,
+                    initial_params=params,
+                    **fit_kwargs,
+                )
+                params = fitted
+                outcome = "ok", peaks, ""
+            except TimeoutError as e:
+                outcome = "timeout", None, str(e)
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                outcome = "error", None, error
+        outcomes.append(outcome + (measurement,))
+    return outcomes
+
+
+def fit_chromatograms_for_dataset(
+    ds: xr.Dataset,
+    fit_kwargs: dict = None,
+    retry_kwargs: dict = None,
+    timeout: float = None,
+    workers: int = None,
+    executor: Executor = None,
+    engine: str = "hplc",
+    windows: dict = None,
+) -> xr.Dataset:
+    """Fits the chromatograms of both ion types. See
+    fit_chromatograms_for_ion_type for the parameters; windows is a dict
+    of retention windows by ion type, e.g. {'anion': [(3.1, 3.6)], ...}."""
     if isinstance(ds, xr.Dataset):
         pass
     else:
         raise TypeError("ds must be an xr.Dataset object")
 
-    anions = fit_chromatograms_for_ion_type(ds, ion_type="anion")
-    cations = fit_chromatograms_for_ion_type(ds, ion_type="cation")
+    if executor is None and workers is not None and workers > 1:
+        with RestartableProcessPool(workers) as executor:
+            return fit_chromatograms_for_dataset(
+                ds,
+                fit_kwargs,
+                retry_kwargs,
+                timeout,
+                workers=workers,
+                executor=executor,
+                engine=engine,
+                windows=windows,
+            )
+
+    kwargs = {
+        "fit_kwargs": fit_kwargs,
+        "retry_kwargs": retry_kwargs,
+        "timeout": timeout,
+        "workers": workers,
+        "executor": executor,
+        "engine": engine,
+    }
+    windows = {} if windows is None else windows
+    anions = fit_chromatograms_for_ion_type(
+        ds, ion_type="anion", windows=windows.get("anion"), **kwargs
+    )
+    cations = fit_chromatograms_for_ion_type(
+        ds, ion_type="cation", windows=windows.get("cation"), **kwargs
+    )
 
+    anions, anion_peaks = _split_peak_table(anions)
+    cations, cation_peaks = _split_peak_table(cations)
     ds = xr.concat([anions, cations], dim="ion_type")
-    return ds
+    return ds.merge(xr.concat([anion_peaks, cation_peaks], dim="peak"))
 
 
 def make_chromatograms_for_dataset(ds: xr.Dataset) -> xr.Dataset:
@@ -86,6 +502,8 @@ def make_chromatograms_for_dataset(ds: xr.Dataset) -> xr.Dataset:
     else:
         raise TypeError("ds must be an xr.Dataset object")
 
+    # the peak table has no ion_type dimension, keep it out of the concat
+    ds, peaks = _split_peak_table(ds)
     anions = make_chromatograms_for_ion_type(
         ds, ion_type="anion", y_variable="reduced_signal"
     )
@@ -94,15 +512,21 @@ def make_chromatograms_for_dataset(ds: xr.Dataset) -> xr.Dataset:
     )
 
     ds = xr.concat([anions, cations], dim="ion_type")
-    return ds
+    return ds if peaks is None else ds.merge(peaks)
 
 
-def unpack_chromatogram_of_single_sample(sample: xr.Dataset) -> Chromatogram:
+def unpack_chromatogram_of_single_sample(
+    sample: xr.Dataset,
+) -> "Chromatogram":
     """Given a dataset where you have selected the sample and ion type already,
     returns a Chromatogram object.
 
-    Essentially a helper function to avoid having to unpack.
+    Essentially a helper function to avoid having to unpack. If the dataset
+    has no stored chromatogram variable, the Chromatogram is built from
+    reduced_signal instead.
     """
+    if "chromatogram" not in sample:
+        return _chromatogram_from_sample(sample, "reduced_signal", "time")
     ch = sample[
         "chromatogram"
     ]  # get the chromatogram object, without the other variables
@@ -0,0 +1,290 @@
+"""Recording how long each stage of the pipeline, and each sample in it,
+takes, and how much memory the process uses.
+
+Nothing is recorded unless a Recorder is active, so the instrumented
+functions cost next to nothing by default:
+
+    with instrument() as recorder:
+        data = read_chromatograms_in_folder_to_xarray(folder)
+        data = fit_dataset_with_custom_bc_baseline(data, ...)
+    print(recorder.summary())
+    recorder.to_json("timings.json")
+
+Each record holds the stage, the sample (a file or an ident, or None for a
+whole stage), the wall and CPU time in seconds, a count (e.g. of samples),
+the peak resident memory of the process in MB at the end of the stage, and
+any extra fields such as a fit status. Work done in worker processes is
+measured there and recorded when its result comes back, so its CPU time and
+peak memory are those of the worker.
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_recorder = None
+
+
+def peak_rss_mb() -> float:
+    """The peak resident memory of this process so far in MB, or None where
+    it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class Measurement:
+    """Context manager measuring the wall and CPU time of its block, and
+    the peak resident memory at its end. Cheap enough to use whether or not
+    anything is recorded, and picklable, so workers can return it."""
+
+    __slots__ = ("wall_s", "cpu_s", "peak_rss_mb", "_wall", "_cpu")
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+        self.peak_rss_mb = peak_rss_mb()
+        return False
+
+    def __add__(self, other):
+        """The combined time of two measurements, e.g. of a fit and its
+        retry, with the higher peak memory."""
+        total = Measurement()
+        total.wall_s = self.wall_s + other.wall_s
+        total.cpu_s = self.cpu_s + other.cpu_s
+        peaks = [m.peak_rss_mb for m in (self, other) if m.peak_rss_mb]
+        total.peak_rss_mb = max(peaks) if peaks else None
+        return total
+
+    def __getstate__(self):
+        return self.wall_s, self.cpu_s, self.peak_rss_mb
+
+    def __setstate__(self, state):
+        self.wall_s, self.cpu_s, self.peak_rss_mb = state
+
+
+class Recorder:
+    """Collects the records of an instrumented run.
+
+    :param logger: logging.Logger, default None. If given, every record is
+        also logged to it as it is made, e.g. to send them to a file or
+        monitoring handler.
+    :param level: int, default logging.INFO. Level of those log messages.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level=logging.INFO):
+        self.records = []
+        self.logger = logger
+        self.level = level
+
+    def add(
+        self,
+        stage: str,
+        sample=None,
+        measurement: Measurement = None,
+        count: int = 1,
+        **info,
+    ):
+        """Adds a record of stage (and sample) from a finished
+        Measurement."""
+        record = {
+            "stage": stage,
+            "sample": None if sample is None else str(sample),
+            "wall_s": measurement.wall_s,
+            "cpu_s": measurement.cpu_s,
+            "count": count,
+            "peak_rss_mb": measurement.peak_rss_mb,
+        }
+        record.update(info)
+        self.records.append(record)
+        if self.logger is not None:
+            self.logger.log(
+                self.level,
+                "%s%s: %.3f s wall, %.3f s cpu, %s MB peak",
+                stage,
+                "" if sample is None else " " + str(sample),
+                record["wall_s"],
+                record["cpu_s"],
+                record["peak_rss_mb"],
+                extra={"instrumentation": record},
+            )
+        return
+
+    def stages(self) -> dict:
+        """Totals by stage: records, count, wall_s and cpu_s summed and the
+        highest peak_rss_mb."""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(
+                record["stage"],
+                {
+                    "records": 0,
+                    "count": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                    "peak_rss_mb": None,
+                },
+            )
+            total["records"] += 1
+            total["count"] += record["count"]
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            if record["peak_rss_mb"] is not None:
+                total["peak_rss_mb"] = max(
+                    total["peak_rss_mb"] or 0, record["peak_rss_mb"]
+                )
+        return totals
+
+    def slowest_samples(self, n: int = 10) -> list:
+        """The n per sample records with the longest wall time."""
+        samples = [r for r in self.records if r["sample"] is not None]
+        return sorted(samples, key=lambda r: r["wall_s"], reverse=True)[:n]
+
+    def summary(self, n: int = 10) -> str:
+        """A table of the stages, slowest first, and of the n slowest
+        samples."""
+        lines = [
+            "{:<28} {:>8} {:>10} {:>10} {:>10}".format(
+                "stage", "count", "wall s", "cpu s", "peak MB"
+            )
+        ]
+        stages = sorted(
+            self.stages().items(), key=lambda s: s[1]["wall_s"], reverse=True
+        )
+        for stage, total in stages:
+            lines.append(
+                "{:<28} {:>8} {:>10.3f} {:>10.3f} {:>10}".format(
+                    stage,
+                    total["count"],
+                    total["wall_s"],
+                    total["cpu_s"],
+                    _format_mb(total["peak_rss_mb"]),
+                )
+            )
+        slowest = self.slowest_samples(n)
+        if slowest:
+            lines += ["", "slowest samples:"]
+            for record in slowest:
+                lines.append(
+                    "{:<28} {:<30} {:>10.3f}".format(
+                        record["stage"], record["sample"], record["wall_s"]
+                    )
+                )
+        return "\n".join(lines)
+
+    def to_json(self, path=None) -> str:
+        """Returns the records and stage totals as JSON, also writing them to
+        path if given."""
+        text = json.dumps(
+            {"stages": self.stages(), "records": self.records},
+            indent=1,
+            default=str,
+        )
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(text)
+        return text
+
+
+def _format_mb(mb) -> str:
+    return "-" if mb is None else "{:.1f}".format(mb)
+
+
+def get_recorder() -> Recorder:
+    """The active Recorder, or None if instrumentation is off."""
+    return _recorder
+
+
+def enable(recorder: Recorder = None) -> Recorder:
+    """Switches instrumentation on, recording into recorder (a new one by
+    default), and returns it."""
+    global _recorder
+    _recorder = Recorder() if recorder is None else recorder
+    return _recorder
+
+
+def disable():
+    """Switches instrumentation off."""
+    global _recorder
+    _recorder = None
+    return
+
+
+@contextmanager
+def instrument(recorder: Recorder = None, logger: logging.Logger = None):
+    """Records everything run in the with block into recorder (by default
+    a new Recorder logging to logger), which is yielded. Any previously
+    active recorder is restored afterwards."""
+    global _recorder
+    previous = _recorder
+    _recorder = Recorder(logger) if recorder is None else recorder
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+class _Stage:
+    __slots__ = ("recorder", "stage", "sample", "count", "info", "_m")
+
+    def __init__(self, recorder, stage, sample, count, info):
+        self.recorder = recorder
+        self.stage = stage
+        self.sample = sample
+        self.count = count
+        self.info = info
+
+    def __enter__(self):
+        self._m = Measurement().__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._m.__exit__(*exc_info)
+        self.recorder.add(
+            self.stage, self.sample, self._m, self.count, **self.info
+        )
+        return False
+
+
+class _NotRecorded:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOT_RECORDED = _NotRecorded()
+
+
+def stage(name: str, sample=None, count: int = 1, **info):
+    """Context manager recording the block as a stage (or, with sample, as
+    one sample of it) if instrumentation is on, and doing nothing
+    otherwise."""
+    if _recorder is None:
+        return _NOT_RECORDED
+    return _Stage(_recorder, name, sample, count, info)
+
+
+def record(
+    name: str, sample, measurement: Measurement, count: int = 1, **info
+):
+    """Records a Measurement made elsewhere, e.g. in a worker process, if
+    instrumentation is on."""
+    if _recorder is not None:
+        _recorder.add(name, sample, measurement, count, **info)
+    return
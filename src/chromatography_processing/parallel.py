@@ -0,0 +1,257 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+import os
+import signal
+import threading
+import warnings
+
+from chromatography_processing import instrumentation
+
+
+def _call_and_catch(func, path):
+    """Calls func(path), returning (True, result, measurement) or (False,
+    error message, measurement) so that one bad file does not abort a whole
+    batch."""
+    with instrumentation.Measurement() as measurement:
+        try:
+            outcome = True, func(path)
+        except Exception as e:
+            outcome = False, "{}: {}".format(type(e).__name__, e)
+    return outcome + (measurement,)
+
+
+def _call_and_catch_each(func, paths: list) -> list:
+    """_call_and_catch for each of a chunk of paths, in a worker process."""
+    return [_call_and_catch(func, path) for path in paths]
+
+
+def map_over_files(
+    func,
+    paths: list,
+    workers: int = None,
+    chunksize: int = None,
+    stage: str = None,
+) -> (list, dict):
+    """Applies func to each path in paths, optionally in a process pool.
+
+    :param func: callable. Must be importable at module level (picklable) if
+    workers is used.
+
+    :param paths: list of pathlib.Path.
+
+    :param workers: int, default None.
+    Number of worker processes. None or 1 runs serially in this process.
+
+    :param chunksize: int, default None.
+    Number of paths sent to a worker at once. By default the paths are split
+    into about four chunks per worker. If a worker process dies (e.g. killed
+    by the OOM killer), the paths of its chunk are read again one by one in
+    a restarted pool, and only the path that killed its worker is recorded
+    as an error.
+
+    :param stage: str, default None.
+    If given and instrumentation is on, each file is recorded as a sample
+    of this stage, with the time and memory it took in its worker.
+
+    Returns: tuple, containing:
+
+    results, list of (path, result) tuples for every path that succeeded, in
+    the same order as paths.
+
+    errors, dict mapping each path that failed to its error message.
+    """
+    paths = list(paths)
+    call = partial(_call_and_catch, func)
+    if workers is None or workers <= 1 or len(paths) <= 1:
+        outcomes = map(call, paths)
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(paths) // (4 * workers))
+        chunks = [
+            paths[i : i + chunksize] for i in range(0, len(paths), chunksize)
+        ]
+        with RestartableProcessPool(workers) as executor:
+            chunk_results = submit_surviving_crashes(
+                _call_and_catch_each,
+                [(func, chunk) for chunk in chunks],
+                executor,
+            )
+            outcomes = []
+            for chunk, result in zip(chunks, chunk_results):
+                if isinstance(result, BrokenProcessPool):
+                    # read the chunk again one path at a time, to find the
+                    # one that killed its worker
+                    result = [result]
+                    if len(chunk) > 1:
+                        result = submit_surviving_crashes(
+                            call, [(path,) for path in chunk], executor
+                        )
+                outcomes.extend(
+                    _crashed(r) if isinstance(r, BrokenProcessPool) else r
+                    for r in result
+                )
+
+    results, errors = [], {}
+    for path, (ok, outcome, measurement) in zip(paths, outcomes):
+        # no measurement of a path that killed its worker
+        if stage is not None and measurement is not None:
+            instrumentation.record(stage, path, measurement, ok=ok)
+        if ok:
+            results.append((path, outcome))
+        else:
+            errors[path] = outcome
+    return results, errors
+
+
+class RestartableProcessPool(Executor):
+    """A process pool that can be replaced by a fresh one when a worker
+    process dies (e.g. killed by the OOM killer, or a segfault), which
+    leaves a ProcessPoolExecutor broken for good. It can be shared by
+    several threads, and is restarted by submit_surviving_crashes.
+
+    :param max_workers: int, default None. Number of processes, by default
+        os.cpu_count().
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # number of times the pool was replaced
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock:
+            pool = self._pool
+        return pool.submit(fn, *args, **kwargs)
+
+    def restart(self, restarts: int):
+        """Replaces the pool, unless it was already replaced since
+        self.restarts was restarts, e.g. by another thread."""
+        with self._lock:
+            if self.restarts == restarts:
+                self._pool.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                self.restarts += 1
+        return
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            pool = self._pool
+        pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        return
+
+
+def submit_surviving_crashes(
+    func, calls: list, executor: Executor, workers: int = None
+) -> list:
+    """Runs func(*args) for each args in calls in executor, returning the
+    results in order.
+
+    If a worker process dies, the pool is broken and every call still
+    pending in it fails. Those calls are then submitted again to a
+    restarted pool: executor itself if it is a RestartableProcessPool,
+    otherwise a RestartableProcessPool of workers processes started here.
+    Calls that are pending when the pool breaks a second time are run one
+    at a time, so the call that kills its worker is found. Its result is
+    the BrokenProcessPool exception, and the other calls are not lost.
+    Exceptions raised by func itself are raised as usual.
+    """
+    results = [None] * len(calls)
+    breaks = [0] * len(calls)
+    pending = list(range(len(calls)))
+    pool = executor
+    own_pool = None
+    try:
+        while pending:
+            together = [i for i in pending if breaks[i] < 2]
+            alone = [[i] for i in pending if breaks[i] >= 2]
+            pending = []
+            for batch in ([together] if together else []) + alone:
+                restarts = getattr(pool, "restarts", None)
+                broken = _submit_and_wait(pool, func, calls, batch, results)
+                if not broken:
+                    continue
+                if len(batch) > 1 or breaks[batch[0]] < 2:
+                    for i in broken:
+                        breaks[i] += 1
+                    pending.extend(broken)
+                if isinstance(pool, RestartableProcessPool):
+                    pool.restart(restarts)
+                else:
+                    own_pool = pool = RestartableProcessPool(workers)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+    return results
+
+
+def _submit_and_wait(
+    pool: Executor, func, calls: list, batch: list, results: list
+) -> list:
+    """Runs the calls of batch in pool, putting their results in results.
+    Returns the calls that failed because the pool broke, with the
+    BrokenProcessPool exception as their result."""
+    futures = []
+    for i in batch:
+        try:
+            futures.append((i, pool.submit(func, *calls[i])))
+        except BrokenProcessPool as e:  # already broken
+            futures.append((i, e))
+    broken = []
+    for i, future in futures:
+        try:
+            if isinstance(future, BrokenProcessPool):
+                raise future
+            results[i] = future.result()
+        except BrokenProcessPool as e:
+            results[i] = e
+            broken.append(i)
+    return broken
+
+
+def _crashed(error: BrokenProcessPool) -> tuple:
+    """The outcome of a call that killed its worker process."""
+    return False, "BrokenProcessPool: {}".format(error), None
+
+
+def warn_about_errors(errors: dict):
+    """Emits a single warning summarising the files that could not be read."""
+    if errors:
+        lines = ["{}: {}".format(path, e) for path, e in errors.items()]
+        warnings.warn(
+            "{} file(s) could not be read and were skipped:\n{}".format(
+                len(errors), "\n".join(lines)
+            ),
+            stacklevel=3,
+        )
+    return
+
+
+def call_with_timeout(timeout: float, func, *args, **kwargs):
+    """Calls func(*args, **kwargs), raising TimeoutError if it takes longer
+    than timeout seconds.
+
+    Uses SIGALRM, so the timeout is only enforced on Unix and in the main
+    thread of a process (e.g. in a ProcessPoolExecutor worker). Elsewhere,
+    or if timeout is None, func is called without a time limit.
+    """
+    use_alarm = (
+        timeout is not None
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if not use_alarm:
+        return func(*args, **kwargs)
+
+    def on_alarm(signum, frame):
+        raise TimeoutError("timed out after {} s".format(timeout))
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
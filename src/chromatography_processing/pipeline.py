@@ -0,0 +1,429 @@
+"""Processing instrument files as a stream of small batches.
+
+Reading, baseline fitting, peak fitting and writing the results run in
+their own threads, connected by bounded queues, so a batch is read while
+the one before it is baseline fitted and the one before that is peak
+fitted. When a stage falls behind, the queue before it fills up and the
+stages upstream wait, so only a few batches are ever in memory, however
+many files there are. Together with watch_folder, this processes new
+instrument files as they land.
+
+The baseline and peak fits of each batch use the functions of
+custom_bc_baseline and fit_dataset, in a shared process pool if workers is
+given. Results are appended to files in an output folder (see
+run_pipeline), so nothing accumulates in memory.
+"""
+
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from chromatography_processing import instrumentation
+from chromatography_processing.custom_bc_baseline import (
+    fit_dataset_with_custom_bc_baseline,
+)
+from chromatography_processing.fit_dataset import (
+    fit_chromatograms_for_dataset,
+    peak_table_to_dataframe,
+)
+from chromatography_processing.parallel import (
+    RestartableProcessPool,
+    map_over_files,
+    warn_about_errors,
+)
+from chromatography_processing.read_chromatogram import (
+    _assemble_dataset,
+    _read_chromatogram_on_grid,
+    _read_chromatogram_sections,
+)
+from chromatography_processing.resample import SIGNAL_DTYPE, make_time_grid
+from chromatography_processing.storage import save_dataset
+
+PEAKS_NAME = "peaks.csv"
+SAMPLES_NAME = "samples.csv"
+# names of the files already processed into an output folder, one per line
+PROCESSED_NAME = "processed.txt"
+BATCH_FORMATS = (".zarr", ".nc")
+
+_DONE = object()
+
+
+def time_grid_from_file(path: Path, n_time_points: int = 2000) -> np.ndarray:
+    """A time grid of n_time_points spanning the chromatograms in one file,
+    for processing a stream of files from the same method."""
+    sections, _, _, ion_types = _read_chromatogram_sections(path)
+    traces = [v for (_, v), present in zip(sections, ion_types) if present]
+    return make_time_grid(
+        min(v[0, 0] for v in traces),
+        max(v[-1, 0] for v in traces),
+        n_time_points,
+    )
+
+
+def watch_folder(
+    folder: Path,
+    pattern: str = "*.txt",
+    poll_interval: float = 5.0,
+    settle_time: float = 2.0,
+    idle_timeout: float = None,
+    stop: threading.Event = None,
+):
+    """Yields the files matching pattern in folder, the ones already there
+    first and then new ones as they land.
+
+    A file is only yielded once its size and modification time have not
+    changed for settle_time seconds, so files still being written by the
+    instrument are not read half-finished. After every poll that found no
+    file ready, None is yielded, which tells run_pipeline to process the
+    files it has so far rather than wait for a full batch.
+
+    The generator only polls when asked for the next file, so a pipeline
+    that is behind does not build up a backlog here.
+
+    :param folder: pathlib.Path. The folder the instrument writes to.
+    :param pattern: str, default '*.txt'.
+    :param poll_interval: float, default 5. Seconds between polls.
+    :param settle_time: float, default 2. Seconds a file must be unchanged.
+    :param idle_timeout: float, default None. If given, stop after this many
+        seconds without a new file. None watches until stop is set.
+    :param stop: threading.Event, default None. Watching ends when it is
+        set.
+    """
+    seen, pending = set(), {}
+    last_new = time.monotonic()
+    while stop is None or not stop.is_set():
+        now = time.monotonic()
+        ready = []
+        for path in sorted(Path(folder).glob(pattern)):
+            if path in seen:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:  # removed since the glob
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if path in pending and pending[path][0] == signature:
+                if now - pending[path][1] >= settle_time:
+                    ready.append(path)
+            else:
+                pending[path] = (signature, now)
+        for path in ready:
+            seen.add(path)
+            del pending[path]
+            yield path
+        if ready:
+            last_new = now
+            continue
+        if idle_timeout is not None and now - last_new >= idle_timeout:
+            return
+        yield None
+        time.sleep(poll_interval)
+    return
+
+
+def run_pipeline(
+    paths,
+    output_folder: Path,
+    anion_time_range,
+    cation_time_range,
+    time_grid: np.ndarray = None,
+    n_time_points: int = 2000,
+    dtype: str = SIGNAL_DTYPE,
+    baseline_kwargs: dict = None,
+    fit_kwargs: dict = None,
+    engine: str = "hplc",
+    windows: dict = None,
+    batch_size: int = 16,
+    queue_size: int = 2,
+    workers: int = None,
+    executor: Executor = None,
+    plot: bool = False,
+    batch_format: str = None,
+    return_errors: bool = False,
+) -> list:
+    """Reads, baseline fits and peak fits Metrohm .txt files in batches,
+    with the stages overlapping, and appends the results to output_folder:
+
+    - peaks.csv: the peak table (see fit_dataset.peak_table_to_dataframe).
+    - samples.csv: ident, ion_type, measurement_time, fit_status and
+      fit_error of every sample.
+    - processed.txt: the names of the files processed. Files listed here
+      are skipped, so an interrupted run can be started again.
+    - with batch_format, batches/<first measurement time><batch_format>:
+      each processed batch, saved with storage.save_dataset.
+    - with plot, plots/<first measurement time>_anion.png and _cation.png:
+      thumbnails of each batch (see plot_all_from_run).
+
+    :param paths: iterable of pathlib.Path. The files to process, e.g. a
+        sorted glob or watch_folder. A None in it makes the files read so
+        far be processed as a batch, even if it is not full.
+    :param output_folder: pathlib.Path. Created if it does not exist.
+    :param anion_time_range, cation_time_range: tuple of float. Passed on
+        to fit_dataset_with_custom_bc_baseline.
+    :param time_grid: np.ndarray, default None. The times every file is
+        resampled onto as it is read. None uses time_grid_from_file on the
+        first file.
+    :param n_time_points: int, default 2000. Points of that time grid.
+    :param dtype: str, default SIGNAL_DTYPE ('float32'). Type of the
+        signal, background and reduced_signal arrays.
+    :param baseline_kwargs: dict, default None. Further arguments of
+        fit_dataset_with_custom_bc_baseline, e.g. lam.
+    :param fit_kwargs: dict, default None. Passed on to
+        fit_chromatograms_for_dataset.
+    :param engine: str, default 'hplc'. Peak fitting engine, 'hplc' or
+        'native'.
+    :param windows: dict, default None. Retention windows by ion type,
+        required with engine='native'.
+    :param batch_size: int, default 16. Files per batch.
+    :param queue_size: int, default 2. Batches waiting between two stages.
+        At most about 3 * queue_size + 4 batches are in memory.
+    :param workers: int, default None. Number of processes shared by the
+        baseline and peak fits. None fits in the stage threads.
+    :param executor: concurrent.futures.Executor, default None. An existing
+        process pool to use instead of starting one.
+    :param plot: bool, default False. If True, save thumbnails per batch.
+    :param batch_format: str, default None. '.zarr' or '.nc' to save every
+        batch (needs the storage extra).
+    :param return_errors: bool, default False. If True, also return a dict
+        mapping each file that could not be processed to its error
+        message. Either way, such files are skipped with a warning.
+    :return: list of the files processed.
+    """
+    if batch_format is not None and batch_format not in BATCH_FORMATS:
+        raise ValueError(
+            "batch_format must be one of {}".format(BATCH_FORMATS)
+        )
+    if executor is None and workers is not None and workers > 1:
+        with RestartableProcessPool(workers) as executor:
+            return run_pipeline(
+                paths,
+                output_folder,
+                anion_time_range,
+                cation_time_range,
+                time_grid=time_grid,
+                n_time_points=n_time_points,
+                dtype=dtype,
+                baseline_kwargs=baseline_kwargs,
+                fit_kwargs=fit_kwargs,
+                engine=engine,
+                windows=windows,
+                batch_size=batch_size,
+                queue_size=queue_size,
+                workers=workers,
+                executor=executor,
+                plot=plot,
+                batch_format=batch_format,
+                return_errors=return_errors,
+            )
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    processed = _read_processed(output_folder)
+    errors = {}
+
+    baseline = partial(
+        fit_dataset_with_custom_bc_baseline,
+        anion_time_range=anion_time_range,
+        cation_time_range=cation_time_range,
+        workers=workers,
+        executor=executor,
+        **({} if baseline_kwargs is None else baseline_kwargs),
+    )
+    fit = partial(
+        fit_chromatograms_for_dataset,
+        fit_kwargs=fit_kwargs,
+        workers=workers,
+        executor=executor,
+        engine=engine,
+        windows=windows,
+    )
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(3)]
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(
+            (p for p in paths if p is None or Path(p).name not in processed),
+            queues[0],
+            time_grid,
+            n_time_points,
+            dtype,
+            batch_size,
+            errors,
+        ),
+        daemon=True,
+    )
+    threads = [reader] + [
+        threading.Thread(
+            target=_run_stage,
+            args=(func, queues[i], queues[i + 1], errors),
+            daemon=True,
+        )
+        for i, func in enumerate([baseline, fit])
+    ]
+    for thread in threads:
+        thread.start()
+
+    done = []
+    while True:
+        item = queues[2].get()
+        if item is _DONE:
+            break
+        batch_paths, data = item
+        try:
+            _write_batch(data, output_folder, plot, batch_format)
+        except Exception as e:
+            _batch_failed(batch_paths, e, errors)
+            continue
+        _append_processed(output_folder, batch_paths)
+        done.extend(batch_paths)
+    for thread in threads:
+        thread.join()
+
+    warn_about_errors(errors)
+    if return_errors:
+        return done, errors
+    return done
+
+
+def _batch_failed(paths: list, error: Exception, errors: dict):
+    for path in paths:
+        errors[path] = "{}: {}".format(type(error).__name__, error)
+    return
+
+
+def _read_batches(
+    paths,
+    outbox: queue.Queue,
+    time_grid: np.ndarray,
+    n_time_points: int,
+    dtype: str,
+    batch_size: int,
+    errors: dict,
+):
+    """Reads paths in batches onto time_grid and puts (paths, Dataset) in
+    outbox, then _DONE."""
+    batch = []
+
+    def flush():
+        nonlocal time_grid
+        if time_grid is None:
+            time_grid = time_grid_from_file(batch[0], n_time_points)
+        read = partial(_read_chromatogram_on_grid, time_grid=time_grid)
+        results, read_errors = map_over_files(read, batch, stage="read_file")
+        errors.update(read_errors)
+        if results:
+            outbox.put(
+                (
+                    [path for path, _ in results],
+                    _assemble_dataset(
+                        [r for _, r in results],
+                        time_grid,
+                        resampled=True,
+                        dtype=dtype,
+                    ),
+                )
+            )
+        batch.clear()
+
+    try:
+        for path in paths:
+            if path is not None:
+                batch.append(Path(path))
+            if batch and (path is None or len(batch) >= batch_size):
+                try:
+                    flush()
+                except Exception as e:
+                    _batch_failed(batch, e, errors)
+                    batch.clear()
+        if batch:
+            try:
+                flush()
+            except Exception as e:
+                _batch_failed(batch, e, errors)
+    finally:
+        outbox.put(_DONE)
+    return
+
+
+def _run_stage(func, inbox: queue.Queue, outbox: queue.Queue, errors: dict):
+    """Applies func to the Dataset of every (paths, Dataset) in inbox and
+    puts the results in outbox, until _DONE. A batch for which func raises
+    is dropped, and its files are recorded in errors."""
+    try:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            batch_paths, data = item
+            try:
+                data = func(data)
+            except Exception as e:
+                _batch_failed(batch_paths, e, errors)
+                continue
+            outbox.put((batch_paths, data))
+    finally:
+        outbox.put(_DONE)
+    return
+
+
+def _write_batch(
+    data: xr.Dataset, output_folder: Path, plot: bool, batch_format: str
+):
+    n_samples = data.sizes["measurement_time"]
+    with instrumentation.stage("write_batch", count=n_samples):
+        _append_csv(peak_table_to_dataframe(data), output_folder / PEAKS_NAME)
+        samples = (
+            data[["fit_status", "fit_error"]]
+            .to_dataframe()
+            .reset_index()[
+                [
+                    "ident",
+                    "ion_type",
+                    "measurement_time",
+                    "fit_status",
+                    "fit_error",
+                ]
+            ]
+        )
+        _append_csv(samples, output_folder / SAMPLES_NAME)
+        name = pd.Timestamp(data.measurement_time.values[0]).strftime(
+            "%Y%m%d_%H%M%S"
+        )
+        if batch_format is not None:
+            (output_folder / "batches").mkdir(exist_ok=True)
+            save_dataset(
+                data, output_folder / "batches" / (name + batch_format)
+            )
+    if plot:
+        # matplotlib is only loaded by runs that plot
+        from chromatography_processing.chromatogram_plotting import (
+            plot_all_from_run,
+        )
+
+        plot_all_from_run(data, output_folder / "plots" / name, thumbnail=True)
+    return
+
+
+def _append_csv(data: pd.DataFrame, path: Path):
+    new = not path.exists() or path.stat().st_size == 0
+    data.to_csv(path, mode="a", header=new, index=False)
+    return
+
+
+def _read_processed(output_folder: Path) -> set:
+    try:
+        with open(output_folder / PROCESSED_NAME) as file:
+            return {line.strip() for line in file if line.strip()}
+    except OSError:
+        return set()
+
+
+def _append_processed(output_folder: Path, paths: list):
+    with open(output_folder / PROCESSED_NAME, "a") as file:
+        file.writelines(Path(path).name + "\n" for path in paths)
+    return
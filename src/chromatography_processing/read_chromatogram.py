@@ -1,12 +1,25 @@
 from pathlib import Path
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
+from functools import partial
 
 import xarray
 import xarray as xr
 
+from chromatography_processing import instrumentation
+from chromatography_processing.cache import (
+    ParsedFileCache,
+    read_files_with_cache,
+)
+from chromatography_processing.parallel import warn_about_errors
+from chromatography_processing.resample import (
+    SIGNAL_DTYPE,
+    make_time_grid,
+    resample_traces,
+    time_grid_attrs,
+)
+
 
 def get_chromatogram_indices(data: pd.DataFrame, search_string: str):
     """Finds where the cation and anion chromatograms begin and end.
@@ -47,6 +60,89 @@ def process_chromatogram_from_list_to_dataframe(data: list) -> pd.DataFrame:
     return data
 
 
+def _parse_rows(rows: list) -> np.ndarray:
+    """Converts 'time;value' rows into an (n, 2) float64 array. Any further
+    columns are ignored."""
+    if not rows:
+        return np.empty((0, 2))
+    return np.loadtxt(rows, delimiter=";", usecols=(0, 1), ndmin=2)
+
+
+def parse_metrohm_txt_sections(
+    path_to_data: Path, skip_sections: tuple = ("Pressure",)
+) -> (list, dict):
+    """Reads a Metrohm .txt export in a single pass over the file.
+
+    A section is a title line (e.g. 'Anions'), followed by a line giving the
+    number of points, a line giving the units, and then one 'time;value' row
+    per point.
+
+    Sections whose title contains any of skip_sections are stepped over
+    without being tokenized.
+
+    :param path_to_data: pathlib.Path.
+    Path to the data file.
+
+    :param skip_sections: tuple of str, default ('Pressure',).
+    Sections whose title contains any of these strings are not parsed.
+
+    Returns: tuple, containing:
+
+    header, list of str. The non-blank lines before the first section, i.e.
+    the measurement time, the sample identity and the measurement id.
+
+    sections, dict. Maps each section title to a tuple (start_row, values).
+    values is an (n, 2) float64 array of time and signal. start_row is the
+    position of the first data row among the non-blank lines of the file,
+    not counting the first line (the row label pd.read_csv would give it).
+    """
+    with open(path_to_data, encoding="latin-1") as file:
+        lines = [line for line in map(str.strip, file) if line]
+
+    # the measurement time and sample identity always come first
+    header = lines[:2]
+    sections = {}
+    i, n_lines = 2, len(lines)
+    while i < n_lines:
+        line = lines[i]
+        is_title = (
+            ";" not in line and i + 1 < n_lines and lines[i + 1].isdigit()
+        )
+        if not is_title:
+            if not sections:
+                header.append(line)
+            i += 1
+            continue
+
+        # skip the title, point count and units rows
+        start = stop = i + 3
+        while stop < n_lines and ";" in lines[stop]:
+            stop += 1
+        if not any(s in line for s in skip_sections):
+            values = _parse_rows(lines[start:stop])
+            sections[line] = (start - 1, values)
+        i = stop
+    return header, sections
+
+
+def _find_section(sections: dict, search_string: str):
+    """Returns the first section whose title contains search_string, or None
+    if there is no such section."""
+    for title, section in sections.items():
+        if search_string in title:
+            return section
+    return None
+
+
+def _section_to_dataframe(section: tuple) -> pd.DataFrame:
+    start_row, values = section
+    return pd.DataFrame(
+        values,
+        columns=["time", "signal"],
+        index=pd.RangeIndex(start_row, start_row + values.shape[0]),
+    )
+
+
 def read_chromatogram(
     path_to_data: Path,
     unmeasured_ion_placeholder=-1.0,
@@ -87,63 +183,131 @@ def read_chromatogram(
     ion_types, tuple of bools. First position of this variable indicates if
     anions are present; second that cations are present.
     """
-    data = pd.read_csv(path_to_data, encoding="unicode-escape")
-    data = data.iloc[:, 0]  # convert to a series
+    sections, ident, meas_time, ion_types = _read_chromatogram_sections(
+        path_to_data, unmeasured_ion_placeholder
+    )
+    an, cat = [_section_to_dataframe(section) for section in sections]
+    # the pandas based reader left out the last row of the section running
+    # into the pressure data, the cations if there are any, and of the
+    # placeholder copied from it
+    if ion_types[1]:
+        cat = cat.iloc[:-1]
+        if not ion_types[0]:
+            an = an.iloc[:-1]
+    else:
+        an, cat = an.iloc[:-1], cat.iloc[:-1]
+    return (an, cat), ident, meas_time, ion_types
 
-    # get the identity and measurement time
-    ident = data.iloc[0]
-    meas_time = data.name
-    meas_time = meas_time.split(" UTC")[0]
-    meas_time = datetime.strptime(meas_time, "%Y-%m-%d %H:%M:%S")
 
-    # drop pressure data, leaving only conductivity
-    pressure_indices = data[data.str.contains("Pressure")].index.tolist()
-    data = data[: pressure_indices[0]]
+def _parse_measurement_time(line: str) -> datetime:
+    """Parses the first line of a Metrohm export, e.g.
+    '2025-08-21 17:43:14 UTC-4'. The UTC offset is discarded."""
+    return datetime.strptime(line.split(" UTC")[0], "%Y-%m-%d %H:%M:%S")
+
+
+def read_measurement_time(path_to_data: Path) -> datetime:
+    """Reads only the time of measurement from a Metrohm .txt export."""
+    with open(path_to_data, encoding="latin-1") as file:
+        for line in file:
+            if line.strip():
+                return _parse_measurement_time(line.strip())
+    raise ValueError("{} is empty".format(path_to_data))
+
+
+def _read_header(path_to_data: Path) -> (str, datetime):
+    """Reads only the sample identity and time of measurement from a Metrohm
+    .txt export."""
+    header = []
+    with open(path_to_data, encoding="latin-1") as file:
+        for line in file:
+            if line.strip():
+                header.append(line.strip())
+            if len(header) == 2:
+                return header[1], _parse_measurement_time(header[0])
+    raise ValueError("{} has no header".format(path_to_data))
+
+
+def _read_chromatogram_sections(
+    path_to_data: Path, unmeasured_ion_placeholder=-1.0
+) -> (tuple, str, datetime, tuple):
+    """Does the work of read_chromatogram, but returns each chromatogram as a
+    (start_row, values) section rather than as a DataFrame."""
+    header, sections = parse_metrohm_txt_sections(path_to_data)
+
+    # get the identity and measurement time
+    ident = header[1]
+    meas_time = _parse_measurement_time(header[0])
 
     # determine what kind of ions are present
-    anion_chromatogram_indices = data[
-        data.str.contains("Anion")
-    ].index.tolist()
-    cation_chromatogram_indices = data[
-        data.str.contains("Cation")
-    ].index.tolist()
+    anion_section = _find_section(sections, "Anion")
+    cation_section = _find_section(sections, "Cation")
 
-    anions_present = True if len(anion_chromatogram_indices) > 0 else False
-    cations_present = True if len(cation_chromatogram_indices) > 0 else False
-
-    if anions_present:
-        indices = get_chromatogram_indices(data, "Anion")
-        an = data.iloc[indices[0] : indices[1]]
-        an = process_chromatogram_from_list_to_dataframe(an)
-    else:  # if anions are not present
-        # process the data as if they were, but fill with unmeasured ion
-        # placeholder
-        indices = get_chromatogram_indices(data, "Cation")
-        an = data.iloc[indices[0] : indices[1]]
-        an = process_chromatogram_from_list_to_dataframe(an)
-        an["signal"] = (
-            unmeasured_ion_placeholder  # replace with placeholder data
-        )
+    anions_present = anion_section is not None
+    cations_present = cation_section is not None
 
-    if cations_present:
-        indices = get_chromatogram_indices(data, "Cation")
-        cat = data.iloc[indices[0] : indices[1]]
-        cat = process_chromatogram_from_list_to_dataframe(cat)
-    else:  # if cations are not present...
-        # process the data as if they were, but fill with unmeasured ion
-        # placeholder
-        indices = get_chromatogram_indices(data, "Anion")
-        cat = data.iloc[indices[0] : indices[1]]
-        cat = process_chromatogram_from_list_to_dataframe(cat)
-        cat["signal"] = (
-            unmeasured_ion_placeholder  # replace with placeholder data
+    if not (anions_present or cations_present):
+        raise ValueError(
+            "No anion or cation chromatogram found in {}".format(path_to_data)
         )
 
+    # if one ion type is not present, process the data as if it were, but
+    # fill with unmeasured ion placeholder
+    def placeholder_section(section):
+        start_row, values = section
+        values = values.copy()
+        values[:, 1] = unmeasured_ion_placeholder
+        return start_row, values
+
+    if not anions_present:
+        anion_section = placeholder_section(cation_section)
+    if not cations_present:
+        cation_section = placeholder_section(anion_section)
+
     ion_types = (anions_present, cations_present)
-    return (an, cat), ident, meas_time, ion_types
+    return (anion_section, cation_section), ident, meas_time, ion_types
+
+
+def _encode_sections(result: tuple) -> dict:
+    """Packs the output of _read_chromatogram_sections into arrays, for
+    ParsedFileCache."""
+    (anion, cation), ident, meas_time, ion_types = result
+    return {
+        "anion_start_row": anion[0],
+        "anion": anion[1],
+        "cation_start_row": cation[0],
+        "cation": cation[1],
+        "ident": ident,
+        "measurement_time": np.datetime64(meas_time, "us"),
+        "ion_types": ion_types,
+    }
+
+
+def _decode_sections(arrays: dict) -> tuple:
+    """Inverse of _encode_sections."""
+    sections = tuple(
+        (int(arrays[ion + "_start_row"]), arrays[ion])
+        for ion in ("anion", "cation")
+    )
+    meas_time = arrays["measurement_time"].astype("datetime64[us]").item()
+    ion_types = tuple(bool(b) for b in arrays["ion_types"])
+    return sections, str(arrays["ident"]), meas_time, ion_types
+
+
+def _read_chromatogram_on_grid(
+    path_to_data: Path, time_grid: np.ndarray
+) -> (tuple, str, datetime, tuple):
+    """Reads a chromatogram and immediately resamples both ion types onto
+    time_grid, so that only the resampled signals are kept."""
+    sections, ident, meas_time, ion_types = _read_chromatogram_sections(
+        path_to_data
+    )
+    signals = resample_traces([v for _, v in sections], time_grid)
+    return tuple(signals), ident, meas_time, ion_types
 
 
 def plot_chromatogram(data):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     ax.plot(data["t"], data["cond"])
     plt.show()
@@ -152,109 +316,314 @@ def plot_chromatogram(data):
 
 def read_chromatograms_in_folder_to_xarray(
     path_to_folder: Path,
+    time_grid: np.ndarray = None,
+    n_time_points: int = 2000,
+    workers: int = None,
+    cache: ParsedFileCache = None,
+    return_errors: bool = False,
+    chunks: int = None,
+    dtype: str = SIGNAL_DTYPE,
 ) -> xarray.Dataset:
     """
     :param path_to_folder: pathlib.Path.
     The path to the folder containing all of the data files that will be read.
 
+    :param time_grid: np.ndarray, default None.
+    The times (in minutes) that every chromatogram is interpolated onto. If
+    given, each file is resampled as soon as it is read, so only the
+    resampled signals are kept in memory. If None, n_time_points evenly
+    spaced points spanning the earliest to the latest time in the folder are
+    used, which means the raw traces are kept until every file has been read.
+
+    :param n_time_points: int, default 2000.
+    Number of points in the time grid, if time_grid is not given.
+
+    :param workers: int, default None.
+    Number of processes used to read the files. None reads them serially.
+
+    :param cache: ParsedFileCache, default None.
+    If given, parsed files are taken from the cache and only new or changed
+    files are parsed. The cache holds raw traces, so resampling then happens
+    after reading even if time_grid is given.
+
+    :param return_errors: bool, default False.
+    If True, also return the dict of files that could not be read. Either
+    way, unreadable files are skipped with a warning rather than aborting the
+    whole folder.
+
+    :param chunks: int, default None.
+    If given, signal is a lazy dask array with chunks of this many samples
+    along measurement_time, and only the first two lines of each file are
+    read here. The files of a chunk are read when the chunk is computed, so
+    a whole archive can be processed chunk by chunk in bounded memory.
+    Needs dask and a time_grid; workers and cache are not used, and a file
+    that cannot be read when its chunk is computed gives NaN with a
+    warning. Errors returned are those found while reading the headers.
+
+    :param dtype: str, default SIGNAL_DTYPE ('float32').
+    Type of the signal array. Files are parsed and resampled in float64,
+    and the result stored as dtype. Pass 'float64' to keep full precision.
+
     :returns:
     data: xarray.Dataset.
-    The data for the entire folder.
+    The data for the entire folder, with ion_type (i.e. cation or anion),
+    measurement_time (a proxy for order of measurement), and time (time in
+    minutes inside the chromatogram) as coords, and the sample identity as
+    an ident coord along measurement_time.
+
+    errors: dict, only if return_errors is True.
+    Maps the path of each file that could not be read to its error message.
     """
     # Find all .txt files in the folder.
-    files = path_to_folder.glob("*.txt")
+    files = sorted(path_to_folder.glob("*.txt"))
+    if chunks is not None:
+        return_value, errors = _read_folder_lazily(
+            path_to_folder, files, time_grid, chunks, dtype
+        )
+        return (return_value, errors) if return_errors else return_value
 
     # make a list of chromatograms
-    data = [read_chromatogram(file) for file in files]
-
-    # Extract the different things we care about
-    # (I know this is shockingly inelegant)
-    anion_data = [d[0][0] for d in data]
-    cation_data = [d[0][1] for d in data]
-    idents = [d[1] for d in data]
-    measurement_times = [d[2] for d in data]
-    anions_present = [d[3][0] for d in data]
-    cations_present = [d[3][1] for d in data]
-
-    def convert_ion_data_to_xarray_and_combine(data: xarray.Dataset):
-        """Converts data from list of pandas DataFrames to xarray.Dataset.
-
-        First converts each DataFrame into an xarray.DataArray. Then
-        combines automatically. Returns a dataset with ion_type (i.e.
-        cation or anion), measurement_time (a proxy for order of
-        measurement), and time (time in seconds inside the chromatogram)
-        as coords.
-        """
-
-        data = [
-            d.set_index(["ion_type", "measurement_time", "time"]) for d in data
-        ]
-        data = [d.to_xarray() for d in data]
-        data = xr.combine_by_coords(data, join="outer")
-        return data
-
-    if anions_present:  # process anions into dataset
-        for d, t, ident in zip(anion_data, measurement_times, idents):
-            d["measurement_time"] = t
-            d["ident"] = ident
-            d["ion_type"] = "anion"
-        anion_data = convert_ion_data_to_xarray_and_combine(anion_data)
-
-    if cations_present:  # process cations into dataset
-        for d, t, ident in zip(cation_data, measurement_times, idents):
-            d["measurement_time"] = t
-            d["ident"] = ident
-            d["ion_type"] = "cation"
-        cation_data = convert_ion_data_to_xarray_and_combine(cation_data)
-
-    # combine cation, anion data
-    to_combine = []
-    if anions_present:
-        to_combine.append(anion_data)
-    if cations_present:
-        to_combine.append(cation_data)
-    data = xr.combine_by_coords(to_combine, join="outer")
-
-    # take the idents data variable and convert it to a coord
-    def convert_idents_to_coord(data):
-        idents = data["ident"].isel(time=0, ion_type=0).values.tolist()
-        new_idents = []
-        for ident in idents:
-            if "ian_pos" in ident:
-                i = int(ident.split("ian_pos")[1])
-                new_idents.append(i)
-                pass
-            else:
-                new_idents.append(ident)
-        data = data.drop_vars(["ident"])
-        data = data.assign_coords(ident=("measurement_time", idents))
-        return data
-
-    data = convert_idents_to_coord(data)
-
-    data = data.dropna(dim="time", how="all")
-
-    # interpolate the data to put it all on one time grid
-    # this is to avoid times like 1.00067 and 1.00066 seconds
-    # from being classified differently.
-    # This allows background subtraction later.
-    def interpolate_data(
-        ds: xr.Dataset, var_name: str, dim: str = "time"
-    ) -> xr.Dataset:
-        # Remove NaNs from the coordinate before interpolation
-        if ds[dim].isnull().any():
-            ds = ds.dropna(dim)
-
-        # Fill NaNs in the dataset data with linear interpolation
-        # (choose appropriate method)
-        ds[var_name] = ds[var_name].interpolate_na(dim, method="linear")
-
-        return ds
-
-    # Apply interpolation
-    interpolated_ds = interpolate_data(data, "signal", dim="time")
-    time_grid = np.linspace(
-        data.time.values.min(), data.time.values.max(), 2000
+    resampled = time_grid is not None and cache is None
+    if time_grid is not None:
+        time_grid = np.asarray(time_grid, dtype=float)
+    if resampled:
+        read = partial(_read_chromatogram_on_grid, time_grid=time_grid)
+    else:
+        read = _read_chromatogram_sections
+    data, errors = read_files_with_cache(
+        read,
+        files,
+        cache,
+        "metrohm_txt_sections",
+        _encode_sections,
+        _decode_sections,
+        workers=workers,
+        stage="read_file",
+    )
+    warn_about_errors(errors)
+    if len(data) == 0:
+        raise ValueError(
+            "No chromatograms could be read from {}".format(path_to_folder)
+        )
+    data = [d for _, d in data]
+
+    if time_grid is None:
+        # put everything on one time grid, to avoid times like 1.00067 and
+        # 1.00066 seconds from being classified differently.
+        # This allows background subtraction later.
+        traces = [values for d in data for _, values in d[0] if len(values)]
+        time_grid = make_time_grid(
+            min(values[0, 0] for values in traces),
+            max(values[-1, 0] for values in traces),
+            n_time_points,
+        )
+        del traces
+
+    with instrumentation.stage("assemble", count=len(data)):
+        return_value = _assemble_dataset(data, time_grid, resampled, dtype)
+    if return_errors:
+        return return_value, errors
+    return return_value
+
+
+def _assemble_dataset(
+    data: list,
+    time_grid: np.ndarray,
+    resampled: bool,
+    dtype: str = SIGNAL_DTYPE,
+) -> xarray.Dataset:
+    """Builds the folder Dataset from a list of read chromatograms.
+
+    Each element of data is a tuple ((anion, cation), ident, meas_time,
+    ion_types). If resampled is True, anion and cation are signals already
+    on time_grid; otherwise they are (start_row, values) sections, which are
+    all resampled together. The signals are written into one preallocated
+    (ion_type, measurement_time, time) array of dtype in order of
+    measurement time. ion_type and ident are fixed width string coordinates
+    rather than arrays of python strings.
+    """
+    order = sorted(range(len(data)), key=lambda i: data[i][2])
+    signal = np.empty((2, len(data), time_grid.size), dtype=dtype)
+    if resampled:
+        for position, i in enumerate(order):
+            signal[:, position] = data[i][0]
+    else:
+        traces = [data[i][0][ion][1] for ion in range(2) for i in order]
+        resample_traces(
+            traces, time_grid, out=signal.reshape(-1, len(time_grid))
+        )
+    idents = [data[i][1] for i in order]
+    measurement_times = [data[i][2] for i in order]
+
+    return xr.Dataset(
+        {"signal": (("ion_type", "measurement_time", "time"), signal)},
+        coords={
+            "ion_type": np.array(["anion", "cation"]),
+            "measurement_time": pd.DatetimeIndex(measurement_times),
+            "time": time_grid,
+            "ident": ("measurement_time", np.array(idents, dtype=str)),
+        },
+        attrs=time_grid_attrs(time_grid),
+    )
+
+
+def _read_folder_lazily(
+    path_to_folder: Path,
+    files: list,
+    time_grid: np.ndarray,
+    chunks: int,
+    dtype: str = SIGNAL_DTYPE,
+) -> (xarray.Dataset, dict):
+    """Builds the folder Dataset with a dask signal array, reading only the
+    headers of the files now."""
+    import dask
+    import dask.array as da
+
+    if time_grid is None:
+        raise ValueError("reading a folder in chunks needs a time_grid")
+    time_grid = np.asarray(time_grid, dtype=float)
+
+    headers, errors = [], {}
+    for path in files:
+        try:
+            headers.append((path, *_read_header(path)))
+        except (OSError, ValueError) as e:
+            errors[path] = "{}: {}".format(type(e).__name__, e)
+    warn_about_errors(errors)
+    if len(headers) == 0:
+        raise ValueError(
+            "No chromatograms could be read from {}".format(path_to_folder)
+        )
+    headers.sort(key=lambda header: header[2])
+
+    blocks = []
+    for start in range(0, len(headers), chunks):
+        paths = [header[0] for header in headers[start : start + chunks]]
+        block = dask.delayed(_read_files_on_grid)(paths, time_grid, dtype)
+        blocks.append(
+            da.from_delayed(
+                block, shape=(2, len(paths), time_grid.size), dtype=dtype
+            )
+        )
+    signal = da.concatenate(blocks, axis=1)
+
+    data = xr.Dataset(
+        {"signal": (("ion_type", "measurement_time", "time"), signal)},
+        coords={
+            "ion_type": np.array(["anion", "cation"]),
+            "measurement_time": pd.DatetimeIndex([h[2] for h in headers]),
+            "time": time_grid,
+            "ident": (
+                "measurement_time",
+                np.array([h[1] for h in headers], dtype=str),
+            ),
+        },
+        attrs=time_grid_attrs(time_grid),
+    )
+    return data, errors
+
+
+def _read_files_on_grid(
+    paths: list, time_grid: np.ndarray, dtype: str = SIGNAL_DTYPE
+) -> np.ndarray:
+    """Reads one chunk of files onto time_grid, as an (ion_type, sample,
+    time) array of dtype. Files that cannot be read are NaN."""
+    signal = np.full((2, len(paths), time_grid.size), np.nan, dtype=dtype)
+    errors = {}
+    for i, path in enumerate(paths):
+        try:
+            signal[:, i] = _read_chromatogram_on_grid(path, time_grid)[0]
+        except Exception as e:
+            errors[path] = "{}: {}".format(type(e).__name__, e)
+    warn_about_errors(errors)
+    return signal
+
+
+def append_new_chromatograms_to_xarray(
+    data: xarray.Dataset,
+    path_to_folder: Path,
+    workers: int = None,
+    cache: ParsedFileCache = None,
+    return_errors: bool = False,
+) -> xarray.Dataset:
+    """Adds the files in a folder that are not yet in data to data.
+
+    Only the first line of each file is read to find its measurement time;
+    files whose measurement time is already in data are not parsed. New
+    files are resampled onto the existing time grid and appended along
+    measurement_time. Variables computed earlier for the existing samples
+    (e.g. background, reduced_signal) keep their values, and are NaN for the
+    new samples until they are computed for them.
+
+    :param data: xarray.Dataset.
+    As returned by read_chromatograms_in_folder_to_xarray.
+
+    :param path_to_folder: pathlib.Path.
+    The folder that data was read from, possibly with new files in it.
+
+    :param workers: int, default None.
+    Number of processes used to read the new files.
+
+    :param cache: ParsedFileCache, default None.
+    Cache of parsed files, as for read_chromatograms_in_folder_to_xarray.
+
+    :param return_errors: bool, default False.
+    If True, also return the dict of files that could not be read.
+
+    :returns:
+    data: xarray.Dataset, with the new samples appended. data itself is
+    returned if there are no new files.
+
+    errors: dict, only if return_errors is True.
+    """
+    measured = set(data.measurement_time.to_index())
+    new_files, errors = [], {}
+    for path in sorted(path_to_folder.glob("*.txt")):
+        try:
+            if read_measurement_time(path) not in measured:
+                new_files.append(path)
+        except (OSError, ValueError) as e:
+            errors[path] = "{}: {}".format(type(e).__name__, e)
+
+    if len(new_files) == 0:
+        warn_about_errors(errors)
+        return (data, errors) if return_errors else data
+
+    time_grid = data.time.values
+    if cache is None:
+        read = partial(_read_chromatogram_on_grid, time_grid=time_grid)
+    else:
+        read = _read_chromatogram_sections
+    new, read_errors = read_files_with_cache(
+        read,
+        new_files,
+        cache,
+        "metrohm_txt_sections",
+        _encode_sections,
+        _decode_sections,
+        workers=workers,
     )
-    data = interpolated_ds.interp(time=time_grid)
+    errors.update(read_errors)
+    warn_about_errors(errors)
+    if len(new) > 0:
+        new = _assemble_dataset(
+            [d for _, d in new],
+            time_grid,
+            resampled=cache is None,
+            dtype=data.signal.dtype,
+        )
+        data = xr.concat(
+            [data, new],
+            dim="measurement_time",
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            join="outer",
+            combine_attrs="override",
+        )
+        if not data.measurement_time.to_index().is_monotonic_increasing:
+            data = data.sortby("measurement_time")
+
+    if return_errors:
+        return data, errors
     return data
@@ -1,36 +1,48 @@
+from importlib.util import find_spec
+import io
+import logging
+
+import numpy as np
 import pandas as pd
-import shutil
+
+from chromatography_processing import instrumentation
+from chromatography_processing.parallel import (
+    map_over_files,
+    warn_about_errors,
+)
+from chromatography_processing.staging import stage_files
+
+# the rack position in an Ident such as 'ian_pos12'
+POSITION_PATTERN = r"pos(\d+)"
+# types of the text columns of IC result exports; open_list_of_ic_files
+# reads every other column (the concentrations) as IC_VALUE_DTYPE
+IC_DTYPES = {"Ident": str, "Sample type": str, "Determination start": str}
+IC_VALUE_DTYPE = "float64"
+
+logger = logging.getLogger(__name__)
 
 
-def copy_csvs_to_from_import(path_to_files):
-    """If a from_import folder exists, nothing happens. If no from_import
-    folder exists, this function creates one and transfers all .csv files in
-    the given path to path_to_files/from_import.
+def copy_csvs_to_from_import(path_to_files, mode="link", workers=8):
+    """Stages all .csv files in the given path into path_to_files/from_import,
+    creating it if needed.
+
+    Files are hard linked, or reflinked, where the filesystem supports it and
+    copied otherwise (see staging.stage_files). A manifest in from_import
+    records what was staged, so files that are already staged and unchanged
+    are skipped, and new or changed files are staged even if from_import
+    already exists.
 
     :param path_to_files: Path Path to find the collection of IC files
         to process
-    :return:
+    :param mode: str 'link' (default), 'reflink' or 'copy'.
+    :param workers: int Number of threads staging files.
+    :return: list of the files staged by this call.
     """
     from_import_path = path_to_files / "from_import"
-    if from_import_path.exists():
-        print("Folder {} exists".format(str(from_import_path)))
-        print("Not copying any files")
-        return
-    else:
-        from_import_path.mkdir()
-        original_file_paths = list(path_to_files.glob("*.csv"))
-        destination_file_paths = [
-            from_import_path / file.name for file in original_file_paths
-        ]
-        [
-            print("Original {}, destination {}".format(src, dest))
-            for src, dest in zip(original_file_paths, destination_file_paths)
-        ]
-        [
-            shutil.copy(src, dest)
-            for src, dest in zip(original_file_paths, destination_file_paths)
-        ]
-    return
+    original_file_paths = sorted(path_to_files.glob("*.csv"))
+    return stage_files(
+        original_file_paths, from_import_path, mode=mode, workers=workers
+    )
 
 
 def open_ic_file(path_to_file):
@@ -42,9 +54,9 @@ def open_ic_file(path_to_file):
     :param path_to_file: Path Path to fild data files
     :return:
     """
-    print("reading {}".format(path_to_file))
-    # help(pd.read_csv)
-    df = pd.read_csv(path_to_file, delimiter=";")
+    logger.debug("reading %s", path_to_file)
+    with instrumentation.stage("read_ic_csv", sample=path_to_file):
+        df = pd.read_csv(path_to_file, delimiter=";")
     idx = df["Ident"].iloc[0]
     idx = idx.split("pos")[1]
     idx = int(idx)
@@ -54,29 +66,192 @@ def open_ic_file(path_to_file):
     return df
 
 
-def open_list_of_ic_files(parent_dir):
-    """Opens a list of ic files.
+def open_list_of_ic_files(
+    parent_dir,
+    workers=None,
+    return_errors=False,
+    columns=None,
+    dtypes=None,
+):
+    """Opens a list of ic files, with explicit column types: IC_DTYPES for
+    the text columns and IC_VALUE_DTYPE for the others, so no types are
+    inferred. Save the result with save_to_dir, as Parquet by default.
 
     :param parent_dir: pathlib.Path Path to directory containing IC
         files
+    :param workers: int Number of processes used to read the files.
+        None (default) reads them serially.
+    :param return_errors: bool If True, also return a dict mapping each
+        file that could not be read to its error message. Unreadable
+        files are skipped with a warning.
+    :param columns: list of str Columns to read. None (default) reads
+        all of them. See read_ic_csv_files.
+    :param dtypes: dict Column types, overriding IC_DTYPES and
+        IC_VALUE_DTYPE. A text column not in IC_DTYPES needs to be given
+        here, otherwise its files cannot be read.
     :return:
     """
-    files = list(parent_dir.glob("*.csv"))
-    print("In open_list_of_ic_files")
-    print(files)
-    data = [open_ic_file(file) for file in files]
-    data = pd.concat(data, axis="rows")
-    data = data.sort_index()
+    files = sorted(parent_dir.glob("*.csv"))
+    return read_ic_csv_files(
+        files,
+        columns=columns,
+        dtypes=dict(IC_DTYPES, **({} if dtypes is None else dtypes)),
+        default_dtype=IC_VALUE_DTYPE,
+        workers=workers,
+        return_errors=return_errors,
+    )
+
+
+def read_ic_csv_files(
+    paths,
+    columns=None,
+    dtypes=None,
+    default_dtype=None,
+    engine=None,
+    workers=None,
+    return_errors=False,
+):
+    """Reads many ;-delimited IC export files into one DataFrame, indexed
+    by rack position like open_ic_file.
+
+    The files are read as bytes, and the files sharing a header line are
+    parsed together with a single pd.read_csv call, so thousands of small
+    exports cost about as much as one large one. The rack position is
+    extracted from every Ident with one vectorized regex. If a group of
+    files cannot be parsed together, its files are parsed one by one, so
+    that only the broken ones are skipped.
+
+    :param paths: list of pathlib.Path The files to read.
+    :param columns: list of str Columns to read; Ident is always read.
+        None (default) reads all of them.
+    :param dtypes: dict Types of columns, passed on to pd.read_csv, so
+        they are not inferred. Ident is read as str.
+    :param default_dtype: str Type of the columns not in dtypes. None
+        (default) infers their types.
+    :param engine: str pd.read_csv engine. None (default) uses
+        'pyarrow' if it is installed, and 'c' otherwise.
+    :param workers: int Number of processes used to read the files.
+        None (default) reads them serially.
+    :param return_errors: bool If True, also return a dict mapping each
+        file that could not be read to its error message. Unreadable
+        files are skipped with a warning.
+    :return: pd.DataFrame with lower-case column names, indexed by rack
+        position (index_col), in order of position and then of paths.
+    """
+    if engine is None:
+        engine = "pyarrow" if find_spec("pyarrow") else "c"
+    if columns is not None and "Ident" not in columns:
+        columns = ["Ident"] + list(columns)
+    dtypes = dict({} if dtypes is None else dtypes, Ident=str)
+
+    contents, errors = map_over_files(
+        _read_bytes, paths, workers=workers, stage="read_file"
+    )
+    groups = {}
+    for path, content in contents:
+        header, _, body = content.partition(b"\n")
+        if not body.endswith(b"\n"):
+            body += b"\n"
+        groups.setdefault(header.rstrip(b"\r"), []).append((path, body))
+
+    frames = []
+    for header, files in groups.items():
+        with instrumentation.stage("parse_ic_csv", count=len(files)):
+            try:
+                frames.append(
+                    _parse_csv_group(
+                        header, files, columns, dtypes, default_dtype, engine
+                    )
+                )
+            except Exception:
+                for path, body in files:
+                    try:
+                        frames.append(
+                            _parse_csv_group(
+                                header,
+                                [(path, body)],
+                                columns,
+                                dtypes,
+                                default_dtype,
+                                engine,
+                            )
+                        )
+                    except Exception as e:
+                        errors[path] = "{}: {}".format(type(e).__name__, e)
+
+    if len(frames) > 0:
+        data = pd.concat(frames, ignore_index=True)
+        position = data["Ident"].str.extract(POSITION_PATTERN, expand=False)
+        unpositioned = position.isna().to_numpy()
+        for path in pd.unique(data["_path"][unpositioned]):
+            errors[path] = "ValueError: Ident without 'pos<number>'"
+        keep = ~data["_path"].isin(list(errors)).to_numpy()
+        data = data[keep].drop(columns="_path")
+        data.index = pd.Index(
+            position[keep].astype(int).to_numpy(), name="index_col"
+        )
+        data = data.sort_index(kind="stable")
+        data.columns = [x.lower() for x in data.columns]
+    warn_about_errors(errors)
+    if len(frames) == 0 or len(data) == 0:
+        raise ValueError("No IC files could be read")
+    if return_errors:
+        return data, errors
+    return data
+
+
+def _read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _parse_csv_group(header, files, columns, dtypes, default_dtype, engine):
+    """Parses the bodies of files sharing header with one pd.read_csv call,
+    and records which file each row came from in a _path column."""
+    content = b"".join([header, b"\n"] + [body for _, body in files])
+    if default_dtype is not None:
+        names = [
+            name.strip().strip('"') for name in header.decode().split(";")
+        ]
+        dtypes = {name: dtypes.get(name, default_dtype) for name in names}
+    data = pd.read_csv(
+        io.BytesIO(content),
+        delimiter=";",
+        usecols=columns,
+        dtype={
+            k: v for k, v in dtypes.items() if columns is None or k in columns
+        },
+        engine=engine,
+    )
+    rows = [_count_rows(body) for _, body in files]
+    if sum(rows) != len(data):
+        raise ValueError("rows could not be matched to their files")
+    data["_path"] = np.repeat(
+        np.array([path for path, _ in files], dtype=object), rows
+    )
     return data
 
 
-def save_to_dir(data, filename, target_dir):
+def _count_rows(body):
+    return sum(1 for line in body.splitlines() if line.strip())
 
+
+def save_to_dir(data, filename, target_dir, file_format="parquet"):
+    """Saves data to target_dir/filename, as .parquet (default; with the
+    index, e.g. the rack positions, and the column types) or as .csv
+    (without the index, as before). Parquet needs pyarrow or fastparquet
+    (the parquet extra).
+    """
     if target_dir.exists():
         pass
     else:
         target_dir.mkdir()
 
-    path_out = (target_dir / filename).with_suffix(".csv")
-    data.to_csv(path_out, index=False)
+    path_out = (target_dir / filename).with_suffix("." + file_format)
+    if file_format == "csv":
+        data.to_csv(path_out, index=False)
+    elif file_format == "parquet":
+        data.to_parquet(path_out, index=True)
+    else:
+        raise ValueError("file_format must be 'csv' or 'parquet'")
     return
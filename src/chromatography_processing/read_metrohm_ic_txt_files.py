@@ -1,65 +1,179 @@
+import numpy as np
 import pandas as pd
+from functools import partial
 from pathlib import Path
 import re
 import xarray as xr
 
+from chromatography_processing.cache import (
+    ParsedFileCache,
+    read_files_with_cache,
+)
+from chromatography_processing.parallel import warn_about_errors
+from chromatography_processing.read_chromatogram import (
+    _decode_sections,
+    _encode_sections,
+    _find_section,
+    _read_chromatogram_on_grid,
+    _read_chromatogram_sections,
+    _section_to_dataframe,
+    parse_metrohm_txt_sections,
+)
+from chromatography_processing.resample import (
+    SIGNAL_DTYPE,
+    make_time_grid,
+    resample_traces,
+    time_grid_attrs,
+)
+
+
+def _rack_position(ident: str) -> int:
+    """The first number in the sample identity, e.g. 1 for 'ian_pos1'."""
+    return int(re.findall(r"\d+", ident)[0])
+
 
 def read_metrohm_ic_txt_file(path_to_data: Path) -> pd.DataFrame:
-    data = pd.read_csv(path_to_data, encoding="unicode-escape")
-    data = data.iloc[:, 0]  # convert to a series
-
-    # get rack positions
-    rack_position = data.iloc[0]
-    rack_position = re.findall(r"\d+", rack_position)
-    rack_position = int(rack_position[0])
-
-    anion_chromatogram_indices = data[
-        data.str.contains("Anion")
-    ].index.tolist()
-    cation_chromatogram_indices = data[
-        data.str.contains("Cation")
-    ].index.tolist()
-
-    an = data.iloc[
-        anion_chromatogram_indices[0] + 3 : cation_chromatogram_indices[0]
-    ]
-    an = an.str.split(pat=";", expand=True)
-    an = an.rename(columns={an.columns[0]: "time", an.columns[1]: "signal"})
-    an = an.astype(float)
+    """Reads the anion and cation chromatograms of a Metrohm .txt export,
+    with the same single pass section parser as read_chromatogram.
 
-    cat = data.iloc[
-        cation_chromatogram_indices[0] + 3 : anion_chromatogram_indices[1]
+    Returns: (an, cat, rack_position). an and cat are DataFrames of time and
+    signal; an ion type that is not in the file gives an empty DataFrame.
+    Pressure blocks are skipped.
+    """
+    header, sections = parse_metrohm_txt_sections(path_to_data)
+    an, cat = [
+        _find_section(sections, search_string)
+        for search_string in ("Anion", "Cation")
+    ]
+    if an is None and cat is None:
+        raise ValueError(
+            "No anion or cation chromatogram found in {}".format(path_to_data)
+        )
+    an, cat = [
+        (
+            pd.DataFrame(columns=["time", "signal"], dtype=float)
+            if section is None
+            else _section_to_dataframe(section)
+        )
+        for section in (an, cat)
     ]
-    cat = cat.str.split(pat=";", expand=True)
-    cat = cat.rename(
-        columns={cat.columns[0]: "time", cat.columns[1]: "signal"}
+    return an, cat, _rack_position(header[1])
+
+
+def read_metrohm_ic_files_to_xarray(
+    file_paths: list,
+    workers: int = None,
+    cache: ParsedFileCache = None,
+    return_errors: bool = False,
+    time_grid: np.ndarray = None,
+    n_time_points: int = 2000,
+    dtype: str = SIGNAL_DTYPE,
+) -> xr.Dataset:
+    """Reads Metrohm .txt files into a Dataset indexed by rack position.
+
+    Every chromatogram is resampled onto one common time grid, like
+    read_chromatograms_in_folder_to_xarray does, so the Dataset is
+    (type, rack_position, time) with time the grid, rather than the union of
+    every file's times. An ion type missing from a file is NaN.
+
+    :param file_paths: list of pathlib.Path.
+
+    :param workers: int, default None.
+    Number of processes used to read the files. None reads them serially.
+
+    :param cache: ParsedFileCache, default None.
+    If given, parsed files are taken from the cache and only new or changed
+    files are parsed. Entries are shared with
+    read_chromatograms_in_folder_to_xarray.
+
+    :param return_errors: bool, default False.
+    If True, also return a dict mapping each file that could not be read to
+    its error message. Unreadable files are skipped with a warning.
+
+    :param time_grid: np.ndarray, default None.
+    The times (in minutes) that every chromatogram is resampled onto. If
+    given, each file is resampled as soon as it is read. If None,
+    n_time_points evenly spaced points spanning the earliest to the latest
+    time in the files are used.
+
+    :param n_time_points: int, default 2000.
+    Number of points in the time grid, if time_grid is not given.
+
+    :param dtype: str, default SIGNAL_DTYPE ('float32').
+    Type of the signal array.
+    """
+    resampled = time_grid is not None and cache is None
+    if time_grid is not None:
+        time_grid = np.asarray(time_grid, dtype=float)
+    if resampled:
+        read = partial(_read_chromatogram_on_grid, time_grid=time_grid)
+    else:
+        read = _read_chromatogram_sections
+    results, errors = read_files_with_cache(
+        read,
+        file_paths,
+        cache,
+        "metrohm_txt_sections",
+        _encode_sections,
+        _decode_sections,
+        workers=workers,
+        stage="read_file",
+    )
+    for path, (_, ident, _, _) in results:
+        try:
+            _rack_position(ident)
+        except IndexError:
+            errors[path] = "ValueError: no rack position in {}".format(ident)
+    results = [(p, r) for p, r in results if p not in errors]
+    warn_about_errors(errors)
+    if len(results) == 0:
+        raise ValueError("None of the files could be read")
+    results = sorted(
+        [r for _, r in results], key=lambda r: _rack_position(r[1])
+    )
+    rack_positions = [_rack_position(r[1]) for r in results]
+    if len(set(rack_positions)) < len(rack_positions):
+        raise ValueError("Files share rack positions")
+
+    if time_grid is None:
+        traces = [
+            values
+            for sections, _, _, ion_types in results
+            for (_, values), present in zip(sections, ion_types)
+            if present and len(values)
+        ]
+        time_grid = make_time_grid(
+            min(values[0, 0] for values in traces),
+            max(values[-1, 0] for values in traces),
+            n_time_points,
+        )
+        del traces
+
+    signal = np.empty((2, len(results), time_grid.size), dtype=dtype)
+    if resampled:
+        for i, (signals, _, _, _) in enumerate(results):
+            signal[:, i] = signals
+    else:
+        traces = [r[0][ion][1] for ion in range(2) for r in results]
+        resample_traces(
+            traces, time_grid, out=signal.reshape(-1, time_grid.size)
+        )
+    for i, (_, _, _, ion_types) in enumerate(results):
+        for ion, present in enumerate(ion_types):
+            if not present:
+                signal[ion, i] = np.nan
+
+    data = xr.Dataset(
+        {"signal": (("type", "rack_position", "time"), signal)},
+        coords={
+            "type": np.array(["anion", "cation"]),
+            "rack_position": rack_positions,
+            "time": time_grid,
+        },
+        attrs=time_grid_attrs(time_grid),
     )
-    cat = cat.astype(float)
-
-    return an, cat, rack_position
-
-
-def read_metrohm_ic_files_to_xarray(file_paths: list) -> xr.Dataset:
-    anion_dfs, cation_dfs = [], []
-    for file in file_paths:
-        anion_df, cation_df, rack_position = read_metrohm_ic_txt_file(file)
-
-        cation_df["rack_position"] = rack_position
-        anion_df["rack_position"] = rack_position
-        anion_dfs.append(anion_df)
-        cation_dfs.append(cation_df)
-
-    anion_df = pd.concat(anion_dfs)
-    cation_df = pd.concat(cation_dfs)
-    # anion_df = anion_df.rename(columns={'signal':'anion_signal'})
-    # cation_df = cation_df.rename(columns={'signal':'cation_signal'})
-    anion_df["type"] = "anion"
-    cation_df["type"] = "cation"
-    anion_df = anion_df.set_index(["type", "rack_position", "time"])
-    cation_df = cation_df.set_index(["type", "rack_position", "time"])
-    anion_data = anion_df.to_xarray()
-    cation_data = cation_df.to_xarray()
-    data = xr.concat([anion_data, cation_data], dim="type", join="outer")
+    if return_errors:
+        return data, errors
     return data
 
 
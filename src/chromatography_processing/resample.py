@@ -0,0 +1,101 @@
+import numpy as np
+
+# dtype of the signal arrays of datasets built by the readers. Conductivity
+# is measured to far fewer digits than float32 holds, and float32 halves
+# the memory of every (ion_type, measurement_time, time) array; baselines
+# and peaks are still computed in float64, one block of samples at a time.
+SIGNAL_DTYPE = "float32"
+
+
+def make_time_grid(
+    t_min: float, t_max: float, n_points: int = 2000
+) -> np.ndarray:
+    """Returns n_points evenly spaced times from t_min to t_max inclusive."""
+    return np.linspace(t_min, t_max, n_points)
+
+
+def time_grid_attrs(time_grid: np.ndarray) -> dict:
+    """Describes a time grid, for recording in Dataset attrs."""
+    return {
+        "time_grid_start": float(time_grid[0]),
+        "time_grid_stop": float(time_grid[-1]),
+        "time_grid_points": int(time_grid.size),
+    }
+
+
+def resample_traces(
+    traces: list,
+    time_grid: np.ndarray,
+    out: np.ndarray = None,
+    batch_size: int = 512,
+) -> np.ndarray:
+    """Linearly interpolates many traces onto one time grid.
+
+    Equivalent to calling np.interp(time_grid, t, y, left=nan, right=nan)
+    for each trace, but the traces are concatenated and interpolated
+    together with one searchsorted call per batch. Each trace's times are
+    shifted by a multiple of the grid span so that the concatenation is
+    sorted and no trace can see its neighbours' points.
+
+    :param traces: list of np.ndarray.
+    Each trace is an (n, 2) array of increasing times and signal values.
+    Traces may have different lengths.
+
+    :param time_grid: np.ndarray.
+    The increasing times to interpolate onto.
+
+    :param out: np.ndarray, default None.
+    Array of shape (len(traces), time_grid.size) to write the result into.
+
+    :param batch_size: int, default 512.
+    Number of traces interpolated per vectorized call. Bounds the size of
+    the temporary (batch_size, time_grid.size) index arrays.
+
+    Returns: np.ndarray of shape (len(traces), time_grid.size). Grid points
+    outside a trace's measured times are NaN.
+    """
+    time_grid = np.asarray(time_grid, dtype=float)
+    if out is None:
+        out = np.empty((len(traces), time_grid.size))
+    for first in range(0, len(traces), batch_size):
+        batch = traces[first : first + batch_size]
+        _resample_batch(batch, time_grid, out[first : first + len(batch)])
+    return out
+
+
+def _resample_batch(traces: list, time_grid: np.ndarray, out: np.ndarray):
+    lengths = np.array([len(trace) for trace in traces])
+    out[:] = np.nan
+    if lengths.sum() == 0 or time_grid.size == 0:
+        return
+    times = np.concatenate([trace[:, 0] for trace in traces if len(trace)])
+    values = np.concatenate([trace[:, 1] for trace in traces if len(trace)])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    low = min(times.min(), time_grid[0])
+    step = max(times.max(), time_grid[-1]) - low + 1.0
+    offsets = np.arange(len(traces)) * step
+    shifted_times = (times - low) + np.repeat(offsets, lengths)
+    shifted_grid = (time_grid - low)[None, :] + offsets[:, None]
+
+    # index of the last measured time at or before each grid point
+    left = np.searchsorted(shifted_times, shifted_grid, side="right") - 1
+    last = (ends - 1)[:, None]
+    inside = (left >= starts[:, None]) & (
+        (left < last) | (shifted_grid == shifted_times[np.maximum(left, 0)])
+    )
+    left = np.where(inside, left, 0)
+    right = np.minimum(left + 1, np.broadcast_to(last, left.shape))
+
+    x = np.broadcast_to(time_grid, left.shape)
+    dx = times[right] - times[left]
+    slope = np.divide(
+        values[right] - values[left],
+        dx,
+        out=np.zeros(left.shape),
+        where=dx != 0,
+    )
+    result = values[left] + slope * (x - times[left])
+    out[inside] = result[inside]
+    return
@@ -0,0 +1,160 @@
+"""Staging raw instrument exports into a working folder without copying
+them when the filesystem allows it, and remembering what was staged so that
+later runs only stage new or changed files."""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from chromatography_processing.parallel import warn_about_errors
+
+MANIFEST_NAME = "manifest.json"
+MODES = ("link", "reflink", "copy")
+# ioctl request to clone a file on Linux filesystems such as Btrfs and XFS
+FICLONE = 0x40049409
+
+
+def _sha1(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _reflink(src: Path, dest: Path):
+    """Makes dest a copy-on-write clone of src. Raises OSError where that is
+    not supported."""
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks are only supported on Linux")
+    import fcntl
+
+    with open(src, "rb") as source, open(dest, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dest)
+            raise
+    shutil.copystat(src, dest)
+
+
+def _stage_file(src: Path, dest: Path, mode: str) -> str:
+    """Stages src as dest with the cheapest method mode allows, falling back
+    from a hard link to a reflink to a copy. Returns the method used."""
+    if dest.exists() or dest.is_symlink():
+        dest.unlink()
+    if mode == "link":
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError:
+            pass
+    if mode in ("link", "reflink"):
+        try:
+            _reflink(src, dest)
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copy2(src, dest)
+    return "copy"
+
+
+def read_manifest(folder: Path) -> dict:
+    """Returns the manifest of a staging folder, or {} if it has none."""
+    try:
+        with open(Path(folder) / MANIFEST_NAME) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(folder: Path, manifest: dict):
+    path = Path(folder) / MANIFEST_NAME
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(partial, path)
+
+
+def stage_files(
+    paths: list,
+    destination: Path,
+    mode: str = "link",
+    workers: int = 8,
+    return_errors: bool = False,
+) -> list:
+    """Stages files into destination, skipping those already staged from an
+    unchanged source.
+
+    A manifest (manifest.json in destination) records the size,
+    modification time and sha1 hash of each staged source and how it was
+    staged. A file is staged again if its size or modification time differ
+    from the manifest, or if its staged copy is missing.
+
+    Hard links share their data with the source, so a source rewritten in
+    place also changes its staged file. Use mode='reflink' or 'copy' if the
+    instrument does that.
+
+    :param paths: list of pathlib.Path. The files to stage. Their names
+        must be unique.
+    :param destination: pathlib.Path. The staging folder. Created if it
+        does not exist.
+    :param mode: str, default 'link'. 'link' tries a hard link, then a
+        reflink, then a copy; 'reflink' tries a reflink, then a copy; 'copy'
+        always copies.
+    :param workers: int, default 8. Number of threads staging and hashing
+        files.
+    :param return_errors: bool, default False. If True, also return a dict
+        mapping each file that could not be staged to its error message.
+        Either way, such files are skipped with a warning.
+    :return: list of the staged paths in destination that are new or were
+        staged again.
+    """
+    if mode not in MODES:
+        raise ValueError("mode must be one of {}".format(MODES))
+    destination = Path(destination)
+    destination.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(destination)
+
+    def stage(src: Path):
+        stat = src.stat()
+        dest = destination / src.name
+        entry = manifest.get(src.name, {})
+        if (
+            dest.exists()
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            return None
+        method = _stage_file(src, dest, mode)
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": _sha1(dest),
+            "method": method,
+        }
+
+    paths = [Path(path) for path in paths]
+    staged, errors = [], {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(stage, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                entry = future.result()
+            except OSError as e:
+                errors[path] = "{}: {}".format(type(e).__name__, e)
+                continue
+            if entry is not None:
+                manifest[path.name] = entry
+                staged.append(destination / path.name)
+    if staged:
+        _write_manifest(destination, manifest)
+    warn_about_errors(errors)
+    if return_errors:
+        return staged, errors
+    return staged
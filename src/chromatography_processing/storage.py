@@ -0,0 +1,171 @@
+"""Saving processed datasets to, and opening them from, chunked and
+compressed Zarr stores or netCDF4 files.
+
+zarr and netCDF4 (or h5netcdf) are optional dependencies, imported by xarray
+only when a dataset is saved or opened in that format.
+"""
+
+from importlib.util import find_spec
+from pathlib import Path
+import warnings
+
+import xarray as xr
+
+ENGINES = {
+    "zarr": ("zarr",),
+    "netcdf4": ("netCDF4",),
+    "h5netcdf": ("h5netcdf",),
+}
+# variables stored as float32 by default, chunked along measurement_time
+SIGNAL_VARIABLES = ("signal", "background", "reduced_signal")
+
+
+def _infer_engine(path: Path, engine: str = None) -> str:
+    if engine is None:
+        if path.suffix == ".zarr":
+            engine = "zarr"
+        elif path.suffix in (".nc", ".nc4", ".h5"):
+            engine = "netcdf4" if find_spec("netCDF4") else "h5netcdf"
+        else:
+            raise ValueError(
+                "cannot tell the format of {}, pass engine".format(path)
+            )
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}".format(list(ENGINES)))
+    for module in ENGINES[engine]:
+        if find_spec(module) is None:
+            raise ImportError(
+                "saving or opening with engine='{}' needs the {} "
+                "package".format(engine, module)
+            )
+    return engine
+
+
+def _drop_object_variables(data: xr.Dataset) -> xr.Dataset:
+    """Drops variables holding python objects other than strings, such as
+    the chromatogram variable, which cannot be stored."""
+    dropped = [
+        name
+        for name, variable in data.variables.items()
+        if variable.dtype == object
+        and variable.size > 0
+        and not all(isinstance(v, str) for v in variable.values.flat)
+    ]
+    if dropped:
+        warnings.warn(
+            "not saving object variable(s) {}".format(", ".join(dropped))
+        )
+    return data.drop_vars(dropped)
+
+
+def _encoding(
+    data: xr.Dataset,
+    engine: str,
+    samples_per_chunk: int,
+    dtype: str,
+    compression_level: int,
+) -> dict:
+    encoding = {}
+    for name, variable in data.data_vars.items():
+        if variable.dtype.kind != "f":
+            continue
+        chunks = tuple(
+            min(samples_per_chunk, size) if dim == "measurement_time" else size
+            for dim, size in variable.sizes.items()
+        )
+        if 0 in chunks:
+            continue
+        var_encoding = {}
+        if name in SIGNAL_VARIABLES and dtype is not None:
+            var_encoding["dtype"] = dtype
+        if engine == "zarr":
+            var_encoding["chunks"] = chunks
+        else:
+            var_encoding.update(
+                zlib=True,
+                complevel=compression_level,
+                shuffle=True,
+                chunksizes=chunks,
+            )
+        encoding[name] = var_encoding
+    return encoding
+
+
+def _rechunk_to_encoding(data: xr.Dataset, encoding: dict) -> xr.Dataset:
+    """Rechunks dask backed variables, e.g. from reading a folder with
+    chunks, to the chunks they are stored in, since a stored chunk may not
+    span several dask chunks."""
+    for name, var_encoding in encoding.items():
+        variable = data[name].variable
+        if variable.chunks is None:
+            continue
+        chunks = var_encoding.get("chunks", var_encoding.get("chunksizes"))
+        data[name] = data[name].chunk(dict(zip(variable.dims, chunks)))
+    return data
+
+
+def save_dataset(
+    data: xr.Dataset,
+    path,
+    engine: str = None,
+    samples_per_chunk: int = 64,
+    dtype: str = "float32",
+    compression_level: int = 4,
+) -> None:
+    """Saves a processed dataset, e.g. from
+    read_chromatograms_in_folder_to_xarray and
+    fit_dataset_with_custom_bc_baseline, so it can be opened lazily with
+    open_dataset.
+
+    Float variables are stored compressed, in chunks of samples_per_chunk
+    along measurement_time and whole along the other dimensions, so reading
+    a few samples only reads their chunks. Lazy (dask backed) variables are
+    rechunked to match before they are written. Object variables other than
+    strings (e.g. chromatogram) are left out with a warning. An existing
+    store or file at path is overwritten.
+
+    :param data: xr.Dataset, the dataset to save.
+    :param path: str or Path, ending in .zarr for a Zarr store or .nc for
+        a netCDF4 file, unless engine is given.
+    :param engine: str, default None. 'zarr', 'netcdf4' or 'h5netcdf'.
+    :param samples_per_chunk: int, default 64. Chunk length along
+        measurement_time.
+    :param dtype: str, default 'float32'. Storage type of signal,
+        background and reduced_signal. None keeps their own type.
+    :param compression_level: int, default 4. zlib level for netCDF4.
+        Zarr uses its default compressor.
+    """
+    path = Path(path)
+    engine = _infer_engine(path, engine)
+    data = _drop_object_variables(data)
+    encoding = _encoding(
+        data, engine, samples_per_chunk, dtype, compression_level
+    )
+    data = _rechunk_to_encoding(data, encoding)
+    if engine == "zarr":
+        data.to_zarr(path, mode="w", encoding=encoding)
+    else:
+        data.to_netcdf(path, engine=engine, encoding=encoding)
+    return
+
+
+def open_dataset(path, engine: str = None, chunks=None) -> xr.Dataset:
+    """Opens a dataset saved with save_dataset without reading its values.
+    They are read when used, so selecting a few samples of a large archive
+    only reads those.
+
+    :param path: str or Path, as passed to save_dataset.
+    :param engine: str, default None. 'zarr', 'netcdf4' or 'h5netcdf'.
+    :param chunks: default None. Passed on to xr.open_dataset, e.g. {} to
+        get dask arrays with the stored chunks (needs dask).
+    :return: xr.Dataset
+    """
+    path = Path(path)
+    engine = _infer_engine(path, engine)
+    data = xr.open_dataset(path, engine=engine, chunks=chunks)
+    # strings come back as python strings from some engines; the readers
+    # give ident and ion_type as compact fixed width strings
+    for name in ("ident", "ion_type"):
+        if name in data.coords and data[name].dtype == object:
+            data.coords[name] = data[name].astype(str)
+    return data
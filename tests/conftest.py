@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+datapath = (
+    Path(__file__).parent.parent
+    / "tests"
+    / "metrohm_ic_test_files"
+    / "ancat_chromatogram.txt"
+)
+
+
+@pytest.fixture
+def make_chromatogram_folder(tmp_path):
+    """Returns a function that fills a folder with copies of the test
+    chromatogram, each with its own measurement time and ident."""
+
+    def make_folder(n_files: int, folder: Path = tmp_path, start: int = 0):
+        folder.mkdir(parents=True, exist_ok=True)
+        lines = datapath.read_text(encoding="latin-1").splitlines()
+        for i in range(start, start + n_files):
+            lines[0] = "2025-08-21 17:{:02d}:14 UTC-4".format(i)
+            lines[1] = "ian_pos{}".format(i + 1)
+            (folder / "sample_{}.txt".format(i)).write_text(
+                "\n".join(lines), encoding="latin-1"
+            )
+        return folder
+
+    return make_folder
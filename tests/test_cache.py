@@ -0,0 +1,59 @@
+import os
+
+from chromatography_processing.cache import ParsedFileCache
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+from chromatography_processing.read_metrohm_ic_txt_files import (
+    read_metrohm_ic_files_to_xarray,
+)
+
+
+def test_second_read_comes_from_cache(tmp_path, make_chromatogram_folder):
+    folder = make_chromatogram_folder(3, tmp_path / "data")
+    cache = ParsedFileCache(tmp_path / "cache")
+    first = read_chromatograms_in_folder_to_xarray(folder, cache=cache)
+    assert cache.stats["hits"] == 0
+    assert cache.stats["misses"] == 3
+
+    second = read_chromatograms_in_folder_to_xarray(folder, cache=cache)
+    assert cache.stats["hits"] == 3
+    assert cache.stats["misses"] == 3
+    assert first.identical(second)
+    assert first.identical(read_chromatograms_in_folder_to_xarray(folder))
+
+
+def test_only_new_or_changed_files_are_parsed(
+    tmp_path, make_chromatogram_folder
+):
+    folder = make_chromatogram_folder(2, tmp_path / "data")
+    cache = ParsedFileCache(tmp_path / "cache")
+    read_chromatograms_in_folder_to_xarray(folder, cache=cache)
+
+    make_chromatogram_folder(1, folder, start=2)
+    changed = folder / "sample_0.txt"
+    os.utime(changed, ns=(0, changed.stat().st_mtime_ns + 10**9))
+    data = read_chromatograms_in_folder_to_xarray(folder, cache=cache)
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 4
+    assert data.measurement_time.shape == (3,)
+
+
+def test_cache_is_capped_by_evicting_least_recently_used(
+    tmp_path, make_chromatogram_folder
+):
+    folder = make_chromatogram_folder(3, tmp_path / "data")
+    cache = ParsedFileCache(tmp_path / "cache", max_bytes=1)
+    read_chromatograms_in_folder_to_xarray(folder, cache=cache)
+    assert cache.stats["evictions"] == 3
+    assert cache.size() == 0
+
+
+def test_metrohm_reader_uses_cache(tmp_path, make_chromatogram_folder):
+    folder = make_chromatogram_folder(2, tmp_path / "data")
+    files = sorted(folder.glob("*.txt"))
+    cache = ParsedFileCache(tmp_path / "cache", hash_contents=True)
+    first = read_metrohm_ic_files_to_xarray(files, cache=cache)
+    second = read_metrohm_ic_files_to_xarray(files, cache=cache)
+    assert cache.stats["hits"] == 2
+    assert first.identical(second)
@@ -0,0 +1,90 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from chromatography_processing.chromatogram_plotting import (  # noqa: E402
+    decimate_min_max,
+    plot_all_from_run,
+)
+from chromatography_processing.read_chromatogram import (  # noqa: E402
+    read_chromatograms_in_folder_to_xarray,
+)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"fast": True},
+        {"fast": True, "workers": 2},
+        {"fast": True, "decimate": False},
+        {"thumbnail": True},
+    ],
+)
+def test_both_panels_are_saved_and_figures_closed(
+    tmp_path, make_chromatogram_folder, capsys, kwargs
+):
+    make_chromatogram_folder(3, folder=tmp_path / "run")
+    data = read_chromatograms_in_folder_to_xarray(
+        tmp_path / "run", n_time_points=200
+    )
+    plot_all_from_run(data, tmp_path / "plots" / "run", dpi=50, **kwargs)
+    for ion_type in ["anion", "cation"]:
+        saved = tmp_path / "plots" / "run_{}.png".format(ion_type)
+        assert saved.stat().st_size > 0
+    assert plt.get_fignums() == []
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("decimate", [True, False])
+def test_pyplot_path_is_decimated(
+    tmp_path, make_chromatogram_folder, monkeypatch, decimate
+):
+    make_chromatogram_folder(2, folder=tmp_path / "run")
+    data = read_chromatograms_in_folder_to_xarray(
+        tmp_path / "run", n_time_points=2000
+    )
+    drawn = []
+    plot = matplotlib.axes.Axes.plot
+
+    def counting_plot(ax, x, *args, **kwargs):
+        drawn.append(len(x))
+        return plot(ax, x, *args, **kwargs)
+
+    monkeypatch.setattr(matplotlib.axes.Axes, "plot", counting_plot)
+    plot_all_from_run(
+        data, tmp_path / "plots" / "run", dpi=50, decimate=decimate
+    )
+    assert len(drawn) == 4
+    # the axes of a 6.4 inch wide figure at 50 dpi are about 250 pixels
+    if decimate:
+        assert max(drawn) <= 2 * 250
+    else:
+        assert max(drawn) == 2000
+
+
+def test_decimation_keeps_the_extremes_in_order():
+    time = np.linspace(0, 16, 9601)
+    rng = np.random.default_rng(0)
+    signal = rng.normal(size=(3, time.size))
+    signal[1, 5000] = 50
+    signal[2, :100] = np.nan
+    t, y = decimate_min_max(time, signal, 500)
+    assert t.shape == y.shape == (3, 2 * 481)
+    np.testing.assert_array_equal(np.nanmax(y, axis=1), np.nanmax(signal, 1))
+    np.testing.assert_array_equal(np.nanmin(y, axis=1), np.nanmin(signal, 1))
+    assert (np.diff(t, axis=1) >= 0).all()
+    assert t[1, np.argmax(y[1])] == time[5000]
+    # a bin without numbers stays NaN
+    assert np.isnan(y[2, :10]).all() and not np.isnan(y[2, 10:]).any()
+
+
+def test_short_traces_are_not_decimated():
+    time = np.arange(10.0)
+    t, y = decimate_min_max(time, time[None], 5)
+    np.testing.assert_array_equal(y, time[None])
+    np.testing.assert_array_equal(t, time[None])
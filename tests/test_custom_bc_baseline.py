@@ -0,0 +1,228 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from chromatography_processing import custom_bc_baseline
+from chromatography_processing.custom_bc_baseline import (
+    SOLVER_CACHE_SIZE,
+    clear_solver_cache,
+    find_custom_bc_baseline,
+    fit_custom_bc_baseline_block,
+    fit_dataset_with_custom_bc_baseline,
+    solver_cache_info,
+    sweep_custom_bc_baseline,
+)
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+
+x = np.linspace(0, 16, 800)
+rng = np.random.default_rng(1)
+block = np.array(
+    [
+        1 + 0.05 * x + np.exp(-0.5 * ((x - centre) / 0.05) ** 2)
+        for centre in rng.uniform(2, 14, 5)
+    ]
+)
+block += rng.normal(0, 1e-3, block.shape)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"crossover_index_number": 5, "lam": 1e5, "lam_flexible": 1e3},
+        {"crossover_index_number": 0, "lam": 0, "sampling": 1},
+    ],
+)
+def test_block_fit_matches_find_custom_bc_baseline(params):
+    data = block.copy()
+    data[2, :25] = np.nan
+    actual = fit_custom_bc_baseline_block(x, data, **params)
+    for row, y in enumerate(data):
+        finite = np.isfinite(y)
+        expected, _ = find_custom_bc_baseline(
+            pd.DataFrame({"time": x[finite], "signal": y[finite]}), **params
+        )
+        np.testing.assert_allclose(actual[row][finite], expected, rtol=1e-9)
+        assert np.isnan(actual[row][~finite]).all()
+
+
+def test_unchecked_pybaselines_version_falls_back_to_custom_bc(
+    monkeypatch,
+):
+    data = block.copy()
+    data[2, :25] = np.nan
+    params = {"crossover_index_number": 5, "lam": 1e5, "lam_flexible": 1e3}
+    expected = fit_custom_bc_baseline_block(x, data, **params)
+    monkeypatch.setattr(custom_bc_baseline, "CUSTOM_BC_VERSIONS", ())
+    with pytest.warns(UserWarning, match="custom_bc one sample at a time"):
+        actual = fit_custom_bc_baseline_block(x, data, **params)
+    np.testing.assert_allclose(actual, expected, rtol=1e-9)
+    assert np.isnan(actual[2, :25]).all()
+
+
+def test_dataset_gets_background_and_reduced_signal(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(3)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    data = fit_dataset_with_custom_bc_baseline(
+        data, (0.5, 15), (0.5, 7.5), lam=1e5, lam_flexible=1e4
+    )
+    assert data.background.dims == data.signal.dims
+    anion = data.background.sel(ion_type="anion")
+    assert anion.sel(time=slice(0.5, 15)).notnull().all()
+    assert anion.sel(time=slice(None, 0.49)).isnull().all()
+    cation = data.background.sel(ion_type="cation")
+    assert cation.sel(time=slice(7.51, None)).isnull().all()
+    expected = data.signal - data.background
+    assert data.reduced_signal.equals(expected)
+
+
+def test_dask_backed_dataset_is_fitted_lazily(
+    tmp_path, make_chromatogram_folder
+):
+    pytest.importorskip("dask")
+    make_chromatogram_folder(3)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    kwargs = {"lam": 1e5, "lam_flexible": 1e4}
+    expected = fit_dataset_with_custom_bc_baseline(
+        data.copy(), (0.5, 15), (0.5, 7.5), **kwargs
+    )
+    lazy = fit_dataset_with_custom_bc_baseline(
+        data.chunk({"measurement_time": 2}), (0.5, 15), (0.5, 7.5), **kwargs
+    )
+    assert lazy.background.chunks is not None
+    xr.testing.assert_allclose(
+        lazy.compute(), expected, rtol=1e-12, atol=1e-12
+    )
+
+
+def test_block_fit_in_process_pool_is_identical_to_serial():
+    data = np.repeat(block, 3, axis=0)
+    data[4, -10:] = np.nan
+    params = {"crossover_index_number": 5, "lam": 1e5, "lam_flexible": 1e3}
+    serial = fit_custom_bc_baseline_block(x, data, **params)
+    parallel = fit_custom_bc_baseline_block(x, data, workers=2, **params)
+    np.testing.assert_array_equal(serial, parallel)
+
+
+class CountingExecutor(Executor):
+    """An executor that is not a ProcessPoolExecutor, counting the chunks
+    submitted to it."""
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        return self.pool.submit(fn, *args, **kwargs)
+
+
+def test_block_fit_chunks_follow_workers_with_any_executor():
+    data = np.repeat(block, 3, axis=0)
+    params = {"crossover_index_number": 5, "lam": 1e5, "lam_flexible": 1e3}
+    serial = fit_custom_bc_baseline_block(x, data, **params)
+    executor = CountingExecutor()
+    parallel = fit_custom_bc_baseline_block(
+        x, data, workers=2, executor=executor, **params
+    )
+    np.testing.assert_array_equal(serial, parallel)
+    assert executor.submitted == 8
+
+
+def test_solver_cache_reuses_plans_for_the_same_grid():
+    clear_solver_cache()
+    params = {"crossover_index_number": 5, "lam": 1e5, "lam_flexible": 1e3}
+    first = fit_custom_bc_baseline_block(x, block, **params)
+    second = fit_custom_bc_baseline_block(x, block, **params)
+    np.testing.assert_array_equal(first, second)
+    assert solver_cache_info()["misses"] == 1
+    assert solver_cache_info()["hits"] == 1
+
+    fit_custom_bc_baseline_block(x, block, **dict(params, lam=1e6))
+    assert solver_cache_info()["misses"] == 2
+
+    df = pd.DataFrame({"time": x, "signal": block[0]})
+    find_custom_bc_baseline(df)
+    find_custom_bc_baseline(df, lam=1e6)
+    assert solver_cache_info() == {
+        "hits": 2,
+        "misses": 3,
+        "size": 3,
+        "max_size": SOLVER_CACHE_SIZE,
+    }
+
+
+def test_sweep_matches_fitting_each_combination(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(2)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path, n_time_points=300)
+    time_ranges = ((0.5, 15), (0.5, 7.5))
+    sweep = sweep_custom_bc_baseline(
+        data, *time_ranges, lam=[1e4, 1e6], lam_flexible=[1e3, 1e5, 1e7]
+    )
+    assert sweep.residual.dims == (
+        "crossover_index_number",
+        "lam",
+        "lam_flexible",
+        "sampling",
+        "ion_type",
+        "measurement_time",
+    )
+    assert sweep.background.shape == (1, 2, 3, 1) + data.signal.shape
+
+    fitted = fit_dataset_with_custom_bc_baseline(
+        data.copy(), *time_ranges, lam=1e6, lam_flexible=1e3
+    )
+    from_sweep = sweep.background.sel(lam=1e6, lam_flexible=1e3).squeeze(
+        ["crossover_index_number", "sampling"], drop=True
+    )
+    np.testing.assert_array_equal(from_sweep.values, fitted.background.values)
+    assert (sweep.roughness >= 0).all()
+    assert (sweep.residual >= 0).all()
+
+    parallel = sweep_custom_bc_baseline(
+        data,
+        *time_ranges,
+        lam=[1e4, 1e6],
+        lam_flexible=[1e3, 1e5, 1e7],
+        keep_background=False,
+        workers=2,
+    )
+    assert "background" not in parallel
+    xr.testing.assert_identical(parallel.residual, sweep.residual)
+
+
+def test_float32_signals_are_fitted_in_float64(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(3)
+    kwargs = {"lam": 1e5, "lam_flexible": 1e4}
+    data = fit_dataset_with_custom_bc_baseline(
+        read_chromatograms_in_folder_to_xarray(tmp_path),
+        (0.5, 15),
+        (0.5, 7.5),
+        **kwargs,
+    )
+    full = fit_dataset_with_custom_bc_baseline(
+        read_chromatograms_in_folder_to_xarray(tmp_path, dtype="float64"),
+        (0.5, 15),
+        (0.5, 7.5),
+        **kwargs,
+    )
+    for name in ("signal", "background", "reduced_signal"):
+        assert data[name].dtype == np.float32
+    np.testing.assert_allclose(
+        data.background, full.background, rtol=1e-5, atol=1e-5
+    )
+    # three float32 (ion_type, time) arrays per sample
+    n_samples, n_times = data.sizes["measurement_time"], data.sizes["time"]
+    per_sample = (data.nbytes - data.time.nbytes) / n_samples
+    assert per_sample <= 3 * 2 * n_times * 4 + 128
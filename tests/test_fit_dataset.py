@@ -0,0 +1,236 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from chromatography_processing.fit_chromatogram import (
+    _skewnorms_and_jacobian,
+    fit_skewnorm_peaks,
+    skewnorm,
+)
+from chromatography_processing import fit_dataset
+from chromatography_processing.fit_dataset import (
+    PEAK_VARIABLES,
+    fit_chromatograms_for_dataset,
+    fit_chromatograms_for_ion_type,
+    make_chromatogram,
+    make_chromatograms_for_dataset,
+    peak_table_to_dataframe,
+    unpack_chromatogram_of_single_sample,
+)
+
+FIT_KWARGS = {"verbose": False, "approx_peak_width": 0.5}
+WINDOWS = [(3.0, 5.0), (8.0, 10.0)]
+
+
+def make_dataset(n_samples=3, peak_times=(4.0, 9.0)):
+    time = np.linspace(0, 16, 1600)
+    signal = np.zeros((2, n_samples, time.size))
+    for t in peak_times:
+        signal += np.exp(-0.5 * ((time - t) / 0.1) ** 2)
+    return xr.Dataset(
+        {
+            "reduced_signal": (
+                ("ion_type", "measurement_time", "time"),
+                signal,
+            )
+        },
+        coords={
+            "ion_type": ["anion", "cation"],
+            "measurement_time": pd.date_range(
+                "2025-08-21", periods=n_samples, freq="20min"
+            ),
+            "time": time,
+            "ident": (
+                "measurement_time",
+                ["ian_pos{}".format(i) for i in range(n_samples)],
+            ),
+        },
+    )
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_failed_sample_does_not_stop_the_others(workers):
+    data = make_dataset()
+    data["reduced_signal"][0, 1] = np.nan
+    fitted = fit_chromatograms_for_ion_type(
+        data, "anion", fit_kwargs=FIT_KWARGS, workers=workers
+    )
+    assert list(fitted.fit_status.values) == ["ok", "error", "ok"]
+    assert fitted.fit_error.values[0] == ""
+    assert fitted.sizes["peak"] == 4
+    assert (
+        list(fitted.peak_ident.values) == ["ian_pos0"] * 2 + ["ian_pos2"] * 2
+    )
+    peaks = fitted.where(fitted.peak_ident == "ian_pos2", drop=True)
+    np.testing.assert_allclose(peaks.retention_time, [4.0, 9.0], atol=0.02)
+
+
+def _fit_chain_or_crash(samples, fit_kwargs, timeout):
+    """Stands in for the hplc chain fit, killing its worker process on a
+    sample without signal, as the OOM killer or a segfault would."""
+    outcomes = []
+    for _, signal in samples:
+        if not signal.any():
+            os._exit(1)
+        peaks = {name: np.array([1.0]) for name in PEAK_VARIABLES}
+        outcomes.append(("ok", dict(peaks, peak_id=np.array([1])), "", None))
+    return outcomes
+
+
+def test_worker_crash_only_fails_its_own_sample(monkeypatch):
+    monkeypatch.setattr(fit_dataset, "_fit_hplc_chain", _fit_chain_or_crash)
+    data = make_dataset(n_samples=6)
+    data["reduced_signal"][0, 2] = 0
+    fitted = fit_chromatograms_for_dataset(data, retry_kwargs={}, workers=2)
+    status = fitted.fit_status.sel(ion_type="anion").values
+    assert list(status) == ["ok", "ok", "error"] + ["ok"] * 3
+    assert "BrokenProcessPool" in fitted.fit_error.values[0, 2]
+    # the retry pass and the cation fits use the restarted pool
+    assert (fitted.fit_status.sel(ion_type="cation") == "ok").all()
+    assert fitted.sizes["peak"] == 11
+
+
+def test_failed_samples_are_retried_with_relaxed_settings():
+    data = make_dataset(n_samples=1)
+    fitted = fit_chromatograms_for_ion_type(
+        data,
+        "anion",
+        fit_kwargs=dict(FIT_KWARGS, approx_peak_width=1e-6),
+        retry_kwargs={"approx_peak_width": 0.5},
+    )
+    assert list(fitted.fit_status.values) == ["ok_after_retry"]
+
+
+def test_slow_sample_times_out():
+    data = make_dataset(n_samples=1)
+    fitted = fit_chromatograms_for_ion_type(
+        data, "anion", fit_kwargs=FIT_KWARGS, timeout=1e-3
+    )
+    assert list(fitted.fit_status.values) == ["timeout"]
+
+
+def test_dataset_is_fitted_for_both_ion_types():
+    fitted = fit_chromatograms_for_dataset(
+        make_dataset(n_samples=2), fit_kwargs=FIT_KWARGS
+    )
+    assert fitted.fit_status.dims == ("ion_type", "measurement_time")
+    assert (fitted.fit_status == "ok").all()
+    assert fitted.retention_time.dims == ("peak",)
+    assert list(fitted.peak_ion_type.values) == ["anion"] * 4 + ["cation"] * 4
+
+
+def test_peak_table_to_dataframe():
+    data = make_dataset(n_samples=2)
+    fitted = fit_chromatograms_for_ion_type(
+        data, "anion", fit_kwargs=FIT_KWARGS
+    )
+    df = peak_table_to_dataframe(fitted)
+    assert list(df.columns) == [
+        "ion_type",
+        "measurement_time",
+        "ident",
+        "peak_id",
+        "retention_time",
+        "area",
+        "amplitude",
+        "scale",
+        "skew",
+        "signal_maximum",
+    ]
+    assert len(df) == 4
+    assert (df.measurement_time == data.measurement_time.values[1]).sum() == 2
+
+
+def test_chromatogram_is_built_on_demand():
+    data = make_dataset(n_samples=2)
+    mt = data.measurement_time.values[1]
+    chrom = make_chromatogram(data, "cation", mt)
+    np.testing.assert_array_equal(
+        chrom.df["reduced_signal"], data.reduced_signal.values[1, 1]
+    )
+    sample = data.sel(ion_type="cation", measurement_time=mt)
+    unpacked = unpack_chromatogram_of_single_sample(sample)
+    np.testing.assert_array_equal(unpacked.df, chrom.df)
+
+
+def test_skewnorm_jacobian_matches_finite_differences():
+    t = np.linspace(0, 10, 500)
+    params = np.array([[2.0, 3.0, 0.2, 1.5], [1.0, 6.0, 0.3, -2.0]])
+    model, jac = _skewnorms_and_jacobian(t, params)
+    np.testing.assert_allclose(
+        model, skewnorm(t, *params[0]) + skewnorm(t, *params[1])
+    )
+    eps = 1e-7
+    for i in range(params.size):
+        shifted = params.ravel() + eps * np.eye(params.size)[i]
+        numeric = (
+            _skewnorms_and_jacobian(t, shifted.reshape(-1, 4))[0] - model
+        ) / eps
+        np.testing.assert_allclose(jac[:, i], numeric, atol=1e-4)
+
+
+def test_native_fit_recovers_skewed_peaks():
+    t = np.linspace(0, 16, 1600)
+    truth = np.array([[2.0, 4.0, 0.15, 2.0], [1.0, 9.0, 0.2, -1.0]])
+    signal = skewnorm(t, *truth[0]) + skewnorm(t, *truth[1])
+    peaks, params = fit_skewnorm_peaks(t, signal, WINDOWS)
+    np.testing.assert_allclose(params, truth, rtol=1e-4)
+    np.testing.assert_allclose(peaks["area"], [200.0, 100.0], rtol=1e-3)
+    # starting from the previous result converges straight away
+    _, warm = fit_skewnorm_peaks(t, signal, WINDOWS, initial_params=params)
+    np.testing.assert_allclose(warm, params, rtol=1e-6)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_native_engine_matches_hplc(workers):
+    data = make_dataset(n_samples=3)
+    native = fit_chromatograms_for_dataset(
+        data,
+        engine="native",
+        windows={"anion": WINDOWS, "cation": WINDOWS},
+        workers=workers,
+    )
+    hplc = fit_chromatograms_for_dataset(data, fit_kwargs=FIT_KWARGS)
+    assert (native.fit_status == "ok").all()
+    assert native.sizes["peak"] == hplc.sizes["peak"] == 12
+    for name in ["retention_time", "area", "scale"]:
+        np.testing.assert_allclose(native[name], hplc[name], rtol=1e-2)
+
+
+def test_native_engine_needs_windows():
+    with pytest.raises(ValueError):
+        fit_chromatograms_for_ion_type(
+            make_dataset(), "anion", engine="native"
+        )
+    with pytest.raises(ValueError):
+        fit_chromatograms_for_ion_type(make_dataset(), "anion", engine="lm")
+
+
+def test_stored_chromatograms_keep_the_peak_table():
+    fitted = fit_chromatograms_for_dataset(
+        make_dataset(n_samples=2),
+        engine="native",
+        windows={"anion": WINDOWS, "cation": WINDOWS},
+    )
+    with_chromatograms = make_chromatograms_for_dataset(fitted)
+    assert with_chromatograms.retention_time.dims == ("peak",)
+    xr.testing.assert_identical(
+        with_chromatograms.retention_time, fitted.retention_time
+    )
+
+
+def test_dask_backed_dataset_is_fitted_chunk_by_chunk():
+    pytest.importorskip("dask")
+    data = make_dataset(n_samples=3)
+    windows = {"anion": WINDOWS, "cation": WINDOWS}
+    expected = fit_chromatograms_for_dataset(
+        data, engine="native", windows=windows
+    )
+    chunked = fit_chromatograms_for_dataset(
+        data.chunk({"measurement_time": 2}), engine="native", windows=windows
+    )
+    assert chunked.reduced_signal.chunks is not None
+    xr.testing.assert_allclose(chunked.compute(), expected)
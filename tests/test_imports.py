@@ -0,0 +1,65 @@
+import subprocess
+import sys
+
+import pytest
+
+import chromatography_processing
+
+HEAVY = {"numpy", "pandas", "xarray", "scipy", "matplotlib"}
+HEAVY |= {"pybaselines", "hplc"}
+
+
+def imported_in_fresh_interpreter(statement: str) -> (float, set):
+    """Runs statement in a new interpreter, returning how long it took in
+    seconds and the top-level packages it loaded."""
+    code = (
+        "import sys, time\n"
+        "before = set(sys.modules)\n"
+        "start = time.perf_counter()\n"
+        "{}\n"
+        "seconds = time.perf_counter() - start\n"
+        "loaded = {{m.split('.')[0] for m in set(sys.modules) - before}}\n"
+        "print(seconds)\n"
+        "print(' '.join(sorted(loaded)))\n"
+    ).format(statement)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    return float(output[0]), set(output[1].split())
+
+
+def test_package_import_is_fast_and_loads_no_dependencies():
+    seconds, loaded = imported_in_fresh_interpreter(
+        "import chromatography_processing"
+    )
+    assert loaded & HEAVY == set()
+    assert seconds < 0.2
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["read_chromatogram", "fit_dataset", "custom_bc_baseline", "pipeline"],
+)
+def test_modules_do_not_load_fitting_or_plotting_libraries(module):
+    _, loaded = imported_in_fresh_interpreter(
+        "import chromatography_processing.{}".format(module)
+    )
+    assert loaded & {"hplc", "pybaselines", "matplotlib"} == set()
+
+
+def test_api_is_loaded_on_first_use():
+    from chromatography_processing import fit_dataset
+
+    assert (
+        chromatography_processing.fit_chromatograms_for_dataset
+        is fit_dataset.fit_chromatograms_for_dataset
+    )
+    assert chromatography_processing.storage.save_dataset is (
+        chromatography_processing.save_dataset
+    )
+    assert "run_pipeline" in dir(chromatography_processing)
+    with pytest.raises(AttributeError):
+        chromatography_processing.not_a_function
@@ -0,0 +1,101 @@
+import json
+import logging
+import pickle
+
+import numpy as np
+import pytest
+
+from chromatography_processing import instrumentation
+from chromatography_processing.custom_bc_baseline import (
+    fit_dataset_with_custom_bc_baseline,
+)
+from chromatography_processing.fit_dataset import (
+    fit_chromatograms_for_ion_type,
+)
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+
+
+def test_nothing_is_recorded_by_default():
+    assert instrumentation.get_recorder() is None
+    with instrumentation.stage("read") as stage:
+        pass
+    assert stage is instrumentation._NOT_RECORDED
+
+
+def test_stages_and_samples_are_recorded():
+    with instrumentation.instrument() as recorder:
+        with instrumentation.stage("read", count=3):
+            sum(range(1000))
+        for sample in ["a", "b"]:
+            with instrumentation.stage("fit_sample", sample=sample, ok=True):
+                pass
+    assert instrumentation.get_recorder() is None
+    assert [r["stage"] for r in recorder.records] == [
+        "read",
+        "fit_sample",
+        "fit_sample",
+    ]
+    record = recorder.records[1]
+    assert record["sample"] == "a"
+    assert record["ok"] is True
+    assert record["wall_s"] >= 0 and record["cpu_s"] >= 0
+    assert record["peak_rss_mb"] > 0
+    stages = recorder.stages()
+    assert stages["read"]["count"] == 3
+    assert stages["fit_sample"]["records"] == 2
+    assert len(recorder.slowest_samples(5)) == 2
+    assert "slowest samples" in recorder.summary()
+
+
+def test_records_are_exported_to_json_and_logging(tmp_path, caplog):
+    logger = logging.getLogger("timings")
+    with caplog.at_level(logging.INFO, logger="timings"):
+        with instrumentation.instrument(logger=logger) as recorder:
+            with instrumentation.stage("baseline", count=2):
+                pass
+    assert caplog.records[0].instrumentation["stage"] == "baseline"
+    recorder.to_json(tmp_path / "timings.json")
+    exported = json.loads((tmp_path / "timings.json").read_text())
+    assert exported["records"] == recorder.records
+    assert exported["stages"]["baseline"]["count"] == 2
+
+
+def test_measurements_can_be_returned_from_workers():
+    with instrumentation.Measurement() as measurement:
+        pass
+    restored = pickle.loads(pickle.dumps(measurement))
+    assert restored.wall_s == measurement.wall_s
+    total = measurement + restored
+    assert total.wall_s == pytest.approx(2 * measurement.wall_s)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_pipeline_records_every_stage(
+    tmp_path, make_chromatogram_folder, workers
+):
+    make_chromatogram_folder(3)
+    with instrumentation.instrument() as recorder:
+        data = read_chromatograms_in_folder_to_xarray(
+            tmp_path, workers=workers
+        )
+        data = fit_dataset_with_custom_bc_baseline(
+            data, (0.5, 15), (0.5, 7.5), lam=1e5, lam_flexible=1e4
+        )
+        data["reduced_signal"][:] = np.exp(-0.5 * ((data.time - 4) / 0.1) ** 2)
+        fit_chromatograms_for_ion_type(
+            data,
+            "anion",
+            engine="native",
+            windows=[(3, 5)],
+            workers=workers,
+        )
+    stages = recorder.stages()
+    assert stages["read_file"]["records"] == 3
+    assert stages["assemble"]["count"] == 3
+    assert stages["baseline"]["count"] == 6
+    assert stages["fit"]["count"] == 3
+    fits = [r for r in recorder.records if r["stage"] == "fit_sample"]
+    assert [r["sample"] for r in fits] == list(data.ident.values)
+    assert all(r["status"] == "ok" for r in fits)
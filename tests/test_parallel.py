@@ -0,0 +1,99 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+
+import pytest
+from chromatography_processing.parallel import (
+    RestartableProcessPool,
+    map_over_files,
+    submit_surviving_crashes,
+)
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+
+
+def _path_length(path):
+    if "bad" in str(path):
+        raise ValueError("bad file")
+    return len(str(path))
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_map_over_files_keeps_order_and_collects_errors(workers):
+    paths = ["a", "bad1", "ccc", "bad22", "eeeee", "ffffff"]
+    results, errors = map_over_files(
+        _path_length, paths, workers=workers, chunksize=2
+    )
+    assert results == [("a", 1), ("ccc", 3), ("eeeee", 5), ("ffffff", 6)]
+    assert errors == {
+        "bad1": "ValueError: bad file",
+        "bad22": "ValueError: bad file",
+    }
+
+
+def _path_length_or_crash(path):
+    if path == "crash":
+        os._exit(1)  # as if killed by the OOM killer
+    return _path_length(path)
+
+
+@pytest.mark.parametrize("chunksize", [1, 3])
+def test_worker_crash_only_loses_its_own_file(chunksize):
+    paths = ["a", "bb", "crash", "bad1", "eeeee", "ffffff", "g"]
+    results, errors = map_over_files(
+        _path_length_or_crash, paths, workers=2, chunksize=chunksize
+    )
+    assert results == [
+        ("a", 1),
+        ("bb", 2),
+        ("eeeee", 5),
+        ("ffffff", 6),
+        ("g", 1),
+    ]
+    assert list(errors) == ["crash", "bad1"]
+    assert errors["crash"].startswith("BrokenProcessPool")
+
+
+def test_folder_is_read_the_same_with_workers(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(4)
+    serial = read_chromatograms_in_folder_to_xarray(tmp_path)
+    parallel = read_chromatograms_in_folder_to_xarray(tmp_path, workers=2)
+    assert serial.identical(parallel)
+
+
+def test_unreadable_file_is_reported_not_raised(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(2)
+    (tmp_path / "broken.txt").write_text("not a chromatogram")
+    with pytest.warns(UserWarning, match="1 file"):
+        data, errors = read_chromatograms_in_folder_to_xarray(
+            tmp_path, return_errors=True
+        )
+    assert list(errors) == [tmp_path / "broken.txt"]
+    assert data.measurement_time.shape == (2,)
+
+
+def _square_or_crash(x):
+    if x == 3:
+        os._exit(1)  # as if killed by the OOM killer
+    return x * x
+
+
+@pytest.mark.parametrize(
+    "make_pool", [ProcessPoolExecutor, RestartableProcessPool]
+)
+def test_worker_crash_only_loses_its_own_call(make_pool):
+    with make_pool(2) as pool:
+        results = submit_surviving_crashes(
+            _square_or_crash, [(x,) for x in range(8)], pool, workers=2
+        )
+        assert isinstance(results[3], BrokenProcessPool)
+        assert results[:3] + results[4:] == [0, 1, 4, 16, 25, 36, 49]
+        if isinstance(pool, RestartableProcessPool):
+            # the pool was restarted and can still be used
+            assert pool.restarts > 0
+            assert pool.submit(_square_or_crash, 2).result() == 4
@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chromatography_processing.cli import main
+from chromatography_processing.custom_bc_baseline import (
+    fit_dataset_with_custom_bc_baseline,
+)
+from chromatography_processing.fit_dataset import (
+    fit_chromatograms_for_dataset,
+    peak_table_to_dataframe,
+)
+from chromatography_processing.pipeline import (
+    PEAKS_NAME,
+    PROCESSED_NAME,
+    SAMPLES_NAME,
+    run_pipeline,
+    time_grid_from_file,
+    watch_folder,
+)
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+
+TIME_RANGES = ((0.5, 15), (0.5, 7.5))
+BASELINE_KWARGS = {"lam": 1e5, "lam_flexible": 1e4}
+WINDOWS = {"anion": [(3.0, 4.0)], "cation": [(4.5, 5.5)]}
+
+
+@pytest.fixture
+def exports(tmp_path, make_chromatogram_folder):
+    return make_chromatogram_folder(5, tmp_path / "exports")
+
+
+def run(paths, output, **kwargs):
+    return run_pipeline(
+        paths,
+        output,
+        *TIME_RANGES,
+        baseline_kwargs=BASELINE_KWARGS,
+        engine="native",
+        windows=WINDOWS,
+        **kwargs,
+    )
+
+
+def test_pipeline_matches_the_stages_run_by_hand(exports, tmp_path):
+    paths = sorted(exports.glob("*.txt"))
+    done = run(paths, tmp_path / "out", batch_size=len(paths))
+    assert done == paths
+
+    data = read_chromatograms_in_folder_to_xarray(
+        exports, time_grid=time_grid_from_file(paths[0])
+    )
+    data = fit_dataset_with_custom_bc_baseline(
+        data, *TIME_RANGES, **BASELINE_KWARGS
+    )
+    data = fit_chromatograms_for_dataset(
+        data, engine="native", windows=WINDOWS
+    )
+    expected = peak_table_to_dataframe(data)
+    peaks = pd.read_csv(tmp_path / "out" / PEAKS_NAME)
+    np.testing.assert_allclose(peaks.area, expected.area)
+    assert list(peaks.ident) == list(expected.ident)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_batches_are_appended_and_not_processed_again(
+    exports, tmp_path, workers
+):
+    paths = sorted(exports.glob("*.txt"))
+    output = tmp_path / "out"
+    done = run(paths, output, batch_size=2, queue_size=1, workers=workers)
+    assert sorted(done) == paths
+    samples = pd.read_csv(output / SAMPLES_NAME)
+    assert len(samples) == 2 * len(paths)
+    assert set(samples.ident) == {"ian_pos{}".format(i) for i in range(1, 6)}
+    processed = (output / PROCESSED_NAME).read_text().split()
+    assert sorted(processed) == [p.name for p in paths]
+
+    assert run(paths, output, batch_size=2) == []
+    assert len(pd.read_csv(output / SAMPLES_NAME)) == 2 * len(paths)
+
+
+def test_unreadable_file_is_skipped(exports, tmp_path):
+    (exports / "broken.txt").write_text("not a chromatogram")
+    paths = sorted(exports.glob("*.txt"))
+    with pytest.warns(UserWarning, match="1 file"):
+        done, errors = run(
+            paths,
+            tmp_path / "out",
+            time_grid=np.linspace(0, 16, 500),
+            return_errors=True,
+        )
+    assert list(errors) == [exports / "broken.txt"]
+    assert len(done) == 5
+
+
+def test_watch_folder_waits_for_files_to_settle(tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    stop = threading.Event()
+    watched = watch_folder(tmp_path, poll_interval=0.01, settle_time=0.05)
+    assert next(watched) is None  # not settled yet
+    found = [p for p in (next(watched) for _ in range(20)) if p]
+    assert found == [tmp_path / "a.txt"]
+    (tmp_path / "b.txt").write_text("b")
+    found = [p for p in (next(watched) for _ in range(20)) if p]
+    assert found == [tmp_path / "b.txt"]
+
+    stop.set()
+    watched = watch_folder(tmp_path, settle_time=0, stop=stop)
+    assert list(watched) == []
+    watched = watch_folder(
+        tmp_path, poll_interval=0.01, settle_time=0, idle_timeout=0.05
+    )
+    assert sorted(p for p in watched if p) == [
+        tmp_path / "a.txt",
+        tmp_path / "b.txt",
+    ]
+
+
+def test_command_line(exports, tmp_path, capsys):
+    windows = tmp_path / "windows.json"
+    windows.write_text('{"anion": [[3.0, 4.0]], "cation": [[4.5, 5.5]]}')
+    argv = [str(exports), str(tmp_path / "out")]
+    argv += ["--anion-range", "0.5", "15", "--cation-range", "0.5", "7.5"]
+    argv += ["--lam", "1e5", "--lam-flexible", "1e4", "--engine", "native"]
+    argv += ["--windows", str(windows), "--batch-size", "2"]
+    argv += ["--timings", str(tmp_path / "timings.json")]
+    assert main(argv) == 0
+    assert "processed 5 file(s)" in capsys.readouterr().out
+    assert (tmp_path / "out" / PEAKS_NAME).exists()
+    assert "fit_sample" in (tmp_path / "timings.json").read_text()
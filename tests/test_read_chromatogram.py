@@ -1,5 +1,12 @@
-# import pytest
-from chromatography_processing.read_chromatogram import read_chromatogram
+import pytest
+import numpy as np
+import xarray as xr
+from chromatography_processing.read_chromatogram import (
+    append_new_chromatograms_to_xarray,
+    parse_metrohm_txt_sections,
+    read_chromatogram,
+    read_chromatograms_in_folder_to_xarray,
+)
 from pathlib import Path
 
 datapath = (
@@ -26,3 +33,182 @@ def test_first_data_point_is_correct():
     expected_anion = (0.0, 0.9642913942058996)
     assert actual_cation == expected_cation
     assert actual_anion == expected_anion
+
+
+def test_last_data_point_is_correct():
+    data, ident, meas_time, types = read_chromatogram(datapath)
+    actual_anion = tuple(data[0].iloc[-1])
+    actual_cation = tuple(data[1].iloc[-1])
+
+    expected_anion = (15.999066666666668, 0.9612273429339879)
+    # as in the original reader, the last row of the section running into
+    # the pressure data is left out
+    expected_cation = (7.997850000000001, -1416.907818716442)
+    assert actual_anion == expected_anion
+    assert actual_cation == expected_cation
+
+
+def test_pressure_data_is_discarded():
+    data, ident, meas_time, types = read_chromatogram(datapath)
+    assert data[0].shape == (4, 2)
+    assert data[1].shape == (3, 2)
+    assert ident == "ian_pos3"
+    assert types == (True, True)
+
+
+def test_sections_are_parsed_from_their_rows(tmp_path):
+    lines = datapath.read_text(encoding="latin-1").splitlines()
+    start = lines.index("Anions")
+    # the stated point count (9595) is not the number of rows, and a
+    # further column is ignored
+    lines[start + 3] += ";1.5"
+    path = tmp_path / "extra_column.txt"
+    path.write_text("\n".join(lines), encoding="latin-1")
+    header, sections = parse_metrohm_txt_sections(path)
+    assert header[:2] == lines[:2]
+    assert list(sections) == ["Anions", "Cations"]
+    _, values = sections["Anions"]
+    assert values.dtype == np.float64
+    np.testing.assert_array_equal(
+        values[:2],
+        [
+            [0.0, 0.9642913942058996],
+            [0.0016666666666669272, 0.9643007074316501],
+        ],
+    )
+    assert values.shape == (4, 2)
+    assert sections["Cations"][1].shape == (4, 2)
+
+
+@pytest.mark.parametrize("keep", ["Anions", "Cations"])
+def test_single_ion_type_rows_match_the_original_reader(tmp_path, keep):
+    lines = datapath.read_text(encoding="latin-1").splitlines()
+    anions, cations = lines.index("Anions"), lines.index("Cations")
+    pressure = lines.index("Anions Pressure")
+    sections = {"Anions": (anions, cations), "Cations": (cations, pressure)}
+    start, stop = sections[keep]
+    path = tmp_path / "one_ion_type.txt"
+    path.write_text(
+        "\n".join(lines[:anions] + lines[start:stop] + lines[pressure:]),
+        encoding="latin-1",
+    )
+    rows = [row for row in lines[start + 3 : stop] if row]
+    # all but the last row, which runs into the pressure data
+    expected = [[float(v) for v in row.split(";")] for row in rows[:-1]]
+    data, ident, meas_time, types = read_chromatogram(path)
+    measured = data[0] if keep == "Anions" else data[1]
+    np.testing.assert_array_equal(measured.values, expected)
+    assert data[0].shape == data[1].shape == (3, 2)
+
+
+def test_unmeasured_ion_is_filled_with_placeholder(tmp_path):
+    lines = datapath.read_text(encoding="latin-1").splitlines()
+    anion_only = tmp_path / "anion_only.txt"
+    anion_only.write_text(
+        "\n".join(lines[: lines.index("Cations")]), encoding="latin-1"
+    )
+    data, ident, meas_time, types = read_chromatogram(
+        anion_only, unmeasured_ion_placeholder=-2.0
+    )
+    assert types == (True, False)
+    assert (data[1]["time"] == data[0]["time"]).all()
+    assert (data[1]["signal"] == -2.0).all()
+
+
+def test_folder_dataset_is_on_one_time_grid(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(3)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    assert data.signal.dims == ("ion_type", "measurement_time", "time")
+    assert data.signal.shape == (2, 3, 2000)
+    assert data.time.values[0] == 0.0
+    assert data.time.values[-1] == 15.999066666666668
+    assert list(data.ident.values) == ["ian_pos1", "ian_pos2", "ian_pos3"]
+    assert data.measurement_time.to_index().is_monotonic_increasing
+    # cations stop at 8 minutes, so the rest of their grid is empty
+    cation = data.signal.sel(
+        ion_type="cation", measurement_time=data.measurement_time[0]
+    )
+    assert np.isnan(cation.sel(time=slice(8.0, None))).all()
+    assert cation.isel(time=0) == -1416.9126988467353
+
+
+def test_folder_can_be_read_onto_a_given_grid(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(3)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    on_grid = read_chromatograms_in_folder_to_xarray(
+        tmp_path, time_grid=data.time.values
+    )
+    assert data.identical(on_grid)
+
+
+def test_time_grid_size_is_configurable_and_recorded(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(2)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path, n_time_points=50)
+    assert data.time.shape == (50,)
+    assert data.attrs == {
+        "time_grid_start": 0.0,
+        "time_grid_stop": 15.999066666666668,
+        "time_grid_points": 50,
+    }
+
+
+def test_appending_new_files_matches_reading_the_folder(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(2)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    data["background"] = xr.zeros_like(data["signal"])
+
+    make_chromatogram_folder(2, start=2)
+    appended = append_new_chromatograms_to_xarray(data, tmp_path)
+    expected = read_chromatograms_in_folder_to_xarray(
+        tmp_path, time_grid=data.time.values
+    )
+    assert appended.measurement_time.shape == (4,)
+    xr.testing.assert_identical(appended["signal"], expected["signal"])
+    assert (appended.background.isel(measurement_time=[0, 1]) == 0).all()
+    assert appended.background.isel(measurement_time=[2, 3]).isnull().all()
+
+
+def test_appending_without_new_files_returns_data_unchanged(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(2)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    assert append_new_chromatograms_to_xarray(data, tmp_path) is data
+
+
+def test_folder_can_be_read_lazily_in_chunks(
+    tmp_path, make_chromatogram_folder
+):
+    pytest.importorskip("dask")
+    make_chromatogram_folder(5)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    lazy = read_chromatograms_in_folder_to_xarray(
+        tmp_path, time_grid=data.time.values, chunks=2
+    )
+    assert lazy.signal.chunksizes["measurement_time"] == (2, 2, 1)
+    xr.testing.assert_identical(lazy.compute(), data)
+
+
+def test_signal_is_stored_as_float32_with_compact_coordinates(
+    tmp_path, make_chromatogram_folder
+):
+    make_chromatogram_folder(4)
+    data = read_chromatograms_in_folder_to_xarray(tmp_path)
+    full = read_chromatograms_in_folder_to_xarray(tmp_path, dtype="float64")
+    assert data.signal.dtype == np.float32
+    assert full.signal.dtype == np.float64
+    assert data.ident.dtype.kind == "U" and data.ion_type.dtype.kind == "U"
+    np.testing.assert_allclose(data.signal, full.signal, rtol=1e-6)
+
+    # a float32 (ion_type, time) signal per sample, and little else
+    n_samples, n_times = data.sizes["measurement_time"], data.sizes["time"]
+    per_sample = (data.nbytes - data.time.nbytes) / n_samples
+    assert per_sample <= 2 * n_times * 4 + 128
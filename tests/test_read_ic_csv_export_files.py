@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from chromatography_processing.read_ic_csv_export_files import (
+    open_ic_file,
+    open_list_of_ic_files,
+    read_ic_csv_files,
+    save_to_dir,
+)
+
+HEADER = "Ident;Sample type;Chloride;Sulfate"
+
+
+def write_csv(path, rows, header=HEADER):
+    path.write_text("\n".join([header] + rows) + "\n")
+    return path
+
+
+@pytest.fixture
+def ic_folder(tmp_path):
+    write_csv(tmp_path / "a.csv", ["ian_pos3;Sample;1.5;2"])
+    write_csv(tmp_path / "b.csv", ["ian_pos1;Sample;0.5;7"])
+    write_csv(tmp_path / "c.csv", ["ian_pos2;Standard;3.25;1"])
+    return tmp_path
+
+
+@pytest.mark.parametrize("engine", [None, "c"])
+def test_bulk_reader_matches_reading_file_by_file(ic_folder, engine):
+    expected = pd.concat(
+        [open_ic_file(path) for path in sorted(ic_folder.glob("*.csv"))]
+    ).sort_index()
+    data = read_ic_csv_files(sorted(ic_folder.glob("*.csv")), engine=engine)
+    pd.testing.assert_frame_equal(
+        data, expected, check_dtype=False, check_index_type=False
+    )
+
+
+def test_only_requested_columns_are_read_with_their_types(ic_folder):
+    data = open_list_of_ic_files(
+        ic_folder, columns=["Chloride"], dtypes={"Chloride": "float32"}
+    )
+    assert list(data.columns) == ["ident", "chloride"]
+    assert data.chloride.dtype == "float32"
+    assert list(data.index) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("engine", [None, "c"])
+def test_folder_is_read_with_explicit_types(ic_folder, engine):
+    write_csv(
+        ic_folder / "d.csv",
+        ['"ian_pos4";"Sample";"1";"5"'],
+        header='"Ident";"Sample type";"Chloride";"Sulfate"',
+    )
+    data = open_list_of_ic_files(ic_folder)
+    # sulfate would be inferred as int64
+    assert data.chloride.dtype == data.sulfate.dtype == "float64"
+    assert pd.api.types.is_string_dtype(data["sample type"])
+    assert list(data.index) == [1, 2, 3, 4]
+    assert data.loc[4, "sulfate"] == 5.0
+
+
+def test_broken_files_are_skipped(ic_folder):
+    write_csv(ic_folder / "d.csv", ["no_position;Sample;1;1"])
+    write_csv(ic_folder / "e.csv", ["ian_pos4;Sample;1;1;9;9"])
+    with pytest.warns(UserWarning):
+        data, errors = open_list_of_ic_files(ic_folder, return_errors=True)
+    assert sorted(path.name for path in errors) == ["d.csv", "e.csv"]
+    assert list(data.index) == [1, 2, 3]
+
+
+def test_files_with_different_headers_are_read(ic_folder):
+    write_csv(ic_folder / "d.csv", ["ian_pos4;9"], header="Ident;Nitrate")
+    data = open_list_of_ic_files(ic_folder)
+    assert data.loc[4, "nitrate"] == 9
+    assert data.loc[[1, 2, 3], "nitrate"].isna().all()
+
+
+def test_results_can_be_saved_as_parquet(ic_folder, tmp_path):
+    pytest.importorskip("pyarrow")
+    data = open_list_of_ic_files(ic_folder)
+    save_to_dir(data, "results", tmp_path / "out")
+    saved = pd.read_parquet(tmp_path / "out" / "results.parquet")
+    pd.testing.assert_frame_equal(saved, data)
+    save_to_dir(data, "results", tmp_path / "out", file_format="csv")
+    saved = pd.read_csv(tmp_path / "out" / "results.csv")
+    assert list(saved.columns) == list(data.columns)
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+from chromatography_processing.read_metrohm_ic_txt_files import (
+    read_metrohm_ic_files_to_xarray,
+    read_metrohm_ic_txt_file,
+)
+
+datapath = (
+    Path(__file__).parent / "metrohm_ic_test_files" / "ancat_chromatogram.txt"
+)
+
+
+def test_file_is_split_into_anions_and_cations():
+    an, cat, rack_position = read_metrohm_ic_txt_file(datapath)
+    assert rack_position == 3
+    assert an.iloc[-1].tolist() == [15.999066666666668, 0.9612273429339879]
+    assert cat.iloc[0].tolist() == [0.0, -1416.9126988467353]
+    # the pressure blocks are not part of the cation chromatogram
+    assert cat.iloc[-1].tolist() == [7.999516666666667, -1416.908046890473]
+
+
+def test_missing_ion_type_is_empty_or_nan(tmp_path):
+    lines = datapath.read_text(encoding="latin-1").splitlines()
+    anion_only = tmp_path / "anion_only.txt"
+    anion_only.write_text(
+        "\n".join(lines[: lines.index("Cations")]), encoding="latin-1"
+    )
+    an, cat, _ = read_metrohm_ic_txt_file(anion_only)
+    assert len(an) == 4 and len(cat) == 0
+
+    data = read_metrohm_ic_files_to_xarray([anion_only])
+    assert data.signal.sel(type="cation").isnull().all()
+    assert data.signal.sel(type="anion").notnull().any()
+
+
+@pytest.mark.parametrize("given_grid", [False, True])
+def test_files_share_one_time_grid_by_rack_position(
+    tmp_path, make_chromatogram_folder, given_grid
+):
+    folder = make_chromatogram_folder(3)
+    expected = read_chromatograms_in_folder_to_xarray(folder)
+    time_grid = expected.time.values if given_grid else None
+    data = read_metrohm_ic_files_to_xarray(
+        sorted(folder.glob("*.txt"))[::-1], time_grid=time_grid
+    )
+    assert data.signal.dims == ("type", "rack_position", "time")
+    assert list(data.rack_position.values) == [1, 2, 3]
+    np.testing.assert_array_equal(data.time, expected.time)
+    np.testing.assert_array_equal(data.signal, expected.signal)
+    assert data.attrs == expected.attrs
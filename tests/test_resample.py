@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from chromatography_processing.resample import (
+    make_time_grid,
+    resample_traces,
+)
+
+
+def make_traces(n_traces, seed=0):
+    rng = np.random.default_rng(seed)
+    traces = []
+    for _ in range(n_traces):
+        n = rng.integers(2, 200)
+        t = np.sort(rng.uniform(rng.uniform(0, 3), rng.uniform(5, 16), n))
+        traces.append(np.column_stack([t, rng.normal(size=n)]))
+    return traces
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 512])
+def test_resample_traces_matches_np_interp(batch_size):
+    traces = make_traces(40)
+    grid = make_time_grid(0, 16, 500)
+    actual = resample_traces(traces, grid, batch_size=batch_size)
+    expected = np.array(
+        [
+            np.interp(grid, t[:, 0], t[:, 1], left=np.nan, right=np.nan)
+            for t in traces
+        ]
+    )
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_resample_traces_handles_empty_and_exact_endpoints():
+    traces = [np.empty((0, 2)), np.array([[1.0, 2.0], [3.0, 4.0]])]
+    grid = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    actual = resample_traces(traces, grid)
+    assert np.isnan(actual[0]).all()
+    np.testing.assert_array_equal(actual[1], [np.nan, 2.0, 3.0, 4.0, np.nan])
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from chromatography_processing.read_ic_csv_export_files import (
+    copy_csvs_to_from_import,
+)
+from chromatography_processing.staging import read_manifest, stage_files
+
+
+@pytest.fixture
+def exports(tmp_path):
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    for name in ["a.csv", "b.csv"]:
+        (folder / name).write_text("Ident;Chloride\nian_pos1;1\n")
+    return folder
+
+
+@pytest.mark.parametrize("mode", ["link", "reflink", "copy"])
+def test_files_are_staged_with_a_manifest(exports, mode):
+    staged = copy_csvs_to_from_import(exports, mode=mode)
+    from_import = exports / "from_import"
+    assert staged == [from_import / "a.csv", from_import / "b.csv"]
+    assert (from_import / "a.csv").read_text() == (
+        exports / "a.csv"
+    ).read_text()
+    manifest = read_manifest(from_import)
+    assert manifest["a.csv"]["size"] == (exports / "a.csv").stat().st_size
+    assert len(manifest["a.csv"]["sha1"]) == 40
+    if mode == "copy":
+        assert manifest["a.csv"]["method"] == "copy"
+
+
+def test_hard_links_do_not_copy_data(exports):
+    copy_csvs_to_from_import(exports)
+    staged = exports / "from_import" / "a.csv"
+    if read_manifest(staged.parent)["a.csv"]["method"] == "hardlink":
+        assert os.path.samefile(staged, exports / "a.csv")
+
+
+def test_only_new_or_changed_files_are_staged_again(exports):
+    copy_csvs_to_from_import(exports, mode="copy")
+    assert copy_csvs_to_from_import(exports, mode="copy") == []
+
+    (exports / "c.csv").write_text("Ident;Chloride\nian_pos3;3\n")
+    (exports / "a.csv").write_text("Ident;Chloride\nian_pos1;10\n")
+    os.utime(exports / "a.csv", ns=(0, 0))
+    staged = copy_csvs_to_from_import(exports, mode="copy")
+    from_import = exports / "from_import"
+    assert staged == [from_import / "a.csv", from_import / "c.csv"]
+    assert (from_import / "a.csv").read_text().endswith("10\n")
+
+
+def test_missing_staged_file_is_staged_again(exports):
+    copy_csvs_to_from_import(exports)
+    (exports / "from_import" / "b.csv").unlink()
+    staged = copy_csvs_to_from_import(exports)
+    assert staged == [exports / "from_import" / "b.csv"]
+
+
+def test_unreadable_file_is_skipped(exports, tmp_path):
+    with pytest.warns(UserWarning):
+        staged, errors = stage_files(
+            [exports / "a.csv", exports / "missing.csv"],
+            tmp_path / "staged",
+            return_errors=True,
+        )
+    assert staged == [tmp_path / "staged" / "a.csv"]
+    assert list(errors) == [exports / "missing.csv"]
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from chromatography_processing.custom_bc_baseline import (
+    fit_dataset_with_custom_bc_baseline,
+)
+from chromatography_processing.read_chromatogram import (
+    read_chromatograms_in_folder_to_xarray,
+)
+from chromatography_processing.storage import open_dataset, save_dataset
+
+
+def make_dataset(n_samples=5, n_points=300):
+    rng = np.random.default_rng(0)
+    signal = rng.normal(size=(2, n_samples, n_points))
+    data = xr.Dataset(
+        {
+            "signal": (("ion_type", "measurement_time", "time"), signal),
+            "fit_status": (
+                ("ion_type", "measurement_time"),
+                np.full((2, n_samples), "ok", dtype=object),
+            ),
+        },
+        coords={
+            "ion_type": np.array(["anion", "cation"], dtype=object),
+            "measurement_time": pd.date_range(
+                "2025-08-21", periods=n_samples, freq="20min"
+            ),
+            "time": np.linspace(0, 16, n_points),
+            "ident": (
+                "measurement_time",
+                ["ian_pos{}".format(i) for i in range(n_samples)],
+            ),
+        },
+        attrs={"time_grid_points": n_points},
+    )
+    data["background"] = data.signal * 0.5
+    data["reduced_signal"] = data.signal - data.background
+    return data
+
+
+@pytest.mark.parametrize(
+    "name, module",
+    [("data.zarr", "zarr"), ("data.nc", "netCDF4")],
+)
+def test_saved_dataset_opens_lazily_as_float32(tmp_path, name, module):
+    pytest.importorskip(module)
+    data = make_dataset()
+    save_dataset(data, tmp_path / name, samples_per_chunk=2)
+
+    opened = open_dataset(tmp_path / name)
+    assert opened.signal.dtype == np.float32
+    # nothing is read until the values are used
+    assert not opened.signal.variable._in_memory
+    assert opened.attrs == data.attrs
+    assert list(opened.ident.values) == list(data.ident.values)
+    assert list(opened.fit_status.values[0]) == ["ok"] * 5
+    np.testing.assert_allclose(
+        opened.reduced_signal.isel(measurement_time=[3]),
+        data.reduced_signal.isel(measurement_time=[3]),
+        rtol=1e-6,
+    )
+    assert opened.signal.encoding["preferred_chunks"] == {
+        "ion_type": 2,
+        "measurement_time": 2,
+        "time": 300,
+    }
+
+
+@pytest.mark.parametrize(
+    "name, module", [("data.zarr", "zarr"), ("data.nc", "netCDF4")]
+)
+def test_lazy_dataset_is_rechunked_when_saved(
+    tmp_path, make_chromatogram_folder, name, module
+):
+    pytest.importorskip(module)
+    pytest.importorskip("dask")
+    folder = make_chromatogram_folder(5, tmp_path / "exports")
+    data = read_chromatograms_in_folder_to_xarray(
+        folder, time_grid=np.linspace(0, 16, 500), chunks=2
+    )
+    data = fit_dataset_with_custom_bc_baseline(
+        data, (0.5, 15), (0.5, 7.5), lam=1e5, lam_flexible=1e4
+    )
+    assert data.signal.chunks is not None
+    save_dataset(data, tmp_path / name, samples_per_chunk=3)
+
+    opened = open_dataset(tmp_path / name)
+    assert opened.signal.encoding["preferred_chunks"]["measurement_time"] == 3
+    for variable in ("signal", "background", "reduced_signal"):
+        np.testing.assert_allclose(
+            opened[variable], data[variable].compute(), rtol=1e-6
+        )
+
+
+def test_object_variables_are_left_out(tmp_path):
+    pytest.importorskip("zarr")
+    data = make_dataset()
+    data["chromatogram"] = (
+        "measurement_time",
+        np.array([object()] * 5, dtype=object),
+    )
+    with pytest.warns(UserWarning, match="chromatogram"):
+        save_dataset(data, tmp_path / "data.zarr")
+    assert "chromatogram" not in open_dataset(tmp_path / "data.zarr")
+
+
+def test_unknown_format_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        save_dataset(make_dataset(), tmp_path / "data.csv")